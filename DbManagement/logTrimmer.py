@@ -2,6 +2,7 @@
 
 import settings
 import ScrapePlugins.DbBase
+import schemaUpdater.nameChangeTracker
 import time
 
 
@@ -30,5 +31,6 @@ class LogTrimmer(ScrapePlugins.DbBase.DbBase):
 	def _doClean(self, cur):
 		thresholdTime = time.time() - settings.maxLogAge
 		cur.execute('''DELETE FROM logTable WHERE time<%s;''', (thresholdTime, ))
+		schemaUpdater.nameChangeTracker.trimNameChanges(cur, thresholdTime)
 
 
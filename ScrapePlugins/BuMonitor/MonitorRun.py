@@ -35,7 +35,7 @@ class BuWatchMonitor(ScrapePlugins.MonitorDbBase.MonitorDbBase):
 
 	dbName = settings.DATABASE_DB_NAME
 
-	wgH = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wgH = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 
 	# -----------------------------------------------------------------------------------
@@ -69,6 +69,8 @@ class BuWatchMonitor(ScrapePlugins.MonitorDbBase.MonitorDbBase):
 
 
 	def go(self):
+		# Anything fetched but not stored by an earlier (failed) run has to be fetched again.
+		self.wgH.discardCache()
 		self.checkLogin()
 
 		self.scanRecentlyUpdated()
@@ -83,6 +85,8 @@ class BuWatchMonitor(ScrapePlugins.MonitorDbBase.MonitorDbBase):
 				self.log.info( "Breaking due to exit flag being set")
 				break
 
+		self.wgH.logCacheStats()
+
 
 	def getListNames(self):
 		self.checkLogin()
@@ -189,7 +193,11 @@ class BuWatchMonitor(ScrapePlugins.MonitorDbBase.MonitorDbBase):
 
 	def updateUserListNamed(self, listName, listURL):
 
-		pageCtnt = self.wgH.getpage(listURL)
+		pageCtnt = self.wgH.getpageIfChanged(listURL)
+		if pageCtnt is None:
+			self.log.info("List '%s' unchanged since last scan.", listName)
+			return
+
 		soup = bs4.BeautifulSoup(pageCtnt, "lxml")
 		itemTable = soup.find("table", id="list_table")
 
@@ -207,6 +215,7 @@ class BuWatchMonitor(ScrapePlugins.MonitorDbBase.MonitorDbBase):
 		if itemCount != listTotalNo:
 			self.log.error("Invalid list reported length! Items from page: %d, found items %d", listTotalNo, itemCount)
 		self.conn.commit()
+		self.wgH.commitCache([listURL])
 		self.log.info("Properly processed all items in list!")
 
 
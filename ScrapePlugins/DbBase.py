@@ -1,8 +1,7 @@
 
 import traceback
-import psycopg2
 import abc
-import settings
+import dbPool
 import logging
 from contextlib import contextmanager
 
@@ -26,21 +25,12 @@ class DbBase(dbb.TransactionMixin, metaclass=abc.ABCMeta):
 
 	def openDB(self):
 		self.log.info("Opening DB...",)
-
-		# First try local socket connection, fall back to a IP-based connection.
-		# That way, if the server is local, we get the better performance of a local socket.
-		try:
-			self.conn = psycopg2.connect(dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		except psycopg2.OperationalError:
-			self.conn = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-
-		# self.conn = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		# self.conn.autocommit = True
+		self.conn = dbPool.pool.getconn(persistent=True)
 		self.log.info("DB opened.")
 
 	def closeDB(self):
 		self.log.info("Closing DB...",)
-		self.conn.close()
+		dbPool.pool.putconn(self.conn)
 		self.log.info("DB Closed")
 
 	def get_cursor(self):
@@ -17,7 +17,6 @@ import time
 
 import urllib.parse
 import html.parser
-import zipfile
 import traceback
 import bs4
 import re
@@ -38,10 +37,14 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 	dbName = settings.DATABASE_DB_NAME
 	tableName = "MangaItems"
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", keepAlive=True)
 
 	retreivalThreads = 3
 
+	pageFetchThreads = 3
+	pageFetchRate    = 4
+	pageFetchBurst   = 4
+
 	urlBase = "http://dynasty-scans.com/"
 
 	def getImage(self, imageUrl, referrer):
@@ -143,27 +146,20 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-			for imgUrl, referrerUrl in imageUrls.items():
-				imageName, imageContent = self.getImage(imgUrl, referrerUrl)
-				images.append([imageName, imageContent])
-
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, imageUrls.items(), self.getImage):
 					self.log.info( "Breaking due to exit flag being set")
 					self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True)
@@ -6,8 +6,6 @@ import nameTools as nt
 
 
 import urllib.parse
-import zipfile
-import runStatus
 import traceback
 import bs4
 import re
@@ -29,6 +27,10 @@ class FoolContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 
 	retreivalThreads = 1
 
+	pageFetchThreads = 2
+	pageFetchRate    = 2
+	pageFetchBurst   = 4
+
 	def getImage(self, imageUrl, referrer):
 
 		content, handle = self.wg.getpage(imageUrl, returnMultiple=True, addlHeaders={'Referer': referrer})
@@ -141,27 +143,24 @@ class FoolContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-			for imageName, imgUrl, referrerUrl in imageUrls:
+			def getNamedImage(imageName, imgUrl, referrerUrl):
 				dummy_imageName, imageContent = self.getImage(imgUrl, referrerUrl)
-				images.append([imageName, imageContent])
+				return imageName, imageContent
 
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, imageUrls, getNamedImage, urlIndex=1):
 					self.log.info( "Breaking due to exit flag being set")
 					self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			filePath, fileName = os.path.split(fqFName)
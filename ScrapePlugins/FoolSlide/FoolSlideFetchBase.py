@@ -46,10 +46,16 @@ class FoolFeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	def getItemPages(self, url):
 		self.log.info("Should get item for '%s'", url)
-		page = self.wg.getpage(url)
+		page = self.wg.getpageIfChanged(url)
+
+		# Nothing new on the series page since we last looked at it.
+		if page is None:
+			return []
 
 		if "This series contains mature contents and is meant to be viewed by an adult audience." in page:
 			self.log.info("Adult check page. Confirming...")
+			# The check page is the same every time, so it can't be used to tell if the series changed.
+			self.wg.discardCache([url])
 			page = self.wg.getpage(url, postData={"adult": "true"})
 
 
@@ -142,6 +148,8 @@ class FoolFeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	def go(self):
 
+		# Anything fetched but not stored by an earlier (failed) run has to be fetched again.
+		self.wg.discardCache()
 		self.resetStuckItems()
 		self.log.info("Getting feed items")
 
@@ -149,6 +157,8 @@ class FoolFeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 		self.log.info("Processing feed Items")
 
 		self.processLinksIntoDB(feedItems)
+		self.wg.commitCache()
+		self.wg.logCacheStats()
 		self.log.info("Complete")
 
 
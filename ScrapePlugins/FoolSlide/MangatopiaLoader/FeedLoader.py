@@ -17,7 +17,7 @@ class FeedLoader(ScrapePlugins.FoolSlide.FoolSlideFetchBase.FoolFeedLoader):
 	tableName = "MangaItems"
 	groupName = "Mangatopia"
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 
 	urlBase = "http://mangatopia.net/slide/"
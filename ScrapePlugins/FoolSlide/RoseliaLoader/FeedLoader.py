@@ -14,7 +14,7 @@ class FeedLoader(ScrapePlugins.FoolSlide.FoolSlideFetchBase.FoolFeedLoader):
 	tableKey = "rs"
 	dbName = settings.DATABASE_DB_NAME
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 	tableName = "MangaItems"
 
@@ -13,7 +13,7 @@ class FeedLoader(ScrapePlugins.FoolSlide.FoolSlideFetchBase.FoolFeedLoader):
 	tableKey = "s2"
 	dbName = settings.DATABASE_DB_NAME
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 	tableName = "MangaItems"
 
@@ -16,7 +16,7 @@ class FeedLoader(ScrapePlugins.FoolSlide.FoolSlideFetchBase.FoolFeedLoader):
 	tableName = "MangaItems"
 
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 	urlBase = "http://reader.sensescans.com/"
 	feedUrl = urlBase+"reader/list/{num}/"
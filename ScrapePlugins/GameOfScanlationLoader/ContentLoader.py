@@ -1,7 +1,6 @@
 
 
 import logSetup
-import runStatus
 
 import bs4
 import nameTools as nt
@@ -13,7 +12,6 @@ import settings
 import traceback
 import urllib.parse
 import webFunctions
-import zipfile
 
 class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 
@@ -108,27 +106,24 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-			for imgNum, imgUrl in imageUrls:
+			def getNumberedImage(imgNum, imgUrl):
 				imageName, imageContent = self.getImage(imgUrl, referrer=sourceUrl)
-				images.append([imgNum, imageName, imageContent])
+				return "{:03} - {}".format(imgNum, imageName), imageContent
 
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, imageUrls, getNumberedImage, urlIndex=1):
 					self.log.info( "Breaking due to exit flag being set")
 					self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imgNum, imageName, imageContent in images:
-				arch.writestr("{:03} - {}".format(imgNum, imageName), imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True)
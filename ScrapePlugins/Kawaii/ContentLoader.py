@@ -8,8 +8,6 @@ import nameTools as nt
 
 
 import urllib.parse
-import zipfile
-import runStatus
 import traceback
 import bs4
 import ScrapePlugins.RetreivalBase
@@ -132,27 +130,20 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-			for imgUrl, referrerUrl in imageUrls.items():
-				imageName, imageContent = self.getImage(imgUrl, referrerUrl)
-				images.append([imageName, imageContent])
-
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, imageUrls.items(), self.getImage):
 					self.log.info( "Breaking due to exit flag being set")
 					self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True)
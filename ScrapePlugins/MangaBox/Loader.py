@@ -1,6 +1,5 @@
 
 import time
-import zipfile
 import settings
 import traceback
 import json
@@ -15,6 +14,7 @@ if __name__ == "__main__":
 import webFunctions
 import processDownload
 import ScrapePlugins.RetreivalDbBase
+import ScrapePlugins.RetreivalBase
 import nameTools as nt
 
 app_user_agent = [
@@ -690,18 +690,6 @@ class Loader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 		image_links = self.getFileInfo(file_data)
 
-		images = []
-		for imagen, imageurl in image_links:
-			imdat = self.get_image(imageurl, file_data['xor_key'])
-			images.append((imagen, imdat))
-
-			# filen = nt.makeFilenameSafe(file_data['title'] + " - " + imagen)
-			# with open(filen, "wb") as fp:
-			# 	fp.write(imdat)
-
-
-
-
 		fileN = '{series} - c{chapNo:03.0f} [MangaBox].zip'.format(series=file_data['title'], chapNo=file_data['chapter'])
 		fileN = nt.makeFilenameSafe(fileN)
 
@@ -713,10 +701,17 @@ class Loader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 			self.updateDbEntry(file_data["baseUrl"], flags="haddir")
 			self.conn.commit()
 
-		arch = zipfile.ZipFile(wholePath, "w")
-		for imageName, imageContent in images:
-			arch.writestr(imageName, imageContent)
-		arch.close()
+		def getNamedImage(imagen, imageurl):
+			return imagen, self.get_image(imageurl, file_data['xor_key'])
+
+		# Images are streamed into the archive as they're retreived.
+		with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(wholePath) as arch:
+			if not arch.fetchPages(image_links, getNamedImage):
+				self.log.info( "Breaking due to exit flag being set")
+				self.updateDbEntry(file_data["baseUrl"], dlState=0)
+				self.conn.commit()
+				return
+			arch.commit()
 
 		self.log.info("Successfully Saved to path: %s", wholePath)
 
@@ -17,7 +17,6 @@ import time
 
 import urllib.parse
 import html.parser
-import zipfile
 import traceback
 import bs4
 import re
@@ -60,18 +59,17 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 	def proceduralGetImages(self, link):
 		baseUrl = link
 
-		images = []
+		# Each page only links to the next, so this has to walk the chapter serially.
+		# Yields (imageName, imageContent) tuples as they're retreived.
 		while baseUrl in link:
 			page = self.wg.getSoup(link)
 			container = page.find('section', class_='read_img')
 
 			imgUrl = container.img['src']
 
-			images.append(self.getImage(imgUrl, link))
+			yield self.getImage(imgUrl, link)
 			link = container.a['href']
 
-		return images
-
 
 	def getLink(self, link):
 
@@ -112,19 +110,23 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = self.proceduralGetImages(sourceUrl)
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				for imageName, imageContent in self.proceduralGetImages(sourceUrl):
+					arch.addPage(imageName, imageContent)
+
+					if not runStatus.run:
+						self.log.info( "Breaking due to exit flag being set")
+						self.updateDbEntry(sourceUrl, dlState=0)
+						return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True, includePHash=True)
@@ -25,7 +25,7 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 	pluginName = "MangaHere Link Retreiver"
 	tableKey = "mh"
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 	tableName = "MangaItems"
 
@@ -46,7 +46,11 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 	def getUpdatedSeries(self, url):
 		ret = set()
 
-		soup = self.wg.getSoup(url)
+		soup = self.wg.getSoupIfChanged(url)
+
+		# Update listing is the same as last time, so there's nothing new.
+		if soup is None:
+			return ret
 
 		if soup.find("div", class_='manga_updates'):
 			mainDiv = soup.find("div", class_='manga_updates')
@@ -130,7 +134,9 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	def getChapterLinkFromSeriesPage(self, seriesUrl):
 		ret = []
-		soup = self.wg.getSoup(seriesUrl)
+		soup = self.wg.getSoupIfChanged(seriesUrl)
+		if soup is None:
+			return ret
 		soup = self.checkAdult(soup)
 
 		seriesInfo = self.getSeriesInfoFromSoup(soup)
@@ -164,6 +170,8 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	def go(self):
 
+		# Anything fetched but not stored by an earlier (failed) run has to be fetched again.
+		self.wg.discardCache()
 		self.resetStuckItems()
 		self.log.info("Getting feed items")
 
@@ -171,6 +179,8 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 		self.log.info("Processing feed Items")
 
 		self.processLinksIntoDB(feedItems)
+		self.wg.commitCache()
+		self.wg.logCacheStats()
 		self.log.info("Complete")
 
 
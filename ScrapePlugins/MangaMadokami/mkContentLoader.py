@@ -73,19 +73,20 @@ class MkContentLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 
 
-	def getLinkFile(self, fileUrl):
+	def getLinkFile(self, fileUrl, dirPath):
 		scheme, netloc, path, params, query, fragment = urllib.parse.urlparse(fileUrl)
 		path = urllib.parse.quote(path)
 		fileUrl = urllib.parse.urlunparse((scheme, netloc, path, params, query, fragment))
 
-		pgctnt, pghandle = self.wg.getpage(fileUrl, returnMultiple = True, addlHeaders={'Referer': "https://manga.madokami.com"})
-		pageUrl = pghandle.geturl()
+		# Streamed to a temporary file in `dirPath`, since some of these are huge.
+		dlInfo = self.wg.getFileToPath(fileUrl, dirPath, addlHeaders={'Referer': "https://manga.madokami.com"})
+		pageUrl = dlInfo['url']
 		hName = urllib.parse.urlparse(pageUrl)[2].split("/")[-1]
 		self.log.info( "HName: %s", hName, )
-		self.log.info( "Size = %s", len(pgctnt))
+		self.log.info( "Size = %s", dlInfo['size'])
 
 
-		return pgctnt, hName
+		return dlInfo['path'], hName
 
 
 	def getLink(self, link):
@@ -134,7 +135,7 @@ class MkContentLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 
 		try:
-			content, hName = self.getLinkFile(sourceUrl)
+			tmpPath, hName = self.getLinkFile(sourceUrl, link["targetDir"])
 		except:
 			self.log.error("Unrecoverable error retreiving content %s", link)
 			self.log.error("Traceback: %s", traceback.format_exc())
@@ -176,9 +177,8 @@ class MkContentLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 					wholePath = os.path.join(filePath, fileName)
 					self.log.info("Complete filepath: %s", wholePath)
 
-					#Write all downloaded files to the archive.
-					with open(wholePath, "wb") as fp:
-						fp.write(content)
+					#Move the downloaded file into place.
+					os.replace(tmpPath, wholePath)
 					self.log.info("Successfully Saved to path: %s", wholePath)
 					break
 				except IOError:
@@ -194,6 +194,9 @@ class MkContentLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 			self.log.error("Failure trying to retreive content from source %s", sourceUrl)
 			self.updateDbEntry(sourceUrl, dlState=-4, downloadPath=filePath, fileName=fileName)
 			return
+		finally:
+			if os.path.exists(tmpPath):
+				os.unlink(tmpPath)
 		#self.log.info( filePath)
 
 		ext = os.path.splitext(fileName)[-1]
@@ -6,9 +6,10 @@ import threading
 import abc
 import traceback
 import time
-import settings
+import dbPool
 import nameTools as nt
 import ScrapePlugins.DbBase
+import schemaUpdater.nameChangeTracker
 
 class MonitorDbBase(ScrapePlugins.DbBase.DbBase):
 	'''
@@ -132,14 +133,12 @@ class MonitorDbBase(ScrapePlugins.DbBase.DbBase):
 		elif name == "conn":
 			if threadName not in self.dbConnections:
 
-				# First try local socket connection, fall back to a IP-based connection.
-				# That way, if the server is local, we get the better performance of a local socket.
-				try:
-					self.dbConnections[threadName] = psycopg2.connect(dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-				except psycopg2.OperationalError:
-					self.dbConnections[threadName] = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+				# Hand back any handles belonging to threads that have since exited
+				# before grabbing a new one, so short-lived worker threads don't slowly
+				# drain the pool.
+				self.releaseDeadThreadConnections()
+				self.dbConnections[threadName] = dbPool.pool.getconn(persistent=True)
 
-				# self.dbConnections[threadName].autocommit = True
 			return self.dbConnections[threadName]
 
 
@@ -147,6 +146,26 @@ class MonitorDbBase(ScrapePlugins.DbBase.DbBase):
 			return object.__getattribute__(self, name)
 
 
+	# Deferred to special hook in __getattribute__ that provides separate
+	# db interfaces to each thread.
+	def openDB(self):
+		pass
+
+
+	# Return all the per-thread handles to the connection pool.
+	def closeDB(self):
+		self.log.info("Closing DB...",)
+		for threadName in list(self.dbConnections.keys()):
+			dbPool.pool.putconn(self.dbConnections.pop(threadName))
+		self.log.info("DB Closed")
+
+	def releaseDeadThreadConnections(self):
+		live = set([thread.name for thread in threading.enumerate()])
+		for threadName in list(self.dbConnections.keys()):
+			if threadName not in live:
+				dbPool.pool.putconn(self.dbConnections.pop(threadName))
+
+
 	# ---------------------------------------------------------------------------------------------------------------------------------------------------------
 	# DB Tools
 	# ---------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -629,6 +648,10 @@ class MonitorDbBase(ScrapePlugins.DbBase.DbBase):
 
 
 		self.conn.commit()
+
+		# The name tables may not have existed when the schema was updated, so
+		# make sure the nameTools change-tracking hooks are in place.
+		schemaUpdater.nameChangeTracker.setupNameChangeTracking(self.conn)
 		self.log.info("Retreived page database created")
 
 	@abc.abstractmethod
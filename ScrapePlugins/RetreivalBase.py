@@ -4,10 +4,163 @@ import ScrapePlugins.DbBase
 import abc
 import runStatus
 import traceback
+import os
 import os.path
+import zipfile
+import threading
+import collections
+import urllib.parse
 from concurrent.futures import ThreadPoolExecutor
 import ScrapePlugins.RetreivalDbBase
 
+
+class TokenBucket():
+	'''
+	Thread-safe token-bucket rate limiter. Allows bursts of up to `burst`
+	requests, refilling at `rate` requests per second.
+	'''
+	def __init__(self, rate, burst=1):
+		self.rate   = rate
+		self.burst  = max(burst, 1)
+		self.tokens = self.burst
+		self.last   = time.monotonic()
+		self.lock   = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+				self.last = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
+
+# Per-host buckets, shared by every plugin in the process, so two plugins pulling
+# from the same CDN don't get to hammer it at twice the rate.
+hostBuckets = {}
+hostBucketLock = threading.Lock()
+
+def getHostBucket(url, rate, burst=1):
+	host = urllib.parse.urlsplit(url).netloc.lower()
+	with hostBucketLock:
+		if host not in hostBuckets:
+			hostBuckets[host] = TokenBucket(rate, burst)
+		bucket = hostBuckets[host]
+		# If more then one plugin uses the host, the most conservative limits win.
+		bucket.rate  = min(bucket.rate, rate)
+		bucket.burst = min(bucket.burst, max(burst, 1))
+	return bucket
+
+def waitForHost(url, rate, burst=1):
+	'''
+	Block until a request to the host of `url` is allowed under a
+	limit of `rate` requests/second (with bursts of up to `burst`).
+	'''
+	getHostBucket(url, rate, burst).acquire()
+
+
+class ChapterArchiveWriter():
+	'''
+	Writes a chapter's pages into a zip archive as they're retreived, rather then
+	buffering the whole chapter in memory and dumping it out at the end.
+
+	Pages go into a hidden temporary file in the destination directory, which is
+	only renamed onto `fqFName` once `commit()` is called. If the writer is closed
+	without committing (or the with-block raises), the partial file is deleted, so
+	nothing half-written ever shows up under the real name.
+
+	Usage:
+		with ChapterArchiveWriter(fqFName) as arch:
+			arch.addPage(imageName, imageContent)
+			...
+			arch.commit()
+	'''
+
+	# Number of pages that can be downloaded-but-not-yet-written per fetch worker
+	# in `fetchPages()`. Bounds the memory used when pages complete out of order.
+	bufferPerWorker = 2
+
+	def __init__(self, fqFName):
+		self.fqFName = fqFName
+		dirPath, fileName = os.path.split(fqFName)
+		self.tmpName = os.path.join(dirPath, ".%s.%s-%s.part" % (fileName, os.getpid(), threading.get_ident()))
+		self.arch = zipfile.ZipFile(self.tmpName, "w")
+		self.pages = 0
+		self.done  = False
+
+	def addPage(self, imageName, imageContent):
+		self.arch.writestr(imageName, imageContent)
+		self.pages += 1
+
+	def fetchPages(self, jobs, fetchFunc, workers=1, throttle=None):
+		'''
+		Call `fetchFunc(*job)` for each item in `jobs`, and write the returned
+		`(imageName, imageContent)` tuples to the archive, in the order of `jobs`.
+
+		With more then one worker, pages are fetched concurrently, but at most
+		`workers * bufferPerWorker` pages are ever held in memory at once.
+
+		If `throttle` is passed, `throttle(*job)` is called (in the worker thread)
+		before each fetch, and can block to rate-limit requests.
+
+		Returns False if the fetch was interrupted by the exit flag being set,
+		True otherwise. Exceptions from `fetchFunc` propagate to the caller.
+		'''
+		if throttle:
+			unthrottledFetch = fetchFunc
+			def fetchFunc(*job):
+				throttle(*job)
+				return unthrottledFetch(*job)
+
+		if workers <= 1:
+			for job in jobs:
+				self.addPage(*fetchFunc(*job))
+				if not runStatus.run:
+					return False
+			return True
+
+		window = collections.deque()
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			try:
+				for job in jobs:
+					window.append(executor.submit(fetchFunc, *job))
+					if len(window) >= workers * self.bufferPerWorker:
+						self.addPage(*window.popleft().result())
+					if not runStatus.run:
+						return False
+
+				while window:
+					self.addPage(*window.popleft().result())
+					if not runStatus.run:
+						return False
+			finally:
+				# Don't bother starting anything still queued if we're bailing out.
+				for future in window:
+					future.cancel()
+		return True
+
+	def commit(self):
+		self.arch.close()
+		os.replace(self.tmpName, self.fqFName)
+		self.done = True
+
+	def abort(self):
+		if self.done:
+			return
+		self.arch.close()
+		if os.path.exists(self.tmpName):
+			os.unlink(self.tmpName)
+		self.done = True
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		self.abort()
+
 class ScraperBase(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	# Abstract class (must be subclassed)
@@ -17,6 +170,16 @@ class ScraperBase(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 	itemLimit = False
 	retreivalThreads = 1
 
+	# Per-chapter image fetching (see fetchChapterPages()).
+	# pageFetchThreads is the number of concurrent image fetches within a single chapter.
+	# pageFetchRate is the maximum number of requests/second to each image host (None for
+	# no limit), with bursts of up to pageFetchBurst requests.
+	# Note that the chapter-level retreivalThreads multiplies the concurrency, but the
+	# host rate limit is shared process-wide.
+	pageFetchThreads = 1
+	pageFetchRate    = None
+	pageFetchBurst   = 1
+
 	@abc.abstractmethod
 	def getLink(self, link):
 		pass
@@ -98,6 +261,22 @@ class ScraperBase(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 				executor.shutdown(wait=True)
 
 
+	def fetchChapterPages(self, arch, jobs, fetchFunc, urlIndex=0):
+		'''
+		Fetch the pages of a chapter into the ChapterArchiveWriter `arch`, using this
+		plugin's pageFetchThreads/pageFetchRate/pageFetchBurst settings.
+
+		`fetchFunc(*job)` is called for each job in `jobs`, and must return a
+		`(imageName, imageContent)` tuple. `job[urlIndex]` is the URL being fetched,
+		which is used to pick the host rate-limit.
+
+		Returns False if the exit flag was set while fetching.
+		'''
+		def throttle(*job):
+			waitForHost(job[urlIndex], self.pageFetchRate, self.pageFetchBurst)
+
+		return arch.fetchPages(jobs, fetchFunc, workers=self.pageFetchThreads, throttle=throttle if self.pageFetchRate else None)
+
 	def insertCountIfFilenameExists(self, fqFName):
 
 		base, ext = os.path.splitext(fqFName)
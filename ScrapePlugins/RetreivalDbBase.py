@@ -4,18 +4,20 @@ if __name__ == "__main__":
 	runStatus.preloadDicts = False
 
 import logging
-import psycopg2
 import functools
 import operator as opclass
 import abc
 
 import threading
 import settings
+import dbPool
 import os
 import traceback
 
 import nameTools as nt
 import ScrapePlugins.DbBase
+import schemaUpdater.tagCountTracker
+import schemaUpdater.tagArrays
 
 import sql
 import time
@@ -57,6 +59,12 @@ class ScraperDbBase(ScrapePlugins.DbBase.DbBase):
 	# Excessively verbose otherwise.
 	QUERY_DEBUG = False
 
+	# Maximum number of rows per statement for the bulk lookup/insert paths.
+	BULK_CHUNK_SIZE = 500
+
+	# The row's tags as an array, for rows the tag-array backfill hasn't reached yet (tagArr still NULL).
+	CURRENT_TAGS_EXPR = schemaUpdater.tagArrays.TAG_ARRAY_EXPR.format(src="tags")
+
 	@abc.abstractmethod
 	def pluginName(self):
 		return None
@@ -105,14 +113,12 @@ class ScraperDbBase(ScrapePlugins.DbBase.DbBase):
 		elif name == "conn":
 			if threadName not in self.dbConnections:
 
-				# First try local socket connection, fall back to a IP-based connection.
-				# That way, if the server is local, we get the better performance of a local socket.
-				try:
-					self.dbConnections[threadName] = psycopg2.connect(dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-				except psycopg2.OperationalError:
-					self.dbConnections[threadName] = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+				# Hand back any handles belonging to threads that have since exited
+				# before grabbing a new one, so short-lived worker threads don't slowly
+				# drain the pool.
+				self.releaseDeadThreadConnections()
+				self.dbConnections[threadName] = dbPool.pool.getconn(persistent=True)
 
-				# self.dbConnections[threadName].autocommit = True
 			return self.dbConnections[threadName]
 
 
@@ -177,11 +183,20 @@ class ScraperDbBase(ScrapePlugins.DbBase.DbBase):
 		pass
 
 
+	# Return all the per-thread handles to the connection pool.
 	def closeDB(self):
 		self.log.info("Closing DB...",)
-		self.conn.close()
+		for threadName in list(self.dbConnections.keys()):
+			dbPool.pool.putconn(self.dbConnections.pop(threadName))
 		self.log.info("DB Closed")
 
+	def releaseDeadThreadConnections(self):
+		live = set([thread.name for thread in threading.enumerate()])
+		for threadName in list(self.dbConnections.keys()):
+			if threadName not in live:
+				dbPool.pool.putconn(self.dbConnections.pop(threadName))
+
+
 
 	# ---------------------------------------------------------------------------------------------------------------------------------------------------------
 	# Filesystem stuff
@@ -466,81 +481,73 @@ class ScraperDbBase(ScrapePlugins.DbBase.DbBase):
 			retL.append(dict(zip(keys, row)))
 		return retL
 
-	# Insert new tags specified as a string kwarg (tags="tag Str") into the tags listing for the specified item
-	def addTags(self, **kwargs):
+	# Build the `WHERE dbid = (...)` subquery selecting the row addTags/removeTags operate on.
+	# Like getRowByValue(), this is the most recently retreived row matching `kwargs`.
+	def _tagTargetQuery(self, limitByKey=True, **kwargs):
 		validCols = ["dbId", "sourceUrl", "dlState"]
 		if not any([name in kwargs for name in validCols]):
-			raise ValueError("addTags requires at least one fully-qualified argument (%s). Passed args = '%s'" % (validCols, kwargs))
+			raise ValueError("Tag updates require at least one fully-qualified argument (%s). Passed args = '%s'" % (validCols, kwargs))
 
+		if limitByKey and self.tableKey:
+			kwargs["sourceSite"] = self.tableKey
+
+		where = self.sqlBuildConditional(**kwargs)
+		query = self.table.select(self.table.dbid, where=where, order_by=sql.Desc(self.table.retreivaltime), limit=1)
+		return tuple(query)
+
+	def _updateTags(self, tagExpr, tags, kwargs):
 		if not "tags" in kwargs:
-			raise ValueError("You have to specify tags you want to add as a kwarg! '%s'" % (kwargs))
+			raise ValueError("You have to specify tags you want to change as a kwarg! '%s'" % (kwargs))
+		kwargs.pop("tags")
+		commit = kwargs.pop("commit", True)
+
+		subQuery, subParams = self._tagTargetQuery(**kwargs)
+
+		# `tagArr` is the trigger-maintained array copy of `tags` (see schemaUpdater/tagArrays.py),
+		# so the new tag string can be built in the database, in a single statement.
+		query = '''UPDATE {tableName} SET tags = array_to_string(ARRAY({tagExpr}), ' ') WHERE dbid = ({subQuery}) RETURNING dbid;'''.format(
+				tableName = self.tableName,
+				tagExpr   = tagExpr,
+				subQuery  = subQuery)
+		params = [tags] + list(subParams)
+
+		if self.QUERY_DEBUG:
+			print("Query = ", query)
+			print("Args = ", params)
+
+		with self.conn.cursor() as cur:
+			with transaction(cur, commit=commit):
+				cur.execute(query, params)
+				updated = cur.fetchall()
 
-		tags = kwargs.pop("tags")
-		# print("Getting row", kwargs)
-		row = self.getRowByValue(**kwargs)
-		if not row:
+		if not updated:
 			raise ValueError("Row specified does not exist!")
 
-		if row["tags"]:
-			existingTags = set(row["tags"].split(" "))
-		else:
-			existingTags = set()
+	# Insert new tags specified as a string kwarg (tags="tag Str") into the tags listing for the specified item
+	def addTags(self, **kwargs):
 
 		newTags = set()
-		for tagTemp in set(tags.split(" ")):
+		for tagTemp in kwargs.get("tags", "").split(" "):
 
 			# colon literals (":") break the `tsvector` index. Remove them (they're kinda pointless anyways)
 			tagTemp = tagTemp.replace("&", "_")   \
 							.replace(":", "_")    \
 							.strip(".")           \
 							.lower()
-			newTags.add(tagTemp)
+			if tagTemp:
+				newTags.add(tagTemp)
 
+		# The union is sorted, to keep the tag ordering determistic.
+		tagExpr = "SELECT DISTINCT tag FROM unnest(coalesce(tagArr, {current}) || %s::text[]) AS tag ORDER BY tag".format(current=self.CURRENT_TAGS_EXPR)
+		self._updateTags(tagExpr, sorted(newTags), kwargs)
 
-		tags = existingTags | newTags
-
-		# make the tag ordering determistic by converting to a list, and sorting.
-		tags = list(tags)
-		tags.sort()
-
-		tagStr = " ".join(tags)
-		while "  " in tagStr:
-			tagStr = tagStr.replace("  ", " ")
-		tagStr = tagStr.lower()
-		self.updateDbEntry(row["sourceUrl"], tags=tagStr)
-
-
-
-
-	# Insert new tags specified as a string kwarg (tags="tag Str") into the tags listing for the specified item
+	# Remove the tags specified as a string kwarg (tags="tag Str") from the tags listing for the specified item
 	def removeTags(self, **kwargs):
-		validCols = ["dbId", "sourceUrl", "dlState"]
-		if not any([name in kwargs for name in validCols]):
-			raise ValueError("addTags requires at least one fully-qualified argument (%s). Passed args = '%s'" % (validCols, kwargs))
-
-		if not "tags" in kwargs:
-			raise ValueError("You have to specify tags you want to add as a kwarg! '%s'" % (kwargs))
-
-		tags = kwargs.pop("tags")
-		row = self.getRowByValue(**kwargs)
-		if not row:
-			raise ValueError("Row specified does not exist!")
-
-		if not row["tags"]:
-			existingTags = set(row["tags"].split(" "))
-		else:
-			existingTags = set()
 
-		newTags = set(tags.split(" "))
-
-		tags = existingTags - newTags
-
-		tagStr = " ".join(tags)
-		while "  " in tagStr:
-			tagStr = tagStr.replace("  ", " ")
-
-		self.updateDbEntry(row["sourceUrl"], tags=tagStr)
+		dropTags = [tag.lower() for tag in kwargs.get("tags", "").split(" ") if tag]
 
+		tagExpr = "SELECT tag FROM unnest(coalesce(tagArr, {current})) AS tag WHERE tag != ALL(%s::text[]) ORDER BY tag".format(current=self.CURRENT_TAGS_EXPR)
+		self._updateTags(tagExpr, dropTags, kwargs)
 
 
 
@@ -562,44 +569,103 @@ class ScraperDbBase(ScrapePlugins.DbBase.DbBase):
 
 
 
+	# Return the subset of `urls` that are already present in the table (for any source site).
+	# Lookups are done with `sourceUrl = ANY(%s)` in chunks, so a feed with thousands of links
+	# costs a handful of round-trips rather then one per link.
+	def getExistingUrls(self, urls, commit=True):
+		urls = list(set(urls))
+		have = set()
+		if not urls:
+			return have
+
+		with self.conn.cursor() as cur:
+			with transaction(cur, commit=commit):
+				for offset in range(0, len(urls), self.BULK_CHUNK_SIZE):
+					chunk = urls[offset:offset+self.BULK_CHUNK_SIZE]
+					cur.execute("SELECT sourceUrl FROM {tableName} WHERE sourceUrl = ANY(%s);".format(tableName=self.tableName), (chunk, ))
+					have.update([row[0] for row in cur.fetchall()])
+
+		return have
+
+	# Insert multiple rows in as few statements as possible.
+	# Rows are grouped by their set of columns (python-sql multi-row inserts need a
+	# uniform column list), and each group is written with multi-row INSERT statements
+	# of at most BULK_CHUNK_SIZE rows.
+	# Rows whose sourceUrl is already in the table (e.g. added by another scraper
+	# thread since it was checked) are skipped, rather then failing the whole batch.
+	# Returns the number of rows actually inserted.
+	def bulkInsertIntoDb(self, rows, commit=True):
+		groups = {}
+		for row in rows:
+			keys = tuple(sorted(row.keys()))
+			for key in keys:
+				if key.lower() not in self.colMap:
+					raise ValueError("Invalid column name for insert! '%s'" % key)
+			groups.setdefault(keys, []).append(row)
+
+		inserted = 0
+		with self.conn.cursor() as cur:
+			with transaction(cur, commit=commit):
+				for keys, items in groups.items():
+					cols = [self.table.sourcesite] + [self.colMap[key.lower()] for key in keys]
+					for offset in range(0, len(items), self.BULK_CHUNK_SIZE):
+						chunk = items[offset:offset+self.BULK_CHUNK_SIZE]
+						vals = [[self.tableKey] + [item[key] for key in keys] for item in chunk]
+
+						query = self.table.insert(columns=cols, values=vals)
+						query, params = tuple(query)
+						query += " ON CONFLICT (sourceUrl) DO NOTHING RETURNING dbid"
+
+						if self.QUERY_DEBUG:
+							print("Query = ", query)
+							print("Args = ", params)
+
+						cur.execute(query, params)
+						inserted += len(cur.fetchall())
+
+		return inserted
+
+
 	def processLinksIntoDB(self, linksDicts):
 
 		self.log.info( "Inserting...",)
-		newItems = 0
+
+		links = []
 		for link in linksDicts:
 			if link is None:
 				print("linksDicts", linksDicts)
 				print("WAT")
+				continue
+			links.append(link)
 
-			row = self.getRowsByValue(sourceUrl=link["sourceUrl"], limitByKey=False)
-
-			if not row:
-				newItems += 1
-
-				if not "dlState" in link:
-					link['dlState'] = 0
-
-				# Patch series name.
-				if 'seriesName' in link and self.shouldCanonize:
-					link["seriesName"] = nt.getCanonicalMangaUpdatesName(link["seriesName"])
+		existing = self.getExistingUrls([link["sourceUrl"] for link in links], commit=False)
 
+		# Canonization is comparatively expensive, and feeds generally contain many
+		# items for the same series, so only do it once per distinct name.
+		canonNames = {}
 
-				# Using fancy dict hijinks now. Old call below for reference.
+		newLinks = []
+		for link in links:
 
-				# self.insertIntoDb(retreivalTime = link["date"],
-				# 					sourceUrl   = link["dlLink"],
-				# 					originName  = link["dlName"],
-				# 					dlState     = 0,
-				# 					seriesName  = link["baseName"],
-				# 					flags       = flagStr)
+			# Also dedup within the batch itself. The first instance of a url wins.
+			if link["sourceUrl"] in existing:
+				continue
+			existing.add(link["sourceUrl"])
 
-				self.insertIntoDb(**link)
-
-
-				self.log.info("New item: %s", link)
+			if not "dlState" in link:
+				link['dlState'] = 0
 
+			# Patch series name.
+			if 'seriesName' in link and self.shouldCanonize:
+				name = link["seriesName"]
+				if name not in canonNames:
+					canonNames[name] = nt.getCanonicalMangaUpdatesName(name)
+				link["seriesName"] = canonNames[name]
 
+			newLinks.append(link)
+			self.log.info("New item: %s", link)
 
+		newItems = self.bulkInsertIntoDb(newLinks, commit=False)
 
 		self.log.info( "Done")
 		self.log.info( "Committing...",)
@@ -673,6 +739,11 @@ class ScraperDbBase(ScrapePlugins.DbBase.DbBase):
 
 
 		self.conn.commit()
+
+		# The items table may not have existed when the schema was updated, so
+		# make sure the tag-count and tag-array hooks are in place.
+		schemaUpdater.tagCountTracker.setupTagCountTracking(self.conn)
+		schemaUpdater.tagArrays.setupTagArrays(self.conn)
 		self.log.info("Retreived page database created")
 
 
@@ -1,8 +1,7 @@
 
 
 import logging
-import settings
-import psycopg2
+import dbPool
 import runStatus
 import time
 import traceback
@@ -31,31 +30,28 @@ class ScraperBase(metaclass=abc.ABCMeta):
 		self.checkStatusTableExists()
 
 	def checkStatusTableExists(self):
-		con = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		with con.cursor() as cur:
+		with dbPool.pool.connection() as con:
+			with con.cursor() as cur:
 
-			cur.execute("SELECT relname FROM pg_class;")
-			haveItems = cur.fetchall()
-			haveItems = [index[0] for index in haveItems]
-			if not "pluginstatus" in haveItems:
-				raise ValueError("PluginStatus table does not exist. Has MainScrape never been run?")
+				cur.execute("SELECT relname FROM pg_class;")
+				haveItems = cur.fetchall()
+				haveItems = [index[0] for index in haveItems]
+				if not "pluginstatus" in haveItems:
+					raise ValueError("PluginStatus table does not exist. Has MainScrape never been run?")
 
-			print(self.pluginName)
+				print(self.pluginName)
 
-			cur.execute('''SELECT name FROM pluginStatus WHERE name=%s''', (self.pluginName,))
-			ret = cur.fetchall()
-			if not ret:
-				cur.execute('''INSERT INTO pluginStatus (name, running, lastRun, lastRunTime) VALUES (%s, %s, %s, %s)''', (self.pluginName, False, -1, -1))
-				con.commit()
-
-		con.close()
+				cur.execute('''SELECT name FROM pluginStatus WHERE name=%s''', (self.pluginName,))
+				ret = cur.fetchall()
+				if not ret:
+					cur.execute('''INSERT INTO pluginStatus (name, running, lastRun, lastRunTime) VALUES (%s, %s, %s, %s)''', (self.pluginName, False, -1, -1))
 
 	def amRunning(self):
 
-		con = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		with con.cursor() as cur:
-			cur.execute("""SELECT running FROM pluginStatus WHERE name=%s""", (self.pluginName, ))
-			rets = cur.fetchone()[0]
+		with dbPool.pool.connection() as con:
+			with con.cursor() as cur:
+				cur.execute("""SELECT running FROM pluginStatus WHERE name=%s""", (self.pluginName, ))
+				rets = cur.fetchone()[0]
 		self.log.info("%s is running = '%s', as bool = '%s'", self.pluginName, rets, bool(rets))
 		return rets
 
@@ -63,26 +59,20 @@ class ScraperBase(metaclass=abc.ABCMeta):
 		if pluginName == None:
 			pluginName=self.pluginName
 
-		con = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		with con.cursor() as cur:
-			if running != None:  # Note: Can be set to "False". This is valid!
-				cur.execute('''UPDATE pluginStatus SET running=%s WHERE name=%s;''', (running, pluginName))
-			if lastRun != None:
-				cur.execute('''UPDATE pluginStatus SET lastRun=%s WHERE name=%s;''', (lastRun, pluginName))
-			if lastRunTime != None:
-				cur.execute('''UPDATE pluginStatus SET lastRunTime=%s WHERE name=%s;''', (lastRunTime, pluginName))
-
-		con.commit()
-		con.close()
+		with dbPool.pool.connection() as con:
+			with con.cursor() as cur:
+				if running != None:  # Note: Can be set to "False". This is valid!
+					cur.execute('''UPDATE pluginStatus SET running=%s WHERE name=%s;''', (running, pluginName))
+				if lastRun != None:
+					cur.execute('''UPDATE pluginStatus SET lastRun=%s WHERE name=%s;''', (lastRun, pluginName))
+				if lastRunTime != None:
+					cur.execute('''UPDATE pluginStatus SET lastRunTime=%s WHERE name=%s;''', (lastRunTime, pluginName))
 
 	def setError(self, errTime):
 
-		con = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		with con.cursor() as cur:
-			cur.execute('''UPDATE pluginStatus SET lastError=%s WHERE name=%s;''', (errTime, self.pluginName))
-
-		con.commit()
-		con.close()
+		with dbPool.pool.connection() as con:
+			with con.cursor() as cur:
+				cur.execute('''UPDATE pluginStatus SET lastError=%s WHERE name=%s;''', (errTime, self.pluginName))
 
 
 	def go(self):
@@ -110,6 +100,8 @@ class ScraperBase(metaclass=abc.ABCMeta):
 			finally:
 				self.setStatus(running=False, lastRunTime=time.time()-runStart)
 				self.log.info("%s finished.", self.pluginName)
+				self.log.info("DB pool stats: %s", dbPool.pool.getStats())
+				dbPool.pool.checkLeaks()
 
 
 
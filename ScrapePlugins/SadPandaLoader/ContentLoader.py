@@ -184,7 +184,9 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 		if downloadUrl:
 
 
-			fCont, fName = self.wg.getFileAndName(downloadUrl)
+			# Galleries can be hundreds of MB, so stream them straight to disk.
+			dlInfo = self.wg.getFileToPath(downloadUrl, linkDict["dirPath"])
+			fName = dlInfo['name']
 
 			# self.log.info(len(content))
 			if linkDict['originName'] in fName:
@@ -198,22 +200,25 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 			chop = len(fileN)-4
 
 			wholePath = "ERROR"
-			while 1:
-
-				try:
-					fileN = fileN[:chop]+fileN[-4:]
-					# self.log.info("geturl with processing", fileN)
-					wholePath = os.path.join(linkDict["dirPath"], fileN)
-					self.log.info("Complete filepath: %s", wholePath)
-
-					#Write all downloaded files to the archive.
-					with open(wholePath, "wb") as fp:
-						fp.write(fCont)
-					self.log.info("Successfully Saved to path: %s", wholePath)
-					break
-				except IOError:
-					chop = chop - 1
-					self.log.warn("Truncating file length to %s characters.", chop)
+			try:
+				while 1:
+
+					try:
+						fileN = fileN[:chop]+fileN[-4:]
+						# self.log.info("geturl with processing", fileN)
+						wholePath = os.path.join(linkDict["dirPath"], fileN)
+						self.log.info("Complete filepath: %s", wholePath)
+
+						#Move the downloaded file into place.
+						os.replace(dlInfo['path'], wholePath)
+						self.log.info("Successfully Saved to path: %s", wholePath)
+						break
+					except IOError:
+						chop = chop - 1
+						self.log.warn("Truncating file length to %s characters.", chop)
+			finally:
+				if os.path.exists(dlInfo['path']):
+					os.unlink(dlInfo['path'])
 
 
 
@@ -9,8 +9,6 @@ import nameTools as nt
 
 import urllib.parse
 
-import zipfile
-import runStatus
 import traceback
 import bs4
 import ScrapePlugins.RetreivalBase
@@ -156,32 +154,27 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-			imgCnt = 1
-
-			for imgUrl, referrerUrl in imageUrls:
+			def getNumberedImage(imgCnt, imgUrl, referrerUrl):
 				imageName, imageContent = self.getImage(imgUrl, referrerUrl)
 				imageName = "{num:03.0f} - {srcName}".format(num=imgCnt, srcName=imageName)
-				imgCnt += 1
+				return imageName, imageContent
 
-				images.append([imageName, imageContent])
+			jobs = [(imgCnt, imgUrl, referrerUrl) for imgCnt, (imgUrl, referrerUrl) in enumerate(imageUrls, 1)]
 
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, jobs, getNumberedImage, urlIndex=1):
 					self.log.info( "Breaking due to exit flag being set")
 					self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True, includePHash=True)
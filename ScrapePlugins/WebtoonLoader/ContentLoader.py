@@ -1,7 +1,6 @@
 
 
 import logSetup
-import runStatus
 import webFunctions
 import settings
 import os
@@ -13,7 +12,6 @@ import time
 
 import urllib.parse
 import html.parser
-import zipfile
 import traceback
 import bs4
 import re
@@ -34,10 +32,14 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 	dbName = settings.DATABASE_DB_NAME
 	tableName = "MangaItems"
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", keepAlive=True)
 
 	retreivalThreads = 4
 
+	pageFetchThreads = 4
+	pageFetchRate    = 8
+	pageFetchBurst   = 8
+
 	urlBase = "http://www.webtoons.com/"
 
 	def getImage(self, imageUrl, referrer):
@@ -120,31 +122,27 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-
-			imgCnt = 1
-			for imgUrl, referrerUrl in imageUrls:
+			def getNumberedImage(imgCnt, imgUrl, referrerUrl):
 				imageName, imageContent = self.getImage(imgUrl, referrerUrl)
 				imageName = "{num:03.0f} - {srcName}".format(num=imgCnt, srcName=imageName)
-				imgCnt += 1
-				images.append([imageName, imageContent])
+				return imageName, imageContent
+
+			jobs = [(imgCnt, imgUrl, referrerUrl) for imgCnt, (imgUrl, referrerUrl) in enumerate(imageUrls, 1)]
 
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, jobs, getNumberedImage, urlIndex=1):
 					self.log.info( "Breaking due to exit flag being set")
 					self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
-				return
+				if not arch.pages:
+					self.updateDbEntry(sourceUrl, dlState=-1, seriesName=seriesName, originName=chapterVol, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True)
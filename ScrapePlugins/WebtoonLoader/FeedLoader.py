@@ -33,7 +33,7 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 	tableKey = "wt"
 	dbName = settings.DATABASE_DB_NAME
 
-	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web")
+	wg = webFunctions.WebGetRobust(logPath=loggerPath+".Web", httpCache=True)
 
 	tableName = "MangaItems"
 
@@ -72,7 +72,16 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 		ret = []
 		while 1:
 
-			soup = self.wg.getSoup(urlFormat.format(num=pageNo))
+			if historical:
+				soup = self.wg.getSoup(urlFormat.format(num=pageNo))
+			else:
+				soup = self.wg.getSoupIfChanged(urlFormat.format(num=pageNo))
+
+				# Series page is unchanged, so no new chapters.
+				if soup is None:
+					self.log.info("Series page unchanged.")
+					return ret
+
 			baseInfo = self.extractItemInfo(soup)
 
 			listDiv = soup.find_all("div", class_="detail_lst")
@@ -183,6 +192,8 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	def go(self, historical=False):
 
+		# Anything fetched but not stored by an earlier (failed) run has to be fetched again.
+		self.wg.discardCache()
 		self.resetStuckItems()
 		self.log.info("Getting feed items")
 
@@ -190,6 +201,8 @@ class FeedLoader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 		self.log.info("Processing feed Items")
 
 		self.processLinksIntoDB(feedItems)
+		self.wg.commitCache()
+		self.wg.logCacheStats()
 		self.log.info("Complete")
 
 
@@ -57,15 +57,15 @@ class Loader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 								seriesName  = seriesName)
 
 
-		fctnt, fname = self.wg.getFileAndName(dlurl)
-
-
 		fileN = '{series} - {chap} [YoManga].zip'.format(series=seriesName, chap=chapter_name)
 		fileN = nt.makeFilenameSafe(fileN)
 
 		dlPath, newDir = self.locateOrCreateDirectoryForSeries(seriesName)
 		wholePath = os.path.join(dlPath, fileN)
 
+		dlInfo = self.wg.getFileToPath(dlurl, dlPath)
+		fname = dlInfo['name']
+
 		self.log.info("Source name: %s", fname)
 		self.log.info("Generated name: %s", fileN)
 
@@ -73,8 +73,7 @@ class Loader(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 			self.updateDbEntry(dlurl, flags="haddir")
 			self.conn.commit()
 
-		with open(wholePath, "wb") as fp:
-			fp.write(fctnt)
+		os.replace(dlInfo['path'], wholePath)
 
 		self.log.info("Successfully Saved to path: %s", wholePath)
 
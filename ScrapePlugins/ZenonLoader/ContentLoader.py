@@ -18,7 +18,6 @@ import datetime
 
 import urllib.parse
 import html.parser
-import zipfile
 import traceback
 import bs4
 import re
@@ -151,30 +150,25 @@ class ContentLoader(ScrapePlugins.RetreivalBase.ScraperBase):
 				loop += 1
 			self.log.info("Saving to archive = %s", fqFName)
 
-			images = []
-			imgCnt = 1
-			for imgUrl in imageUrls:
+			def getNumberedImage(imgCnt, imgUrl):
 				imageName, imageContent = self.getImage(imgUrl, sourceUrl)
 				imageName = "{num:03.0f} - {srcName}".format(num=imgCnt, srcName=imageName)
-				imgCnt += 1
-				images.append([imageName, imageContent])
+				return imageName, imageContent
 
-				if not runStatus.run:
+			# Images are streamed into the archive as they're retreived.
+			with ScrapePlugins.RetreivalBase.ChapterArchiveWriter(fqFName) as arch:
+				if not self.fetchChapterPages(arch, enumerate(imageUrls, 1), getNumberedImage, urlIndex=1):
 					self.log.info( "Breaking due to exit flag being set")
 					# self.updateDbEntry(sourceUrl, dlState=0)
 					return
 
-			self.log.info("Creating archive with %s images", len(images))
+				self.log.info("Creating archive with %s images", arch.pages)
 
-			if not images:
-				# self.updateDbEntry(sourceUrl, dlState=-1, tags="error-404")
-				return
+				if not arch.pages:
+					# self.updateDbEntry(sourceUrl, dlState=-1, tags="error-404")
+					return
 
-			#Write all downloaded files to the archive.
-			arch = zipfile.ZipFile(fqFName, "w")
-			for imageName, imageContent in images:
-				arch.writestr(imageName, imageContent)
-			arch.close()
+				arch.commit()
 
 
 			dedupState = processDownload.processDownload(seriesName, fqFName, deleteDups=True, includePHash=True)
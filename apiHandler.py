@@ -5,6 +5,7 @@ from pyramid.response import Response
 
 import DbManagement.MonitorTool
 import nameTools as nt
+import fragmentCache
 import logging
 import json
 import settings
@@ -17,8 +18,8 @@ class ApiInterface(object):
 
 	log = logging.getLogger("Main.API")
 
-	def __init__(self, sqlInterface):
-		self.conn = sqlInterface
+	def __init__(self):
+		pass
 
 
 	def updateSeries(self, request):
@@ -118,7 +119,7 @@ class ApiInterface(object):
 		except ValueError:
 			return Response(body=json.dumps({"Status": "Failed", "Message": "Row ID was not a integer!"}))
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 
 		cur.execute("SELECT dlState, dbid FROM MangaItems WHERE dbId=%s", (dbId, ))
 		ret = cur.fetchall()
@@ -140,6 +141,9 @@ class ApiInterface(object):
 		cur.execute("UPDATE MangaItems SET dlState=0 WHERE dbId=%s", (dbId, ))
 		cur.execute("COMMIT;")
 
+		# The item counts on the status page and sidebar just changed.
+		fragmentCache.invalidate("status")
+
 		return Response(body=json.dumps({"Status": "Success", "Message": "Download state reset."}))
 
 
@@ -148,7 +152,7 @@ class ApiInterface(object):
 		itemNameStr = request.params['trigram-query-hentai-str']
 		linkText = request.params['trigram-query-linktext']
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""SELECT COUNT(*) FROM hentaiitems WHERE originname %% %s;""", (itemNameStr, ))
 		ret = cur.fetchone()[0]
 
@@ -166,7 +170,7 @@ class ApiInterface(object):
 		itemNameStr = request.params['trigram-query-book-str']
 		linkText = request.params['trigram-query-linktext']
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""SELECT COUNT(*) FROM book_items WHERE title %% %s;""", (itemNameStr, ))
 		ret = cur.fetchone()[0]
 
@@ -223,7 +227,7 @@ class ApiInterface(object):
 
 		newList = request.params['listName']
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""SELECT COUNT(*) FROM book_series_lists WHERE listname=%s;""", (newList, ))
 		ret = cur.fetchone()[0]
 
@@ -231,7 +235,7 @@ class ApiInterface(object):
 			return Response(body=json.dumps({"Status": "Failed", "contents": 'List already exists!'}))
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""INSERT INTO book_series_lists (listname) VALUES (%s);""", (newList, ))
 		cur.execute('COMMIT')
 
@@ -243,7 +247,7 @@ class ApiInterface(object):
 		delList = request.params['listName']
 		print("listname: '%s'" % delList)
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""SELECT COUNT(*) FROM book_series_lists WHERE listname=%s;""", (delList, ))
 		ret = cur.fetchone()
 
@@ -253,7 +257,7 @@ class ApiInterface(object):
 			return Response(body=json.dumps({"Status": "Failed", "contents": 'Cannot delete list that doesn\'t exist!'}))
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""DELETE FROM book_series_lists WHERE listname=%s;""", (delList, ))
 		cur.execute('COMMIT')
 
@@ -265,26 +269,26 @@ class ApiInterface(object):
 		listName = request.params['listName']
 
 		if not listName:
-			cur = self.conn.cursor()
+			cur = request.dbConn.cursor()
 			cur.execute("""DELETE FROM book_series_list_entries WHERE seriesid=%s;""", (bookId, ))
 
 			return Response(body=json.dumps({"Status": "Success", "contents": 'Item list cleared!'}))
 
 
 		# Check if the item already is in the list table.
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""SELECT COUNT(*) FROM book_series_list_entries WHERE seriesid=%s;""", (bookId, ))
 		ret = cur.fetchone()[0]
 
 		if ret:
-			cur = self.conn.cursor()
+			cur = request.dbConn.cursor()
 			cur.execute("""UPDATE book_series_list_entries SET listname=%s WHERE seriesid=%s;""", (listName, bookId))
 			cur.execute('COMMIT')
 
 			return Response(body=json.dumps({"Status": "Success", "contents": 'Updated list for item!'}))
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""INSERT INTO book_series_list_entries (seriesid, listname) VALUES (%s, %s);""", (bookId, listName))
 		cur.execute('COMMIT')
 
@@ -303,7 +307,7 @@ class ApiInterface(object):
 			return Response(body=json.dumps({"Status": "Failed", "contents": 'Change value not an integer!'}))
 
 		# Check if the item already is in the list table.
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""SELECT readingprogress FROM book_series WHERE dbid=%s;""", (bookId, ))
 		retRow = cur.fetchone()
 		if not retRow:
@@ -339,7 +343,7 @@ class ApiInterface(object):
 		except ValueError:
 			return Response(body=json.dumps({"Status": "Failed", "contents": 'Change value not an integer!'}))
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""UPDATE book_series SET rating=%s WHERE dbid=%s;""", (newRating, bookId))
 		cur.execute('COMMIT')
 
@@ -355,7 +359,7 @@ class ApiInterface(object):
 		title = request.params["new-name"]
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""INSERT INTO book_series (itemname, itemtable) VALUES (%s, (SELECT dbid FROM book_series_table_links WHERE tablename=%s));""", (title, 'books_custom'))
 		cur.execute('COMMIT')
 
@@ -374,7 +378,7 @@ class ApiInterface(object):
 
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""UPDATE book_items SET distance=0 WHERE dbid=%s;""", (rowid, ))
 		cur.execute('COMMIT')
 
@@ -390,7 +394,7 @@ class ApiInterface(object):
 		assert request.params['reset-book-download-state']
 		rowid = int(request.params['reset-book-download-state'])
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""UPDATE book_items SET distance=0, dlState=0 WHERE dbid=%s;""", (rowid, ))
 		cur.execute('COMMIT')
 
@@ -408,7 +412,7 @@ class ApiInterface(object):
 		deleteId = request.params["delete-id"]
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("""DELETE FROM book_series WHERE dbid=%s AND itemtable=(SELECT dbid FROM book_series_table_links WHERE tablename=%s);""", (deleteId, 'books_custom'))
 		cur.execute('COMMIT')
 
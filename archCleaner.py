@@ -4,15 +4,23 @@
 import os
 import os.path
 
+import time
+import zlib
+import struct
 import hashlib
+import threading
 import settings
 import logging
 import magic
 import UniversalArchiveInterface
 
 import rarfile
+import shutil
 import traceback
 
+# New archives are always written with the standard library zipfile. See ArchiveRewriter.
+import zipfile as zipWriter
+
 try:
 	import pyximport
 	pyximport.install()
@@ -50,128 +58,461 @@ class DamagedArchive(Exception):
 
 # `unprotectZip()` removes password-based encryption from a zip file
 
-# `processNewArchive()` takes an archive, and passes it through `cleanZip()` and `unprotectZip()`, and then
-# checks it to see if it's duplicated by other files aready in the database.
-# It should eventually add it to the database if it's new, or delete it if it's redundant.
-# (WIP)
+# `ingestArchive()` does both in a single read of the archive (the file type is sniffed once, and each
+# member is decrypted if needed, checked against the bad files and hashed in the same pass),
+# and returns the per-file hashes so the deduper doesn't have to read the archive again.
+# `processNewArchive()` is the same thing, without the hashes.
+
+# When a zip is rebuilt, members that aren't changed are copied across still compressed (raw),
+# rather then being decompressed and written out again. Rars (and 7z files) are converted
+# to zips one member at a time, as they're read. Either way, the archive is never held in memory.
 
 import processDownload
 
+# How often (in seconds) the bad image directory is checked for changes.
+BAD_CONTENT_RELOAD_INTERVAL = 60
+
+class BadContentRegistry(object):
+	'''
+	The hashes of the files in settings.badImageDir, loaded once per process (and reloaded if the
+	directory changes), rather then once per ArchCleaner.
+
+	Besides the md5 set, the sizes (and (size, crc32) pairs) of the bad files are kept, so
+	zip members can be ruled out from their directory entry, without reading them.
+	'''
+
+	log = logging.getLogger("Main.ZipClean.BadContent")
+
+	def __init__(self, badImageDir=None):
+		self.badImageDir = badImageDir
+		self.lock        = threading.Lock()
+
+		self.hashes      = set()
+		self.sizes       = set()
+		self.sizeCrcs    = set()
+
+		self.dirMtime    = None
+		self.lastCheck   = 0
+
+	def reload(self):
+		badImageDir = self.badImageDir or settings.badImageDir
+		dirMtime = os.stat(badImageDir).st_mtime
+
+		hashes, sizes, sizeCrcs = set(), set(), set()
+		for im in os.listdir(badImageDir):
+			with open(os.path.join(badImageDir, im), "rb") as fp:
+				ctnt = fp.read()
+			fHash = hashlib.md5(ctnt).hexdigest()
+			hashes.add(fHash)
+			sizes.add(len(ctnt))
+			sizeCrcs.add((len(ctnt), zlib.crc32(ctnt) & 0xffffffff))
+			self.log.info("Bad Image = '%s', Hash = '%s'", im, fHash)
+
+		with self.lock:
+			self.hashes, self.sizes, self.sizeCrcs = hashes, sizes, sizeCrcs
+			self.dirMtime  = dirMtime
+			self.lastCheck = time.time()
+
+	def _checkLoaded(self):
+		now = time.time()
+		if self.dirMtime is not None and now - self.lastCheck < BAD_CONTENT_RELOAD_INTERVAL:
+			return
+		badImageDir = self.badImageDir or settings.badImageDir
+		try:
+			changed = os.stat(badImageDir).st_mtime != self.dirMtime
+		except OSError:
+			changed = self.dirMtime is None
+		if changed:
+			self.reload()
+		else:
+			self.lastCheck = now
+
+	def maybeBad(self, size, crc=None):
+		'''
+		False if a file of `size` bytes (with CRC-32 `crc`, if known) can't be one of the bad files.
+		'''
+		self._checkLoaded()
+		if crc is not None:
+			return (size, crc) in self.sizeCrcs
+		return size in self.sizes
+
+	def isBad(self, fHash):
+		self._checkLoaded()
+		return fHash in self.hashes
+
+badContent = BadContentRegistry()
+
+# Placeholder contents in ArchCleaner.scanArchive()'s file list, for members that are read
+# from the source zip again when it's rebuilt (rather then being held in memory until then).
+# RAW_MEMBER members are copied still compressed, DECRYPT_MEMBER ones are decrypted and re-written.
+RAW_MEMBER     = object()
+DECRYPT_MEMBER = object()
+
+# Read size when streaming a member into a new archive.
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def zipDateTime(dateTime):
+	# Zip timestamps can't be before 1980.
+	if not dateTime or dateTime[0] < 1980:
+		return (1980, 1, 1, 0, 0, 0)
+	return tuple(dateTime[:6])
+
+class ArchiveRewriter(object):
+	'''
+	Writes a new zip one member at a time (so memory use doesn't depend on the size of the archive)
+	to a temporary file, which replaces `destPath` on commit().
+
+	The new archive is always written with the standard library zipfile, which can stream
+	members in, and copy them raw (czipfile is only faster at reading).
+	'''
+
+	def __init__(self, destPath):
+		self.destPath = destPath
+		self.tmpPath  = destPath + ".tmp"
+		self.zfp      = zipWriter.ZipFile(self.tmpPath, "w")
+
+	def _newInfo(self, name, dateTime):
+		zinfo = zipWriter.ZipInfo(name, zipDateTime(dateTime or time.localtime()))
+		zinfo.external_attr = 0o600 << 16
+		return zinfo
+
+	def writeBytes(self, name, data, dateTime=None):
+		self.zfp.writestr(self._newInfo(name, dateTime), data)
+
+	def writeStream(self, name, srcFp, dateTime=None, size=None):
+		zinfo = self._newInfo(name, dateTime)
+		if size is not None:
+			# Lets zipfile decide up front if it needs zip64 headers.
+			zinfo.file_size = size
+		with self.zfp.open(zinfo, "w") as dstFp:
+			shutil.copyfileobj(srcFp, dstFp, COPY_CHUNK_SIZE)
+
+	def copyRaw(self, srcFp, info):
+		'''
+		Copy the (still compressed) data for `info` from the open source zip file `srcFp`,
+		without decompressing it. The timestamp and attributes are kept.
+		'''
+		srcFp.seek(info.header_offset)
+		header = srcFp.read(zipWriter.sizeFileHeader)
+		if len(header) != zipWriter.sizeFileHeader:
+			raise DamagedArchive("Truncated file header for '%s'" % info.filename)
+		header = struct.unpack(zipWriter.structFileHeader, header)
+		if header[zipWriter._FH_SIGNATURE] != zipWriter.stringFileHeader:
+			raise DamagedArchive("Bad magic number in file header for '%s'" % info.filename)
+		srcFp.seek(header[zipWriter._FH_FILENAME_LENGTH] + header[zipWriter._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+
+		zinfo = zipWriter.ZipInfo(info.filename, zipDateTime(info.date_time))
+		zinfo.compress_type = info.compress_type
+		zinfo.create_system = info.create_system
+		zinfo.external_attr = info.external_attr
+		zinfo.CRC           = info.CRC
+		zinfo.compress_size = info.compress_size
+		zinfo.file_size     = info.file_size
+		# The sizes are known up front, so no trailing data descriptor.
+		zinfo.flag_bits     = info.flag_bits & ~0x08
+		zinfo.header_offset = self.zfp.fp.tell()
+
+		zip64 = zinfo.file_size > zipWriter.ZIP64_LIMIT or zinfo.compress_size > zipWriter.ZIP64_LIMIT
+		self.zfp.fp.write(zinfo.FileHeader(zip64))
+
+		remaining = info.compress_size
+		while remaining:
+			chunk = srcFp.read(min(remaining, COPY_CHUNK_SIZE))
+			if not chunk:
+				raise DamagedArchive("Truncated data for '%s'" % info.filename)
+			self.zfp.fp.write(chunk)
+			remaining -= len(chunk)
+
+		self.zfp.filelist.append(zinfo)
+		self.zfp.NameToInfo[zinfo.filename] = zinfo
+		self.zfp.start_dir  = self.zfp.fp.tell()
+		self.zfp._didModify = True
+
+	def commit(self):
+		self.zfp.close()
+		os.replace(self.tmpPath, self.destPath)
+
+	def abort(self):
+		self.zfp.close()
+		try:
+			os.remove(self.tmpPath)
+		except OSError:
+			pass
+
 class ArchCleaner(object):
 
 	loggerPath = "Main.ZipClean"
 	def __init__(self):
 
-		self.proc = [processDownload.MangaProcessor(), processDownload.HentaiProcessor()]
-
 		self.log = logging.getLogger(self.loggerPath)
+		self._proc = None
+
+	@property
+	def proc(self):
+		# Only needed when an archive is renamed, so the DB interfaces aren't set up until then.
+		if self._proc is None:
+			self._proc = [processDownload.MangaProcessor(), processDownload.HentaiProcessor()]
+		return self._proc
+
+
+	def getFileType(self, archPath):
+		return magic.from_file(archPath, mime=True).decode('ascii')
+
+	def _iterMembers(self, archPath, fType, password):
+		# Yields (fileName, size, crc, read, zipInfo, needsRewrite) for each member of the archive.
+		# `read()` returns the contents, and has to be called before moving on to the next member.
+		# `zipInfo` is the member's ZipInfo, and `size`/`crc` are from the zip directory (all None for
+		# other archive types).
+		# Zip files are read directly, so any encrypted members can be decrypted in the same pass
+		# (and flagged, so the archive gets rebuilt without the password).
+		if fType == 'application/zip':
+			zfp = zipfile.ZipFile(archPath, "r")
+			try:
+				if password:
+					zfp.setpassword(password.encode("ascii"))
+				for info in zfp.infolist():
+					if info.filename.endswith("/"):
+						continue
+					encrypted = bool(info.flag_bits & 0x1)
+
+					def read(info=info):
+						try:
+							return zfp.open(info).read()
+						except RuntimeError:
+							# Encrypted, and we don't have (the right) password.
+							raise DamagedArchive("Could not decrypt '%s' in '%s'" % (info.filename, archPath))
+
+					yield info.filename, info.file_size, info.CRC, read, info, encrypted
+			finally:
+				zfp.close()
 
-		badIms = os.listdir(settings.badImageDir)
-
-		self.badHashes = []
-
-		for im in badIms:
-			with open(os.path.join(settings.badImageDir, im), "rb") as fp:
-				md5 = hashlib.md5()
-				md5.update(fp.read())
-				self.badHashes.append(md5.hexdigest())
-				self.log.info("Bad Image = '%s', Hash = '%s'", im, md5.hexdigest())
-
-
-	# So starkana, in an impressive feat of douchecopterness, inserts an annoying self-promotion image
-	# in EVERY manga archive the serve. Furthermore, they insert it in the MIDDLE of the manga.
-	# Therefore, this function edits the zip and removes this stupid annoying file.
-	def cleanZip(self, archPath):
-
-		origPath = archPath
-
-		if not os.path.exists(archPath):
-			raise ValueError("Trying to clean non-existant file?")
-
-		fType = magic.from_file(archPath, mime=True).decode('ascii')
-		if not fType == 'application/zip' and \
-		   not fType == 'application/x-rar' and \
-		   not fType == 'application/x-7z-compressed':
-			raise NotAnArchive("Trying to clean a file that is not a zip/rar/7z archive! File=%s" % archPath)
-
-
-		file_count = 0
+		else:
+			old_zfp = UniversalArchiveInterface.ArchiveReader(archPath)
+			try:
+				for fileN, fileCtnt in old_zfp:
+					yield fileN, None, None, fileCtnt.read, None, False
+			finally:
+				old_zfp.close()
+
+	def isJunkFile(self, fileN):
+		if fileN.endswith("Thumbs.db"):
+			self.log.info("Had windows 'Thumbs.db' file. Removing")
+			return True
+
+		if "/__MACOSX/" in fileN or fileN.startswith("__MACOSX/"):
+			self.log.info("Have apple bullshit files. Removing")
+			return True
+
+		if ".DS_Store" in fileN:
+			self.log.info("Have apple bullshit '.DS_Store' files. Removing")
+			return True
+
+		return False
+
+	def checkContents(self, fileN, fctnt):
+		'''
+		Hash `fctnt`. Returns (fileN, fctnt, fHash), or, if it's one of the bad images, the name and contents
+		of the text file that replaces it (and fHash None).
+		'''
+		fHash = hashlib.md5(fctnt).hexdigest()
+
+		# Replace bad image with a text-file with the same name, and an explanation in it.
+		if badContent.isBad(fHash):
+			self.log.info("File %s was the advert. Removing!", fileN)
+			fileN = fileN + ".deleted.txt"
+			fctnt  = "This was an advertisement. It has been automatically removed.\n"
+			fctnt += "Don't worry, there are no missing files, despite the gap in the numbering."
+			return fileN, fctnt, None
+
+		return fileN, fctnt, fHash
+
+	def scanArchive(self, archPath, fType, password="", wantHashes=True):
+		'''
+		Read every member of `archPath` once, filtering out junk files and adverts, and hashing the rest.
+
+		Returns (files, fileHashes, hadBadFile, fileCount), where `files` is the (name, contents, zipInfo) list the
+		archive should contain, `fileHashes` is a list of (name, md5 hexdigest, size) for each of the files
+		that were kept, `hadBadFile` is true if the archive needs to be rebuilt, and `fileCount` is the
+		number of files originally in the archive.
+
+		Zip members that are kept are only referenced (contents RAW_MEMBER or DECRYPT_MEMBER), so the
+		archive isn't held in memory. If `wantHashes` is false, zip members that can't be one of the bad
+		images (going by their size and CRC) aren't read at all, and `fileHashes` only covers the members
+		that were.
+		'''
 
+		files = []
+		fileHashes = []
+		hadBadFile = False
+		fileCount = 0
 
-		self.log.info("Scanning arch '%s'", archPath)
+		if fType == 'application/x-7z-compressed':
+			# Cause fuck 7z files. They're slowwwww
+			hadBadFile = True
 
-		try:
-			old_zfp = UniversalArchiveInterface.ArchiveReader(archPath)
+		if fType == 'application/x-rar':
+			# Fukkit, convert ALL THE FILES
+			hadBadFile = True
 
+		for fileN, size, crc, read, zipInfo, needsRewrite in self._iterMembers(archPath, fType, password):
+			fileCount += 1
 
-			files = []
-			hadBadFile = False
-
-			if fType == 'application/x-7z-compressed':
-				# Cause fuck 7z files. They're slowwwww
+			if needsRewrite:
 				hadBadFile = True
 
-			if fType == 'application/x-rar':
-				# Fukkit, convert ALL THE FILES
+			if self.isJunkFile(fileN):
 				hadBadFile = True
+				continue
 
+			keep = RAW_MEMBER
+			if needsRewrite:
+				keep = DECRYPT_MEMBER
 
+			if not wantHashes and zipInfo and not badContent.maybeBad(size, crc):
+				files.append((fileN, keep, zipInfo))
+				continue
 
-			for fileN, fileCtnt in old_zfp:
-				file_count += 1
-
-				if fileN.endswith("Thumbs.db"):
-					hadBadFile = True
-					self.log.info("Had windows 'Thumbs.db' file. Removing")
-					continue
+			fctnt = read()
+			fileN, fctnt, fHash = self.checkContents(fileN, fctnt)
+			if fHash is None:
+				hadBadFile = True
+				files.append((fileN, fctnt, zipInfo))
+			else:
+				fileHashes.append((fileN, fHash, len(fctnt)))
+				files.append((fileN, keep if zipInfo else fctnt, zipInfo))
+
+		return files, fileHashes, hadBadFile, fileCount
+
+	def _zipPath(self, archPath):
+		if not archPath.endswith(".zip"):
+			archPath = os.path.splitext(archPath)[0]
+			archPath += ".zip"
+		return archPath
+
+	def _replacedArchive(self, origPath, archPath):
+		if origPath != archPath:
+			os.remove(origPath)
+			for proc in self.proc:
+				proc.updatePath(origPath, archPath)
+
+	# Write `files` (from scanArchive()) out as a new zip (replacing `archPath`, or alongside it with a
+	# .zip extension if it's not already a zip). Members are written one at a time, re-reading the ones
+	# that weren't kept in memory from the source zip. Returns the path of the new archive.
+	def rebuildArchive(self, archPath, files, password=""):
+		origPath = archPath
+		archPath = self._zipPath(archPath)
 
-				if "/__MACOSX/" in fileN or fileN.startswith("__MACOSX/"):
-					hadBadFile = True
-					self.log.info("Have apple bullshit files. Removing")
-					continue
+		self.log.info("Rebuilding zip as '%s'.", archPath)
+		rewriter = ArchiveRewriter(archPath)
+		srcZip = None
+		try:
+			with open(origPath, "rb") as srcFp:
+				for fileN, contents, zipInfo in files:
+					dateTime = zipInfo.date_time if zipInfo else None
+					if contents is RAW_MEMBER:
+						rewriter.copyRaw(srcFp, zipInfo)
+					elif contents is DECRYPT_MEMBER:
+						if not srcZip:
+							srcZip = zipfile.ZipFile(origPath, "r")
+							if password:
+								srcZip.setpassword(password.encode("ascii"))
+						with srcZip.open(zipInfo) as memberFp:
+							rewriter.writeStream(fileN, memberFp, dateTime, zipInfo.file_size)
+					else:
+						rewriter.writeBytes(fileN, contents, dateTime)
+		except:
+			rewriter.abort()
+			raise
+		finally:
+			if srcZip:
+				srcZip.close()
+
+		rewriter.commit()
+		self._replacedArchive(origPath, archPath)
+		return archPath
+
+	def _memberDateTimes(self, archPath, fType):
+		# The archive reader doesn't expose timestamps, so get them from the rar directory, if we can.
+		if fType != 'application/x-rar':
+			return {}
+		try:
+			rfp = rarfile.RarFile(archPath)
+			try:
+				return {info.filename : info.date_time for info in rfp.infolist()}
+			finally:
+				rfp.close()
+		except Exception:
+			return {}
+
+	def convertArchive(self, archPath, fType):
+		'''
+		Convert a rar/7z archive to a zip (removing junk files and adverts along the way), streaming
+		each member straight into the new archive as it's read.
+		Returns (archPath, fileHashes, fileCount), like _cleanArchive().
+		'''
+		origPath = archPath
+		archPath = self._zipPath(archPath)
+		dateTimes = self._memberDateTimes(origPath, fType)
 
-				if ".DS_Store" in fileN:
-					hadBadFile = True
-					self.log.info("Have apple bullshit '.DS_Store' files. Removing")
+		self.log.info("Converting archive to zip as '%s'.", archPath)
+		fileHashes = []
+		fileCount = 0
+		rewriter = ArchiveRewriter(archPath)
+		try:
+			for fileN, dummy_size, dummy_crc, read, dummy_zipInfo, dummy_needsRewrite in self._iterMembers(origPath, fType, ""):
+				fileCount += 1
+				if self.isJunkFile(fileN):
 					continue
 
-				fctnt = fileCtnt.read()
+				dateTime = dateTimes.get(fileN)
+				fileN, fctnt, fHash = self.checkContents(fileN, read())
+				if fHash:
+					fileHashes.append((fileN, fHash, len(fctnt)))
+				rewriter.writeBytes(fileN, fctnt, dateTime)
+		except:
+			rewriter.abort()
+			raise
 
+		rewriter.commit()
+		self._replacedArchive(origPath, archPath)
+		return archPath, fileHashes, fileCount
 
-				md5 = hashlib.md5()
-				md5.update(fctnt)
+	def checkIsArchive(self, archPath, fType):
+		if not fType == 'application/zip' and \
+		   not fType == 'application/x-rar' and \
+		   not fType == 'application/x-7z-compressed':
+			raise NotAnArchive("Trying to clean a file that is not a zip/rar/7z archive! File=%s" % archPath)
 
-				# Replace bad image with a text-file with the same name, and an explanation in it.
-				if md5.hexdigest() in self.badHashes:
-					self.log.info("File %s was the advert. Removing!", fileN)
-					fileN = fileN + ".deleted.txt"
-					fctnt  = "This was an advertisement. It has been automatically removed.\n"
-					fctnt += "Don't worry, there are no missing files, despite the gap in the numbering."
+	# So starkana, in an impressive feat of douchecopterness, inserts an annoying self-promotion image
+	# in EVERY manga archive the serve. Furthermore, they insert it in the MIDDLE of the manga.
+	# Therefore, this function edits the zip and removes this stupid annoying file.
+	def cleanZip(self, archPath, fType=None, password=""):
+		archPath, dummy_hashes, fileCount = self._cleanArchive(archPath, fType, password, wantHashes=False)
+		return archPath, fileCount
 
-					hadBadFile = True
+	def _cleanArchive(self, archPath, fType=None, password="", wantHashes=True):
 
-				files.append((fileN, fctnt))
+		if not os.path.exists(archPath):
+			raise ValueError("Trying to clean non-existant file?")
 
-			old_zfp.close()
+		if fType is None:
+			fType = self.getFileType(archPath)
+		self.checkIsArchive(archPath, fType)
 
-			# only replace the file if we need to
-			if hadBadFile:
-				# Now, recreate the zip file without the ad
-				if not archPath.endswith(".zip"):
+		self.log.info("Scanning arch '%s'", archPath)
 
-					archPath = os.path.splitext(archPath)[0]
-					archPath += ".zip"
+		try:
+			if fType != 'application/zip':
+				# Always converted, so that's done in the same pass as the scan.
+				return self.convertArchive(archPath, fType)
 
-				self.log.info("Had advert. Rebuilding zip as '%s'.", archPath)
-				new_zfp = zipfile.ZipFile(archPath, "w")
-				for fileInfo, contents in files:
-					new_zfp.writestr(fileInfo, contents)
-				new_zfp.close()
+			files, fileHashes, hadBadFile, fileCount = self.scanArchive(archPath, fType, password, wantHashes)
 
-				if origPath != archPath:
-					os.remove(origPath)
-					for proc in self.proc:
-						proc.updatePath(origPath, archPath)
+			# only replace the file if we need to
+			if hadBadFile:
+				# Now, recreate the zip file without the ad (or password, etc...)
+				self.log.info("Had advert, junk files or encryption.")
+				archPath = self.rebuildArchive(archPath, files, password)
 
 			else:
 				self.log.info("No offending contents. No changes made to file.")
@@ -182,7 +523,7 @@ class ArchCleaner(object):
 				self.log.error(line)
 			raise DamagedArchive()
 
-		return archPath, file_count
+		return archPath, fileHashes, fileCount
 
 
 	# Rebuild zipfile `zipPath` that has a password as a non-password protected zip
@@ -245,37 +586,40 @@ class ArchCleaner(object):
 		new_zfp.close()
 
 
-	# Process a newly downloaded archive. If deleteDups is true, and the archive is duplicated, it is deleted.
-	# If includePHash is true as well, the duplicate search is done using phashes of the images, in addition
-	# to just raw file-hashing.
-	def processNewArchive(self, archPath, passwd=""):
-		if magic.from_file(archPath, mime=True).decode("ascii") == 'application/zip':
-			self.unprotectZip(archPath, passwd)
-		elif magic.from_file(archPath, mime=True).decode("ascii") == 'application/x-rar':
-			pass
-		else:
+	# Process a newly downloaded archive: Strip the password (if any), remove junk files and adverts, and hash the
+	# contents, all in one read.
+	# Returns (tags, archPath, fileHashes). `archPath` may have changed (rar -> zip conversion).
+	# `fileHashes` is a list of (internal path, md5, size) for the archive's contents, or None if the
+	# archive couldn't be processed.
+	def ingestArchive(self, archPath, passwd=""):
+		fType = self.getFileType(archPath)
+		if fType != 'application/zip' and fType != 'application/x-rar':
 			self.log.error("ArchCleaner called on file that isn't a rar or zip!")
 			self.log.error("Called on file %s", archPath)
 			self.log.error("Specified password '%s'", passwd)
-			self.log.error("Inferred file type %s", magic.from_file(archPath, mime=True).decode("ascii"))
+			self.log.error("Inferred file type %s", fType)
 			raise NotAnArchive("ArchCleaner called on file that isn't a rar or zip!")
 
 		# ArchPath will convert from rar to zip if needed, and returns the name of the resulting
 		# file in either case
 		try:
-			archPath, filecount = self.cleanZip(archPath)
-			if filecount <= 2:
-				return "fewfiles", archPath
-			return "", archPath
+			archPath, fileHashes, fileCount = self._cleanArchive(archPath, fType=fType, password=passwd)
+			if fileCount <= 2:
+				return "fewfiles", archPath, fileHashes
+			return "", archPath, fileHashes
 		except (zipfile.BadZipFile, rarfile.BadRarFile, DamagedArchive, NotAnArchive):
 			self.log.error("Ignoring archive because it appears damaged.")
-			return "damaged", archPath
+			return "damaged", archPath, None
 
 		except:
 			self.log.error("Unknown error??")
 			for line in traceback.format_exc().split("\n"):
 				self.log.error(line)
-			return "damaged", archPath
+			return "damaged", archPath, None
+
+	def processNewArchive(self, archPath, passwd=""):
+		tags, archPath, dummy_hashes = self.ingestArchive(archPath, passwd)
+		return tags, archPath
 
 
 
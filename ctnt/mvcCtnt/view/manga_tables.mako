@@ -24,6 +24,9 @@ import sql.operators as sqlo
 
 import functools
 import operator as opclass
+import logging
+
+logger = logging.getLogger("Main.WebSrv")
 
 def compactDateStr(dateStr):
 	dateStr = dateStr.replace("months", "mo")
@@ -232,7 +235,7 @@ colours = {
 	if downloadPath and fileName:
 		filePath = os.path.join(downloadPath, fileName)
 		if "=0=" in downloadPath:
-			if os.path.exists(filePath):
+			if nt.fileMetaCache.exists(downloadPath, fileName):
 				locationColour = colours["no match"]
 			else:
 				locationColour = colours["moved"]
@@ -263,7 +266,7 @@ colours = {
 	toolTip += "dlState: " + str(dlState) + "<br>"
 	toolTip += "tags: " + str(tags) + "<br>"
 	toolTip += "Source: " + str(sourceSite) + "<br>"
-	if os.path.exists(filePath):
+	if downloadPath and fileName and nt.fileMetaCache.exists(downloadPath, fileName):
 		toolTip += "File found."
 	else:
 		toolTip += "File is missing!"
@@ -380,7 +383,9 @@ colours = {
 
 	kwargs.setdefault("flags",          '')        # Filter by flag
 	kwargs.setdefault("limit",          100)       # Number of rows in generated table
-	kwargs.setdefault("offset",         0)         # Shitty pagination system (TODO: Proper persistent cursors!)
+	kwargs.setdefault("before",         None)      # Keyset pagination. Only return items older then this cursor (see mangaQuery.makeCursor())
+	kwargs.setdefault("after",          None)      # Keyset pagination. Only return items newer then this cursor.
+	kwargs.setdefault("pageInfo",       None)      # If a dict is passed, the cursors for the 'prev' and 'next' pages are put in it.
 	kwargs.setdefault("distinct",       False)     # Limit results to one item per distinct series.
 	kwargs.setdefault("tableKey",       None)      # Limit results to source of key `tableKey`
 	kwargs.setdefault("seriesName",     None)      # Limit items to series of name `seriesName`. Filtered through MU canonizer.
@@ -408,6 +413,7 @@ colours = {
 
 
 	print("Have data. Rendering.")
+	nt.fileMetaCache.resetRequestStats()
 	%>
 
 	<table border="1px" style="width: 100%;">
@@ -426,6 +432,9 @@ colours = {
 		% endfor
 
 	</table>
+	<%
+	logger.debug("Rendered %s rows. File metadata: %s", len(tblCtntArr), nt.fileMetaCache.getRequestStats())
+	%>
 </%def>
 
 
@@ -476,9 +485,8 @@ colours = {
 	else:
 		try:
 			filePath = os.path.join(downloadPath, fileName)
-			if os.path.exists(filePath):
-				fSize = os.path.getsize(filePath)
-			else:
+			fSize = nt.fileMetaCache.getSize(downloadPath, fileName)
+			if fSize is None:
 				fSize = -2
 		except OSError:
 			fSize = -1
@@ -608,7 +616,7 @@ colours = {
 </%def>
 
 
-<%def name="genPronTable(siteSource=None, limit=100, offset=0, tagsFilter=None, seriesFilter=None, getErrored=False, originTrigram=None)">
+<%def name="genPronTable(siteSource=None, limit=100, offset=0, tagsFilter=None, tagsAnyFilter=None, seriesFilter=None, getErrored=False, originTrigram=None)">
 
 	<%
 
@@ -618,6 +626,7 @@ colours = {
 		hentaiCols,
 		tableKey      = siteSource,
 		tagsFilter    = tagsFilter,
+		tagsAnyFilter = tagsAnyFilter,
 		seriesFilter  = seriesFilter,
 		limit         = limit,
 		offset        = offset,
@@ -640,7 +649,7 @@ colours = {
 		cur.execute(query, params)
 		tblCtntArr = cur.fetchall()
 
-
+	nt.fileMetaCache.resetRequestStats()
 	%>
 	% if tblCtntArr:
 		<table border="1px">
@@ -662,6 +671,9 @@ colours = {
 			% endfor
 
 		</table>
+		<%
+		logger.debug("Rendered %s rows. File metadata: %s", len(tblCtntArr), nt.fileMetaCache.getRequestStats())
+		%>
 	% else:
 		<div class="errorPattern">No items!</div>
 	% endif
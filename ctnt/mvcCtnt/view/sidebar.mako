@@ -9,12 +9,15 @@ import time
 
 import statusManager as sm
 import nameTools as nt
+import fragmentCache
 
 FAILED = -1
 QUEUED = 0
 DLING  = 1
 DNLDED = 2
 
+SIDEBAR_TTL = 30
+
 %>
 <%namespace name="sidebar"   file="/model/sidebar.mako"/>
 <%namespace name="utilities" file="/model/utilities.mako"/>
@@ -25,8 +28,9 @@ DNLDED = 2
 
 	<%
 
-	itemCountsDict  = sidebar.fetchSidebarCounts(sqlConnection)
-	normalPlug, adultPlug = sidebar.fetchSidebarPluginStatus(sqlConnection)
+	# The counts and plugin states are shared by every page, so they're only re-queried every SIDEBAR_TTL seconds.
+	itemCountsDict  = fragmentCache.fragment("sidebar-counts", SIDEBAR_TTL, lambda: sidebar.fetchSidebarCounts(sqlConnection), tags=("status", ))
+	normalPlug, adultPlug = fragmentCache.fragment("sidebar-plugins", SIDEBAR_TTL, lambda: sidebar.fetchSidebarPluginStatus(sqlConnection), tags=("status", ))
 
 	randomLink      = sidebar.fetchRandomLink()
 
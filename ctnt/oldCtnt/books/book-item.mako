@@ -515,7 +515,7 @@ startTime = time.time()
 						description = ''
 				%>
 				<div style='display: inline-block;'>
-					<a href='/books/cover/${cid}'><img src='/books/cover/${cid}' style='max-width: 100px;' alt='${description}'></a>
+					<a href='/books/cover/${cid}'><img src='/books/cover/${cid}?size=thumb' style='max-width: 100px;' alt='${description}'></a>
 					## ${cover}
 				</div>
 			% endfor
@@ -28,6 +28,7 @@ startTime = time.time()
 import time
 import settings
 import os
+import fragmentCache
 
 
 %>
@@ -45,7 +46,18 @@ import os
 				<div id='mangatable'>
 					<ul>
 						<li><a href="/dbg/nt">NameTools State Dump</a></li>
+						<li><a href="/dbg/queries">Database Query Timing</a></li>
 					</ul>
+					## The flush is a POST, so prefetching or crawling the debug index doesn't clear the cache.
+					<form method="post" action="/dbg/">
+						<input type="submit" name="flushFragments" value="Flush Cached Page Fragments">
+					</form>
+					<%
+					if request.method == "POST" and "flushFragments" in request.POST:
+						fragmentCache.fragmentCache.clear()
+					fragStats = fragmentCache.fragmentCache.getStats()
+					%>
+					Fragment cache: ${fragStats["items"]} items, ${fragStats["hits"]} hits, ${fragStats["misses"]} misses.
 				</div>
 			</div>
 		</div>
@@ -0,0 +1,136 @@
+## -*- coding: utf-8 -*-
+<!DOCTYPE html>
+
+
+
+<%
+startTime = time.time()
+# print("Rendering begun")
+%>
+
+
+<%!
+import time
+import settings
+import os
+import dbTiming
+import dbPool
+
+%>
+<%namespace name="tableGenerators" file="/gentable.mako"/>
+<%namespace name="sideBar"         file="/gensidebar.mako"/>
+<%namespace name="ut"              file="/utilities.mako"/>
+<%namespace name="ap"              file="/activePlugins.mako"/>
+
+
+<%def name="genPageTable()">
+	<%
+	pages = dbTiming.queryStats.getPageStats()[:100]
+	%>
+	<table>
+		<tr>
+			<th>Page</th>
+			<th>Requests</th>
+			<th>Queries</th>
+			<th>Total DB Time</th>
+			<th>Mean DB Time</th>
+			<th>Max DB Time</th>
+		</tr>
+		% for page, requests, queries, totalTime, maxTime in pages:
+			<tr>
+				<td>${page}</td>
+				<td>${requests}</td>
+				<td>${queries}</td>
+				<td>${"%0.3f" % totalTime}</td>
+				<td>${"%0.3f" % (totalTime / requests)}</td>
+				<td>${"%0.3f" % maxTime}</td>
+			</tr>
+		% endfor
+	</table>
+</%def>
+
+<%def name="genSlowQueryTable()">
+	<table>
+		<tr>
+			<th>Time</th>
+			<th>Rows</th>
+			<th>Page</th>
+			<th>When</th>
+			<th>Query</th>
+		</tr>
+		% for duration, rows, query, page, when in dbTiming.queryStats.getSlowQueries():
+			<tr>
+				<td>${"%0.3f" % duration}</td>
+				<td>${rows}</td>
+				<td>${page}</td>
+				<td>${ut.timeAgo(when)}</td>
+				<td><code>${query | h}</code></td>
+			</tr>
+		% endfor
+	</table>
+</%def>
+
+<%
+if "reset" in request.params:
+	dbTiming.queryStats.reset()
+
+poolStats = dbPool.pool.getStats()
+%>
+
+<html>
+	<head>
+		<title>WAT WAT IN THE BATT</title>
+
+		${ut.headerBase()}
+
+
+	</head>
+
+
+
+
+
+
+
+	<body>
+		<div>
+			${sideBar.getSideBar(sqlCon)}
+			<div class="maindiv">
+
+				<div class="subdiv skId">
+					<div class="contentdiv">
+						<h3>Database query timing</h3>
+						Since ${ut.timeAgo(dbTiming.queryStats.since)} ago. <a href="/dbg/queries?reset">Reset</a><br>
+						Connection pool: ${poolStats['checkedOut']} of ${poolStats['maxConn']} checked out,
+						${"%0.3f" % poolStats['waitMean']} mean / ${"%0.3f" % poolStats['waitMax']} max seconds waiting for a connection.
+
+						<h3>DB time by page</h3>
+						<div id='mangatable'>
+							${genPageTable()}
+						</div>
+
+						<h3>Slowest queries</h3>
+						<div id='mangatable'>
+							${genSlowQueryTable()}
+						</div>
+					</div>
+				</div>
+
+
+			</div>
+		</div>
+
+
+		<%
+		fsInfo = os.statvfs(settings.mangaFolders[1]["dir"])
+		stopTime = time.time()
+		timeDelta = stopTime - startTime
+		%>
+
+		<p>
+			This page rendered in ${timeDelta} seconds.<br>
+			Disk = ${int((fsInfo.f_bsize*fsInfo.f_bavail) / (1024*1024))/1000.0} GB of  ${int((fsInfo.f_bsize*fsInfo.f_blocks) / (1024*1024))/1000.0} GB Free.
+		</p>
+
+	</body>
+</html>
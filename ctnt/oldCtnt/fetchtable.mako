@@ -6,14 +6,14 @@
 <%namespace name="ap"              file="activePlugins.mako"/>
 
 
-<%def name="getMangaTable(tableKey=None, distinct=True, limit=200, boldNew=True, offset=0)">
+<%def name="getMangaTable(tableKey=None, distinct=True, limit=200, boldNew=True, before=None, after=None, pageInfo=None)">
 	<%
 	# You can't have 'ap.attr.inHomepageMangaTable' as the default value in a mako function, apparently
 	if tableKey == None:
 		tableKey = ap.attr.inHomepageMangaTable
 	%>
 	${tableGenerators.genLegendTable()}
-	${tableGenerators.genMangaTable(tableKey=tableKey, distinct=distinct, limit=limit, offset=offset, boldNew=boldNew)}
+	${tableGenerators.genMangaTable(tableKey=tableKey, distinct=distinct, limit=limit, before=before, after=after, pageInfo=pageInfo, boldNew=boldNew)}
 
 </%def>
 
@@ -9,7 +9,11 @@ from babel.dates import format_timedelta
 
 import statusManager as sm
 import nameTools as nt
+import fragmentCache
 
+# The links only change when the plugin list does (which needs a restart), so this
+# is mostly just to keep the list from being rebuilt every request.
+SIDEBAR_TTL = 60*10
 
 %>
 
@@ -37,6 +41,19 @@ import nameTools as nt
 				<li><a href="/reader2/browse/">Reader</a>
 				<hr>
 				<li>${randomLink}
+				<%
+				whitelisted = ut.ip_in_whitelist()
+				%>
+				${fragmentCache.fragment(("sidebar-links", whitelisted), SIDEBAR_TTL, lambda: capture(sideBarLinks, whitelisted))}
+			</ul>
+		</div>
+		<br>
+
+	</div>
+
+</%def>
+
+<%def name="sideBarLinks(whitelisted)">
 				<hr>
 				<hr>
 				<li><a href="/bmUpdates">Baka Manga</a>
@@ -69,7 +86,7 @@ import nameTools as nt
 				% endfor
 
 				<hr>
-				% if ut.ip_in_whitelist():
+				% if whitelisted:
 					<hr>
 					<li><a href="/itemsPron"><b>All Pron</b></a>
 					% for item in [item for item in ap.attr.sidebarItemList if item['type'] == "Porn"]:
@@ -87,10 +104,4 @@ import nameTools as nt
 				<li><a href="/errorLog">Scraper Logs</a>
 
 
-			</ul>
-		</div>
-		<br>
-
-	</div>
-
 </%def>
@@ -17,6 +17,8 @@ import os.path
 import urllib.parse
 import settings
 import nameTools as nt
+import mangaQuery
+import fragmentCache
 import uuid
 import time
 import sql
@@ -24,6 +26,12 @@ import sql.operators as sqlo
 
 import functools
 import operator as opclass
+import logging
+
+logger = logging.getLogger("Main.WebSrv")
+
+# The legend never changes, so it only needs rendering once in a while.
+LEGEND_TTL = 60*60
 
 def compactDateStr(dateStr):
 	dateStr = dateStr.replace("months", "mo")
@@ -121,6 +129,18 @@ seriesCols = (
 
 
 
+# python-sql doesn't have the postgres array operators.
+class ArrayContains(sqlo.BinaryOperator):
+	__slots__ = ()
+	_operator = '@>'
+
+class ArrayOverlaps(sqlo.BinaryOperator):
+	__slots__ = ()
+	_operator = '&&'
+
+def tagArray(tags):
+	return sql.Cast(sql.Literal([tag.lower() for tag in tags]), 'TEXT[]')
+
 def buildQuery(srcTbl, cols, **kwargs):
 
 	orOperators = []
@@ -135,11 +155,14 @@ def buildQuery(srcTbl, cols, **kwargs):
 			raise ValueError("Invalid table-key type! Type: '%s'" % type(kwargs['tableKey']))
 
 
+	# Tag filters are exact matches against the GIN-indexed `tagArr` copy of the tags (see
+	# schemaUpdater/tagArrays.py). Items must have all the tags in `tagsFilter`, and at least
+	# one of the tags in `tagsAnyFilter`.
 	if "tagsFilter" in kwargs and kwargs['tagsFilter']:
-		for tag in kwargs['tagsFilter']:
+		andOperators.append(ArrayContains(srcTbl.tagarr, tagArray(kwargs['tagsFilter'])))
 
-			match = '%{key}%'.format(key=tag.lower())
-			andOperators.append(sqlo.Like(srcTbl.tags, match))
+	if "tagsAnyFilter" in kwargs and kwargs['tagsAnyFilter']:
+		andOperators.append(ArrayOverlaps(srcTbl.tagarr, tagArray(kwargs['tagsAnyFilter'])))
 
 	if "seriesFilter" in kwargs and kwargs['seriesFilter']:
 		for key in kwargs['seriesFilter']:
@@ -243,85 +266,35 @@ colours = {
 
 		# flags          = '',
 		# limit          = 100,
-		# offset         = 0,
+		# before         = None,
+		# after          = None,
 		# distinct       = False,
 		# tableKey       = None,
 		# seriesName     = None,
 		# getErrored     = False,
 		# includeUploads = False
 
-		start = time.time()
-
-		if kwargs['distinct'] and kwargs['seriesName']:
-			raise ValueError("Cannot filter for distinct on a single series!")
-
 		if kwargs['flags']:
 			raise ValueError("TODO: Implement flag filtering!")
 
-		if kwargs['seriesName']:
-			# Canonize seriesName if it's not none
-			kwargs['seriesName'] = nt.getCanonicalMangaUpdatesName(kwargs['seriesName'])
-
-		query = buildQuery(mangaTable, mangaCols, tableKey=kwargs['tableKey'], seriesName=kwargs['seriesName'])
-
-		if kwargs['getErrored']:
-			if query.where:
-				query.where &= mangaTable.dlstate < 1
-			else:
-				query.where  = mangaTable.dlstate < 1
-
-		elif not kwargs['includeUploads']:
-			if query.where:
-				query.where &= mangaTable.dlstate < 3
-			else:
-				query.where  = mangaTable.dlstate < 3
-
-
-
-		anonCur = sqlCon.cursor()
-		anonCur.execute("BEGIN;")
-
-		cur = sqlCon.cursor(name='test-cursor-1')
-		cur.arraysize = 250
-
-
-		query, params = tuple(query)
-		cur.execute(query, params)
-
-		if not kwargs['limit']:
-			retRows = cur.fetchall()
-		else:
-			seenItems = []
-			rowsBuf = cur.fetchmany()
-
-			rowsRead = 0
-
-			while len(seenItems) < kwargs['offset']:
-				if not rowsBuf:
-					rowsBuf = cur.fetchmany()
-				if not rowsBuf:
-					break
-				row = rowsBuf.pop(0)
-				rowsRead += 1
-				if row[6] not in seenItems or not kwargs['distinct']:
-					seenItems.append(row[6])
-
-			retRows = []
-
-			while len(seenItems) < kwargs['offset']+kwargs['limit']:
-				if not rowsBuf:
-					rowsBuf = cur.fetchmany()
-				if not rowsBuf:
-					break
-				row = rowsBuf.pop(0)
-
-				rowsRead += 1
-				if (row[6] not in seenItems and "deleted" not in str(row[11])) or not kwargs['distinct']:
-					retRows.append(row)
-					seenItems.append(row[6])
-
-		cur.close()
-		anonCur.execute("COMMIT;")
+		with sqlCon.cursor() as cur:
+			retRows = mangaQuery.fetchMangaItems(cur,
+					limit          = kwargs['limit'],
+					before         = kwargs['before'],
+					after          = kwargs['after'],
+					distinct       = kwargs['distinct'],
+					tableKey       = kwargs['tableKey'],
+					seriesName     = kwargs['seriesName'],
+					getErrored     = kwargs['getErrored'],
+					includeUploads = kwargs['includeUploads'])
+		sqlCon.commit()
+
+		# Let the caller know where the adjacent pages start, for the prev/next links.
+		if kwargs['pageInfo'] is not None and kwargs['limit'] and retRows:
+			if len(retRows) >= kwargs['limit'] or kwargs['after']:
+				kwargs['pageInfo']['next'] = mangaQuery.makeCursor(retRows[-1])
+			if kwargs['before'] or (kwargs['after'] and len(retRows) >= kwargs['limit']):
+				kwargs['pageInfo']['prev'] = mangaQuery.makeCursor(retRows[0])
 
 		return retRows
 	%>
@@ -391,7 +364,7 @@ colours = {
 	if downloadPath and fileName:
 		filePath = os.path.join(downloadPath, fileName)
 		if "=0=" in downloadPath:
-			if os.path.exists(filePath):
+			if nt.fileMetaCache.exists(downloadPath, fileName):
 				locationColour = colours["no match"]
 			else:
 				locationColour = colours["moved"]
@@ -422,7 +395,7 @@ colours = {
 	toolTip += "dlState: " + str(dlState) + "<br>"
 	toolTip += "tags: " + str(tags) + "<br>"
 	toolTip += "Source: " + str(sourceSite) + "<br>"
-	if os.path.exists(filePath):
+	if downloadPath and fileName and nt.fileMetaCache.exists(downloadPath, fileName):
 		toolTip += "File found."
 	else:
 		toolTip += "File is missing!"
@@ -539,7 +512,9 @@ colours = {
 
 	kwargs.setdefault("flags",          '')        # Filter by flag
 	kwargs.setdefault("limit",          100)       # Number of rows in generated table
-	kwargs.setdefault("offset",         0)         # Shitty pagination system (TODO: Proper persistent cursors!)
+	kwargs.setdefault("before",         None)      # Keyset pagination. Only return items older then this cursor (see mangaQuery.makeCursor())
+	kwargs.setdefault("after",          None)      # Keyset pagination. Only return items newer then this cursor.
+	kwargs.setdefault("pageInfo",       None)      # If a dict is passed, the cursors for the 'prev' and 'next' pages are put in it.
 	kwargs.setdefault("distinct",       False)     # Limit results to one item per distinct series.
 	kwargs.setdefault("tableKey",       None)      # Limit results to source of key `tableKey`
 	kwargs.setdefault("seriesName",     None)      # Limit items to series of name `seriesName`. Filtered through MU canonizer.
@@ -567,6 +542,7 @@ colours = {
 
 
 	print("Have data. Rendering.")
+	nt.fileMetaCache.resetRequestStats()
 	%>
 
 	<table border="1px" style="width: 100%;">
@@ -585,6 +561,9 @@ colours = {
 		% endfor
 
 	</table>
+	<%
+	logger.debug("Rendered %s rows. File metadata: %s", len(tblCtntArr), nt.fileMetaCache.getRequestStats())
+	%>
 </%def>
 
 
@@ -622,9 +601,8 @@ colours = {
 	else:
 		try:
 			filePath = os.path.join(row['downloadPath'], row['fileName'])
-			if os.path.exists(filePath):
-				fSize = os.path.getsize(filePath)
-			else:
+			fSize = nt.fileMetaCache.getSize(row['downloadPath'], row['fileName'])
+			if fSize is None:
 				fSize = -2
 		except OSError:
 			fSize = -1
@@ -779,7 +757,7 @@ colours = {
 	%>
 </%def>
 
-<%def name="genPronTable(siteSource=None, limit=100, offset=0, tagsFilter=None, seriesFilter=None, getErrored=False, originTrigram=None)">
+<%def name="genPronTable(siteSource=None, limit=100, offset=0, tagsFilter=None, tagsAnyFilter=None, seriesFilter=None, getErrored=False, originTrigram=None)">
 
 	<%
 
@@ -793,6 +771,7 @@ colours = {
 		cols,
 		tableKey      = siteSource,
 		tagsFilter    = tagsFilter,
+		tagsAnyFilter = tagsAnyFilter,
 		seriesFilter  = seriesFilter,
 		limit         = limit,
 		offset        = offset,
@@ -816,6 +795,7 @@ colours = {
 
 	data = unpackHQueryRet(tblCtntArr)
 	## print(data)
+	nt.fileMetaCache.resetRequestStats()
 	%>
 	% if data:
 		<table border="1px">
@@ -841,6 +821,9 @@ colours = {
 			% endfor
 
 		</table>
+		<%
+		logger.debug("Rendered %s rows. File metadata: %s", len(data), nt.fileMetaCache.getRequestStats())
+		%>
 	% else:
 		<div class="errorPattern">No items!</div>
 	% endif
@@ -1094,6 +1077,11 @@ colours = {
 ##
 
 <%def name="genLegendTable(pron=False, hideSource=False)">
+	## The legend only changes when the plugin list does.
+	${fragmentCache.fragment(("legend", pron, hideSource), LEGEND_TTL, lambda: capture(renderLegendTable, pron, hideSource))}
+</%def>
+
+<%def name="renderLegendTable(pron, hideSource)">
 	<%
 
 	limitedColours = {
@@ -22,6 +22,7 @@ import os.path
 import re
 import urllib.parse
 import nameTools as nt
+import schemaUpdater.tagCountTracker as tct
 
 
 %>
@@ -66,19 +67,9 @@ else:
 <%def name="getTagTable()">
 	<%
 
-	cur.execute('SELECT tags FROM HentaiItems;')
-	tagRows = cur.fetchall()
-	tags = {}
-	tagRows = [tag for item in tagRows if item[0] != None for tag in item[0].split()]
-	for item in tagRows:
-		if item in tags:
-			tags[item] += 1
-		else:
-			tags[item] = 1
-
-	tagQuant = sum(tags.values())
-	tags = [[v, k] for k, v in tags.items()]
-	tags.sort(reverse=True)
+	# Counts are maintained by triggers on the items table (see schemaUpdater/tagCountTracker.py).
+	tags = [[quantity, tag] for tag, quantity in tct.getTagCounts(cur, "HentaiItems")]
+	tagQuant = sum(quantity for quantity, dummy_tag in tags)
 	%>
 	<div class="contentdiv">
 		<h3>Pron Tags (by frequency)</h3>
@@ -26,31 +26,19 @@ import urllib.parse
 
 
 limit = 200
-pageNo = 0
 
+# Keyset pagination. `before`/`after` are cursors from the adjacent page, filled in by the table generator.
+before = request.params.get("before", None)
+after  = request.params.get("after", None)
+pageInfo = {}
 
-if "page" in request.params:
-	try:
-		pageNo = int(request.params["page"])-1
-	except ValueError:
-		pass
-
-if pageNo < 0:
-	pageNo = 0
-
-
-offset = limit * pageNo
-
-
-prevPage = request.params.copy();
-prevPage["page"] = pageNo
-nextPage = request.params.copy();
-nextPage["page"] = pageNo+2
-
+# Switching between distinct and non-distinct starts over from the first page.
 distinct = request.params.copy();
 distinct["distinct"] = True
+distinct.pop("before", None)
+distinct.pop("after", None)
 
-nonDistinct = request.params.copy();
+nonDistinct = distinct.copy();
 nonDistinct["distinct"] = False
 
 if "distinct" in request.params and request.params["distinct"] == "True":
@@ -111,17 +99,29 @@ else:
 					<a href="itemsManga?${urllib.parse.urlencode(distinct)}">Distinct series</a> <a href="itemsManga?${urllib.parse.urlencode(nonDistinct)}">All Items</a>
 					## ${tableGenerators.genLegendTable()}
 					## ${tableGenerators.genMangaTable(tableKey=sourceFilter, limit=limit, offset=offset, distinct=onlyDistinct)}
-					${fetchTable.getMangaTable(tableKey=sourceFilter, limit=limit, offset=offset, distinct=onlyDistinct)}
+					${fetchTable.getMangaTable(tableKey=sourceFilter, limit=limit, before=before, after=after, pageInfo=pageInfo, distinct=onlyDistinct)}
 				</div>
 
-				% if pageNo > 0:
+				% if "prev" in pageInfo:
+					<%
+					prevPage = distinct.copy()
+					prevPage["distinct"] = onlyDistinct
+					prevPage["after"] = pageInfo["prev"]
+					%>
 					<span class="pageChangeButton" style='float:left;'>
 						<a href="itemsManga?${urllib.parse.urlencode(prevPage)}">prev</a>
 					</span>
 				% endif
-				<span class="pageChangeButton" style='float:right;'>
-					<a href="itemsManga?${urllib.parse.urlencode(nextPage)}">next</a>
-				</span>
+				% if "next" in pageInfo:
+					<%
+					nextPage = distinct.copy()
+					nextPage["distinct"] = onlyDistinct
+					nextPage["before"] = pageInfo["next"]
+					%>
+					<span class="pageChangeButton" style='float:right;'>
+						<a href="itemsManga?${urllib.parse.urlencode(nextPage)}">next</a>
+					</span>
+				% endif
 
 				</div>
 		</div>
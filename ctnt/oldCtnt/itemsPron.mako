@@ -104,10 +104,14 @@ offset = limit * pageNo
 
 
 tagsFilter = None
+tagsAnyFilter = None
 seriesFilter = None
 
+# `byTag` items must all be present, `anyTag` needs at least one to match.
 if "byTag" in request.params:
 	tagsFilter = request.params.getall("byTag")
+if "anyTag" in request.params:
+	tagsAnyFilter = request.params.getall("anyTag")
 if "bySeries" in request.params:
 	seriesFilter = request.params.getall("bySeries")
 
@@ -159,7 +163,7 @@ else:
 						${key} ${request.params.getall(key)}<br>
 					% endif
 				% endfor
-				${tableGenerators.genPronTable(siteSource=sourceFilter, offset=pageNo, tagsFilter=tagsFilter, seriesFilter=seriesFilter)}
+				${tableGenerators.genPronTable(siteSource=sourceFilter, offset=pageNo, tagsFilter=tagsFilter, tagsAnyFilter=tagsAnyFilter, seriesFilter=seriesFilter)}
 			</div>
 
 			% if pageNo > 0:
@@ -26,26 +26,15 @@ import sql.conditionals
 
 
 limit = 200
-pageNo = 0
 
+# Keyset pagination. `before`/`after` are cursors from the adjacent page, filled in by the table generator.
+before = request.params.get("before", None)
+after  = request.params.get("after", None)
+pageInfo = {}
 
-if "page" in request.params:
-	try:
-		pageNo = int(request.params["page"])-1
-	except ValueError:
-		pass
-
-if pageNo < 0:
-	pageNo = 0
-
-
-offset = limit * pageNo
-
-
-prevPage = request.params.copy();
-prevPage["page"] = pageNo
-nextPage = request.params.copy();
-nextPage["page"] = pageNo+2
+baseParams = request.params.copy();
+baseParams.pop("before", None)
+baseParams.pop("after", None)
 
 
 
@@ -85,17 +74,27 @@ print("sourceFilter", sourceFilter)
 						<div class="contentdiv">
 							<h3>${sourceName}</h3>
 							${tableGenerators.genLegendTable()}
-							${tableGenerators.genMangaTable(tableKey=sourceFilter, limit=limit, offset=offset, getErrored=True)}
+							${tableGenerators.genMangaTable(tableKey=sourceFilter, limit=limit, before=before, after=after, pageInfo=pageInfo, getErrored=True)}
 						</div>
 
-						% if pageNo > 0:
+						% if "prev" in pageInfo:
+							<%
+							prevPage = baseParams.copy()
+							prevPage["after"] = pageInfo["prev"]
+							%>
 							<span class="pageChangeButton" style='float:left;'>
 								<a href="mangaError?${urllib.parse.urlencode(prevPage)}">prev</a>
 							</span>
 						% endif
-						<span class="pageChangeButton" style='float:right;'>
-							<a href="mangaError?${urllib.parse.urlencode(nextPage)}">next</a>
-						</span>
+						% if "next" in pageInfo:
+							<%
+							nextPage = baseParams.copy()
+							nextPage["before"] = pageInfo["next"]
+							%>
+							<span class="pageChangeButton" style='float:right;'>
+								<a href="mangaError?${urllib.parse.urlencode(nextPage)}">next</a>
+							</span>
+						% endif
 
 						</div>
 				</div>
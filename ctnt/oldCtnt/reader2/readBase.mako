@@ -25,6 +25,7 @@ import nameTools as nt
 import unicodedata
 import traceback
 import settings
+import renditionCache
 import urllib.parse
 import uuid
 
@@ -251,9 +252,14 @@ def dequoteDict(inDict):
 		keys = sessionArchTool.getKeys()  # Keys are already sorted
 
 
+		# Reader pages opened with `?size=small` (etc...) get downscaled page images.
+		sizeQuery = ""
+		if renditionCache.parseSize(request.params.get("size")):
+			sizeQuery = "?size=%s" % urllib.parse.quote(request.params["size"])
+
 		keyUrls = []
 		for indice in range(len(keys)):
-			keyUrls.append("'/reader2/file/%s'" % (indice))
+			keyUrls.append("'/reader2/file/%s%s'" % (indice, sizeQuery))
 
 
 	except:
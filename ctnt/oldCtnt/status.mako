@@ -13,6 +13,8 @@
 
 <%!
 import statusManager as sm
+import sessionManager
+import fragmentCache
 import nameTools as nt
 import time
 import urllib.parse
@@ -22,6 +24,9 @@ FAILED = -1
 QUEUED = 0
 DLING  = 1
 DNLDED = 2
+
+# The plugin status tables are only re-queried this often (in seconds).
+STATUS_TTL = 30
 %>
 
 
@@ -172,6 +177,23 @@ DNLDED = 2
 
 </%def>
 
+## Not part of the cached status fragment, since it's just counters in this process (and would be up to STATUS_TTL seconds stale).
+<%def name="genReaderCacheStats()">
+	<%
+	archStats   = sessionManager.archiveCache.getStats()
+	handleStats = sessionManager.archiveHandles.getStats()
+	%>
+	<div class='contentdiv'>
+		<h2>Reader cache:</h2>
+		<ul>
+			<li>Page indexes: ${archStats["indexes"]} cached, ${"%0.1f" % (archStats["indexHitRate"] * 100)}% hit rate</li>
+			<li>Pages: ${archStats["pages"]} cached (${"%0.1f" % (archStats["pageBytes"] / (1024*1024))} MB), ${"%0.1f" % (archStats["pageHitRate"] * 100)}% hit rate</li>
+			<li>Prefetched: ${archStats["prefetched"]}, ${archStats["prefetchErrors"]} errors</li>
+			<li>Archive handles: ${handleStats["inUse"]} in use, ${handleStats["idle"]} idle (${handleStats["opened"]} opened, ${handleStats["evicted"]} evicted)</li>
+		</ul>
+	</div>
+</%def>
+
 
 
 <html>
@@ -210,9 +232,8 @@ import settings
 	<div class="maindiv">
 
 		<div class="subdiv skId">
-		<%
-		genStatus(sqlCon)
-		%>
+		${fragmentCache.fragment(("status", ut.ip_in_whitelist()), STATUS_TTL, lambda: capture(genStatus, sqlCon), tags=("status", ))}
+		${genReaderCacheStats()}
 
 		</div>
 
@@ -1,29 +1,263 @@
 
+import psycopg2
 import psycopg2.pool
+import psycopg2.extensions
 import settings
 
+import os
+import time
+import threading
+import traceback
+import logging
+from contextlib import contextmanager
+
+# Default per-process pool size. Can be overridden in settings with
+# `DATABASE_POOL_SIZE`, or per-process by calling `pool.configure()`.
+DEFAULT_POOL_SIZE = 10
+
+# Connections held longer then this (in seconds) are reported as probable leaks.
+LEAK_WARN_TIME = 60 * 30
+
+# Default time (in seconds) getconn() waits for a free connection before giving up.
+# Can be overridden in settings with `DATABASE_POOL_TIMEOUT`.
+DEFAULT_CHECKOUT_TIMEOUT = 60 * 5
+
+# Connections that have sat idle in the pool longer then this are pinged before
+# being handed out.
+HEALTH_CHECK_INTERVAL = 60
+
 class ConnectionPool():
+	'''
+	Process-wide postgres connection pool.
+
+	Borg-pattern, so every instance in a process shares the same state. The
+	underlying psycopg2 pool is created lazily, and is re-created if the owning
+	process ID changes, as psycopg2 connections cannot be shared across a fork()
+	(the apscheduler ProcessPoolExecutor forks off the scraper workers).
+
+	Unlike the raw psycopg2 `ThreadedConnectionPool`, `getconn()` blocks when the pool
+	is exhausted (up to `timeout` seconds) rather then raising immediately, and the
+	time spent waiting is tracked so `max_connections` can be sized sanely.
+
+	Handles that are meant to be held for the life of an object (the per-thread
+	scraper connections, for example) should be checked out with `persistent=True`,
+	so they're not reported as leaks.
+
+	The pool can be resized with `configure()` (the web server wants more handles
+	then a single scraper process does).
+	'''
 	_shared_state = {}
 
-	_db_max_connections = 50
+	log = logging.getLogger("Main.DbPool")
 
 	def __init__(self):
 		self.__dict__ = self._shared_state
 
-		if not hasattr(self, 'connected'):
-			print("Database connection pool init!")
+		if not hasattr(self, 'initialized'):
+			self.initialized = True
+			self.poolLock    = threading.Lock()
+			self.slotFree    = threading.Condition(self.poolLock)
+			self.maxConn     = getattr(settings, "DATABASE_POOL_SIZE", DEFAULT_POOL_SIZE)
+			self.timeout     = getattr(settings, "DATABASE_POOL_TIMEOUT", DEFAULT_CHECKOUT_TIMEOUT)
+			self.dbPool      = None
+			self.ownerPid    = None
+			self.__resetState()
+
+	def __resetState(self):
+		self.reserved    = 0
+		self.checkedOut  = {}
+		self.lastUsed    = {}
+		self.stats       = {
+			'checkouts'     : 0,
+			'waitTotal'     : 0.0,
+			'waitMax'       : 0.0,
+			'timeouts'      : 0,
+			'brokenDropped' : 0,
+			'leakWarnings'  : 0,
+		}
+
+	def configure(self, maxConnections):
+		'''
+		Set the maximum pool size for this process. Can be called at any time;
+		shrinking the pool takes effect as outstanding connections are returned.
+		'''
+		with self.poolLock:
+			self.log.info("Setting connection pool size for process %s to %s", os.getpid(), maxConnections)
+			self.maxConn = maxConnections
+			if self.dbPool is not None:
+				self.dbPool.maxconn = max(self.dbPool.maxconn, maxConnections)
+			self.slotFree.notify_all()
+
+	def __checkPool(self):
+		# Must be called with poolLock held.
+		pid = os.getpid()
+		if self.dbPool is not None and self.ownerPid == pid:
+			return
+
+		if self.dbPool is not None:
+			# We've been forked. The parent's sockets are not ours to close, so
+			# just drop all references and build a new pool.
+			self.log.info("Process ID changed (%s -> %s). Rebuilding connection pool.", self.ownerPid, pid)
+			self.__resetState()
+
+		self.log.info("Database connection pool init for process %s (%s connections max)!", pid, self.maxConn)
+		# First try local socket connection, fall back to a IP-based connection.
+		# That way, if the server is local, we get the better performance of a local socket.
+		try:
+			self.dbPool = psycopg2.pool.ThreadedConnectionPool(1, self.maxConn, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+		except psycopg2.OperationalError:
+			self.dbPool = psycopg2.pool.ThreadedConnectionPool(1, self.maxConn, host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+		self.ownerPid = pid
+
+	def __isHealthy(self, conn):
+		if conn.closed:
+			return False
+
+		# Something left a transaction open. Roll it back, so the next user gets a clean handle.
+		status = conn.get_transaction_status()
+		if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+			return False
+		if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+			try:
+				conn.rollback()
+			except psycopg2.Error:
+				return False
+
+		if time.time() - self.lastUsed.get(id(conn), 0) > HEALTH_CHECK_INTERVAL:
 			try:
-				self.dbPool = psycopg2.pool.ThreadedConnectionPool(1, self._db_max_connections, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-			except psycopg2.OperationalError:
-				self.dbPool = psycopg2.pool.ThreadedConnectionPool(1, self._db_max_connections, host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+				with conn.cursor() as cur:
+					cur.execute("SELECT 1;")
+				conn.rollback()
+			except psycopg2.Error:
+				return False
+
+		return True
+
+	def getconn(self, timeout=-1, persistent=False):
+		'''
+		Check out a connection. Blocks for at most `timeout` seconds (the pool
+		default if not specified, forever if `timeout` is None) if the pool is
+		exhausted, and raises `psycopg2.pool.PoolError` if no connection became available.
+
+		`persistent` connections are expected to be held for a long time, and are
+		not reported by checkLeaks().
+		'''
+		if timeout == -1:
+			timeout = self.timeout
+		start = time.time()
+		with self.poolLock:
+			self.__checkPool()
+			while self.reserved >= self.maxConn:
+				remaining = None if timeout is None else timeout - (time.time() - start)
+				if remaining is not None and remaining <= 0:
+					self.stats['timeouts'] += 1
+					timedOut = True
+					break
+				self.slotFree.wait(remaining)
+			else:
+				timedOut = False
+				self.reserved += 1
+			dbPool = self.dbPool
+
+		if timedOut:
+			self.__reportLeaks()
+			raise psycopg2.pool.PoolError("Timed out waiting for a database connection after %s seconds!" % timeout)
+		waited = time.time() - start
+
+		try:
+			while True:
+				conn = dbPool.getconn()
+				if self.__isHealthy(conn):
+					break
+				self.log.warning("Dropping broken connection from pool!")
+				with self.poolLock:
+					self.stats['brokenDropped'] += 1
+					self.lastUsed.pop(id(conn), None)
+				dbPool.putconn(conn, close=True)
+
+		except Exception:
+			self.__releaseSlot()
+			raise
+
+		with self.poolLock:
+			self.checkedOut[id(conn)] = (time.time(), threading.current_thread().name, traceback.extract_stack(limit=8)[:-1], persistent)
+			self.stats['checkouts'] += 1
+			self.stats['waitTotal'] += waited
+			self.stats['waitMax']    = max(self.stats['waitMax'], waited)
+
+		return conn
+
+	def __releaseSlot(self):
+		with self.poolLock:
+			self.reserved -= 1
+			self.slotFree.notify()
+
+	def putconn(self, conn, close=False):
+		with self.poolLock:
+			# Connections from before a fork() belong to the parent pool. Just let them go.
+			if id(conn) not in self.checkedOut or self.ownerPid != os.getpid():
+				return
+			self.checkedOut.pop(id(conn))
+			if close or conn.closed:
+				close = True
+				self.lastUsed.pop(id(conn), None)
+			else:
+				self.lastUsed[id(conn)] = time.time()
+			dbPool = self.dbPool
+
+		try:
+			dbPool.putconn(conn, close=close)
+		finally:
+			self.__releaseSlot()
+
+	@contextmanager
+	def connection(self, commit=True, timeout=-1):
+		'''
+		Context manager that checks a connection out, and returns it to the pool
+		afterwards. The transaction is committed on a clean exit if `commit` is true,
+		and rolled back if the wrapped block raises.
+		'''
+		conn = self.getconn(timeout=timeout)
+		try:
+			yield conn
+			if commit:
+				conn.commit()
+		except Exception:
+			if not conn.closed:
+				conn.rollback()
+			raise
+		finally:
+			self.putconn(conn)
 
-			self.connected = True
+	def __reportLeaks(self):
+		now = time.time()
+		with self.poolLock:
+			held = [item for item in self.checkedOut.values() if now - item[0] > LEAK_WARN_TIME and not item[3]]
+			self.stats['leakWarnings'] += len(held)
+		for checkoutTime, threadName, stack, dummy_persistent in held:
+			self.log.warning("Connection held by thread '%s' for %0.1f seconds. Checked out at:", threadName, now - checkoutTime)
+			for line in traceback.format_list(stack):
+				for subline in line.rstrip().split("\n"):
+					self.log.warning("	%s", subline)
 
-	def getconn(self):
-		return self.dbPool.getconn()
+	def checkLeaks(self):
+		'''
+		Log any (non-persistent) connections that have been checked out for longer then LEAK_WARN_TIME.
+		'''
+		self.__reportLeaks()
 
-	def putconn(self, conn):
-		self.dbPool.putconn(conn)
+	def getStats(self):
+		'''
+		Return a snapshot of the pool usage statistics for this process.
+		'''
+		with self.poolLock:
+			ret = dict(self.stats)
+			ret['pid']        = os.getpid()
+			ret['maxConn']    = self.maxConn
+			ret['checkedOut'] = len(self.checkedOut)
+			ret['persistent'] = sum(1 for item in self.checkedOut.values() if item[3])
+		ret['waitMean'] = ret['waitTotal'] / ret['checkouts'] if ret['checkouts'] else 0.0
+		return ret
 
 
 pool = ConnectionPool()
@@ -0,0 +1,153 @@
+
+'''
+Query timing for the web-server's database connections.
+
+Each request gets it's own connection (checked out of `dbPool.pool`), wrapped
+in a TimedConnection. Every cursor it hands out records the text, duration and
+row-count of each query into the request's QueryLog. When the request finishes,
+the log is folded into the process-wide `queryStats`, which keeps the slowest
+individual queries, and per-page totals, for the debug page (`/dbg/queries`).
+'''
+
+import time
+import heapq
+import threading
+
+# Number of slowest queries kept.
+SLOW_QUERY_COUNT = 100
+
+# Max number of pages tracked in the per-page totals.
+MAX_TRACKED_PAGES = 1000
+
+# Queries are truncated to this many characters in the stats.
+MAX_QUERY_LEN = 2000
+
+def queryText(query):
+	if isinstance(query, bytes):
+		query = query.decode("utf-8", "replace")
+	elif not isinstance(query, str):
+		query = str(query)
+	query = " ".join(query.split())
+	if len(query) > MAX_QUERY_LEN:
+		query = query[:MAX_QUERY_LEN] + "..."
+	return query
+
+class QueryLog(object):
+	'''
+	The queries run for a single request.
+	'''
+	def __init__(self, page):
+		self.page    = page
+		self.queries = []
+		self.started = time.time()
+
+	def record(self, query, duration, rows):
+		self.queries.append((duration, rows, query))
+
+	def totalTime(self):
+		return sum(duration for duration, dummy_rows, dummy_query in self.queries)
+
+class TimedCursor(object):
+	'''
+	Wraps a psycopg2 cursor, timing `execute()`/`executemany()`. Everything else is passed through.
+	'''
+	def __init__(self, cursor, log):
+		self._cursor = cursor
+		self._log    = log
+
+	def _timed(self, call, query, args):
+		start = time.time()
+		try:
+			return call(query, args)
+		finally:
+			self._log.record(query, time.time() - start, self._cursor.rowcount)
+
+	def execute(self, query, args=None):
+		return self._timed(self._cursor.execute, query, args)
+
+	def executemany(self, query, argsList):
+		return self._timed(self._cursor.executemany, query, argsList)
+
+	def __getattr__(self, name):
+		return getattr(self._cursor, name)
+
+	def __iter__(self):
+		return iter(self._cursor)
+
+	def __enter__(self):
+		self._cursor.__enter__()
+		return self
+
+	def __exit__(self, *args):
+		return self._cursor.__exit__(*args)
+
+class TimedConnection(object):
+	'''
+	Wraps a psycopg2 connection, so all the cursors it creates are TimedCursor()s.
+	'''
+	def __init__(self, conn, log):
+		self.conn = conn
+		self.log  = log
+
+	def cursor(self, *args, **kwargs):
+		return TimedCursor(self.conn.cursor(*args, **kwargs), self.log)
+
+	def __getattr__(self, name):
+		return getattr(self.conn, name)
+
+class QueryStats(object):
+	'''
+	Process-wide query timing statistics.
+	'''
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self.lock:
+			# Min-heap of (duration, rows, query, page, when), so the fastest of the slow queries is the one dropped.
+			self.slowQueries = []
+			# page -> [requests, queries, total db time, max db time for a single request]
+			self.pages       = {}
+			self.since       = time.time()
+
+	def add(self, log):
+		now = time.time()
+		total = log.totalTime()
+		with self.lock:
+			for duration, rows, query in log.queries:
+				item = (duration, rows, queryText(query), log.page, now)
+				if len(self.slowQueries) < SLOW_QUERY_COUNT:
+					heapq.heappush(self.slowQueries, item)
+				elif duration > self.slowQueries[0][0]:
+					heapq.heapreplace(self.slowQueries, item)
+
+			if not log.page in self.pages:
+				if len(self.pages) >= MAX_TRACKED_PAGES:
+					# Drop the page with the least db time.
+					self.pages.pop(min(self.pages, key=lambda page: self.pages[page][2]))
+				self.pages[log.page] = [0, 0, 0.0, 0.0]
+			pageStats = self.pages[log.page]
+			pageStats[0] += 1
+			pageStats[1] += len(log.queries)
+			pageStats[2] += total
+			pageStats[3]  = max(pageStats[3], total)
+
+	def getSlowQueries(self):
+		'''
+		(duration, rows, query, page, timestamp) tuples, slowest first.
+		'''
+		with self.lock:
+			return sorted(self.slowQueries, reverse=True)
+
+	def getPageStats(self):
+		'''
+		(page, requests, queries, total db time, max db time) tuples, by total db time, descending.
+		'''
+		with self.lock:
+			ret = [(page, ) + tuple(vals) for page, vals in self.pages.items()]
+		ret.sort(key=lambda item: item[3], reverse=True)
+		return ret
+
+queryStats = QueryStats()
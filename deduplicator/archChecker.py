@@ -2,9 +2,10 @@
 
 import os.path
 import logging
-import rpyc
 import settings
 
+import deduplicator.dedupClient
+
 
 PHASH_DISTANCE_THRESHOLD = 4
 
@@ -14,7 +15,8 @@ class ArchChecker(object):
 	def __init__(self, archPath, phashDistance=PHASH_DISTANCE_THRESHOLD, pathFilter=None, lock=True):
 		self.log = logging.getLogger("Main.Deduper")
 
-		self.remote = rpyc.connect("localhost", 12345)
+		# Process-wide, pooled connection to the dedup server, rather then a new connection per archive.
+		self.client = deduplicator.dedupClient.client
 
 		if not pathFilter:
 			pathFilter = ['']
@@ -30,9 +32,14 @@ class ArchChecker(object):
 
 		self.arch = archPath
 
-	def process(self, moveToPath=None):
+	# `fileHashes` is an optional list of (internal path, md5, size) for the archive's contents
+	# (from ArchCleaner.ingestArchive()). If the deduper server supports it (`processDownloadHashes`),
+	# they're passed along, so it doesn't have to read and hash the archive again. Otherwise (older
+	# servers) the archive is just processed normally.
+	def process(self, moveToPath=None, fileHashes=None):
 		self.log.info("Processing download '%s'", self.arch)
-		status, bestMatch, intersections = self.remote.root.processDownload(self.arch, pathFilter=self.maskedPaths, distance=self.pdist, moveToPath=moveToPath, locked=self.lock)
+
+		status, bestMatch, intersections = self.client.processDownload(self.arch, fileHashes, pathFilter=self.maskedPaths, distance=self.pdist, moveToPath=moveToPath, locked=self.lock)
 		self.log.info("Processed archive. Return status '%s'", status)
 		if bestMatch:
 			self.log.info("Matching archive '%s'", bestMatch)
@@ -0,0 +1,352 @@
+
+'''
+Client for the remote deduplication server (https://github.com/fake-name/IntraArchiveDeduplicator).
+
+`client` is a process-wide (thread-safe) client, which keeps a small pool of rpyc
+connections open, rather then connecting once per archive. Besides single
+archives (processDownload()), it can push a batch through at once
+(processDownloads()). If the server has a batch call, the batch goes over in
+chunks of DEDUP_BATCH_SIZE. Otherwise, the individual calls are spread
+across the pooled connections, so the server can work on several at a time.
+
+DedupQueue is an asynchronous front-end to that, for bulk jobs: Archives are
+submit()ted, worker threads send them to the server in batches, and the results
+are handed to a callback a batch at a time (so they can be applied to the
+database in one transaction, rather then one per archive).
+'''
+
+import os
+import time
+import queue
+import logging
+import threading
+import traceback
+import concurrent.futures
+
+import rpyc
+
+DEDUP_HOST = "localhost"
+DEDUP_PORT = 12345
+
+# Number of connections to the dedup server kept open per process.
+DEDUP_POOL_SIZE = 4
+
+# Max archives per batch call to the server.
+DEDUP_BATCH_SIZE = 50
+
+# rpyc call timeout (in seconds). Dedup runs for big archives can take a while.
+DEDUP_CALL_TIMEOUT = 60 * 30
+
+# DedupQueue sends a partial batch if no new archive has arrived for this long (in seconds).
+DEDUP_QUEUE_FLUSH_INTERVAL = 1.0
+DEDUP_QUEUE_SIZE = 1000
+
+class DedupResult(object):
+	'''
+	Result of processing one archive. `error` is the exception, if the call failed (in which case the other
+	values are empty). `context` is whatever was passed to DedupQueue.submit().
+	'''
+	__slots__ = ("archPath", "status", "bestMatch", "intersections", "error", "context")
+
+	def __init__(self, archPath, status="", bestMatch=None, intersections=None, error=None, context=None):
+		self.archPath      = archPath
+		self.status        = status
+		self.bestMatch     = bestMatch
+		self.intersections = intersections if intersections is not None else {}
+		self.error         = error
+		self.context       = context
+
+	def __repr__(self):
+		return "<DedupResult %s: '%s', match: '%s', error: %s>" % (self.archPath, self.status, self.bestMatch, self.error)
+
+class DedupClient(object):
+
+	log = logging.getLogger("Main.DedupClient")
+
+	def __init__(self, host=DEDUP_HOST, port=DEDUP_PORT, poolSize=DEDUP_POOL_SIZE):
+		self.host     = host
+		self.port     = port
+		self.poolSize = poolSize
+
+		self.cond     = threading.Condition()
+		self.idle     = []
+		self.open     = 0
+		self.ownerPid = os.getpid()
+
+		self.executor = None
+
+		self.stats = {
+			"connects"  : 0,
+			"calls"     : 0,
+			"batches"   : 0,
+			"archives"  : 0,
+		}
+
+	def _checkPid(self):
+		# Must be called with self.cond held.
+		# Connections can't be shared across a fork(). Forget the parent's.
+		if self.ownerPid != os.getpid():
+			self.idle     = []
+			self.open     = 0
+			self.executor = None
+			self.ownerPid = os.getpid()
+
+	def _connect(self):
+		conn = rpyc.connect(self.host, self.port, config={"sync_request_timeout" : DEDUP_CALL_TIMEOUT})
+		with self.cond:
+			self.stats["connects"] += 1
+		return conn
+
+	def getconn(self):
+		with self.cond:
+			self._checkPid()
+			while True:
+				while self.idle:
+					conn = self.idle.pop()
+					if not conn.closed:
+						return conn
+					self.open -= 1
+				if self.open < self.poolSize:
+					self.open += 1
+					break
+				self.cond.wait()
+
+		try:
+			return self._connect()
+		except Exception:
+			with self.cond:
+				self.open -= 1
+				self.cond.notify()
+			raise
+
+	def putconn(self, conn, broken=False):
+		with self.cond:
+			if broken or conn.closed:
+				self.open -= 1
+				try:
+					conn.close()
+				except Exception:
+					pass
+			else:
+				self.idle.append(conn)
+			self.cond.notify()
+
+	def _call(self, method, *args, **kwargs):
+		'''
+		Call `method` on the server, on a pooled connection. A connection that errors out is dropped,
+		and the call retried once on a fresh one (the server may just have been restarted).
+		'''
+		for attempt in range(2):
+			conn = self.getconn()
+			try:
+				ret = getattr(conn.root, method)(*args, **kwargs)
+				self.putconn(conn)
+				with self.cond:
+					self.stats["calls"] += 1
+				return ret
+			except (EOFError, ConnectionError):
+				self.putconn(conn, broken=True)
+				if attempt:
+					raise
+				self.log.warning("Lost connection to dedup server. Reconnecting.")
+			except Exception:
+				self.putconn(conn)
+				raise
+
+	def hasMethod(self, method):
+		conn = self.getconn()
+		try:
+			getattr(conn.root, method)
+			return True
+		except AttributeError:
+			return False
+		finally:
+			self.putconn(conn)
+
+	def processDownload(self, archPath, fileHashes=None, pathFilter=None, distance=None, moveToPath=None, locked=True):
+		'''
+		Dedup a single archive. Returns (status, bestMatch, intersections).
+		`fileHashes` (list of (internal path, md5, size), from ArchCleaner.ingestArchive()) is
+		passed along if the server can use it, so it doesn't have to re-hash the archive.
+		'''
+		kwargs = dict(pathFilter=pathFilter, distance=distance, moveToPath=moveToPath, locked=locked)
+		with self.cond:
+			self.stats["archives"] += 1
+		if fileHashes is not None:
+			try:
+				return self._call("processDownloadHashes", archPath, fileHashes, **kwargs)
+			except AttributeError:
+				pass
+		return self._call("processDownload", archPath, **kwargs)
+
+	def _getExecutor(self):
+		with self.cond:
+			self._checkPid()
+			if not self.executor:
+				self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.poolSize)
+			return self.executor
+
+	def processDownloads(self, items, pathFilter=None, distance=None, moveToPath=None, locked=True):
+		'''
+		Dedup a batch of archives. `items` is a list of archive paths, or (archPath, fileHashes) tuples.
+		Returns a list of DedupResult, in the same order as `items`. Failures for individual
+		archives are returned (in DedupResult.error), not raised.
+		'''
+		items = [item if isinstance(item, (tuple, list)) else (item, None) for item in items]
+		kwargs = dict(pathFilter=pathFilter, distance=distance, moveToPath=moveToPath, locked=locked)
+
+		with self.cond:
+			self.stats["batches"] += 1
+
+		if self.hasMethod("processDownloads"):
+			ret = []
+			for offset in range(0, len(items), DEDUP_BATCH_SIZE):
+				chunk = items[offset:offset+DEDUP_BATCH_SIZE]
+				try:
+					results = self._call("processDownloads", [(path, hashes) for path, hashes in chunk], **kwargs)
+					for (path, dummy_hashes), (status, bestMatch, intersections) in zip(chunk, results):
+						ret.append(DedupResult(path, status, bestMatch, intersections))
+				except Exception as e:
+					self.log.error("Batch dedup call failed!")
+					for line in traceback.format_exc().split("\n"):
+						self.log.error(line)
+					ret.extend(DedupResult(path, error=e) for path, dummy_hashes in chunk)
+			with self.cond:
+				self.stats["archives"] += len(items)
+			return ret
+
+		# No batch call on the server. Keep all the pooled connections busy instead.
+		# The calls then run concurrently, so they always take the server lock. Otherwise two copies
+		# of the same archive in one batch could each be found as the other's duplicate, and both deleted.
+		kwargs["locked"] = True
+		executor = self._getExecutor()
+		futures = [executor.submit(self.processDownload, path, hashes, **kwargs) for path, hashes in items]
+		ret = []
+		for (path, dummy_hashes), future in zip(items, futures):
+			try:
+				status, bestMatch, intersections = future.result()
+				ret.append(DedupResult(path, status, bestMatch, intersections))
+			except Exception as e:
+				self.log.error("Dedup call failed for '%s'!", path)
+				for line in traceback.format_exc().split("\n"):
+					self.log.error(line)
+				ret.append(DedupResult(path, error=e))
+		return ret
+
+	def getStats(self):
+		with self.cond:
+			ret = dict(self.stats)
+			ret["open"] = self.open
+			ret["idle"] = len(self.idle)
+		return ret
+
+	def close(self):
+		with self.cond:
+			conns, self.idle = self.idle, []
+			self.open -= len(conns)
+		for conn in conns:
+			conn.close()
+
+client = DedupClient()
+
+class DedupQueue(object):
+	'''
+	Asynchronous dedup submission. submit() archives, and `resultHandler(results)` gets
+	called (from the queue's worker thread) with lists of DedupResult as they complete.
+	Call join() to wait for everything submitted to be processed, and close() when done
+	with the queue.
+
+	`workers` batches are in flight at once, each going through `client.processDownloads()`.
+	With more then one worker, the batches are always run with the server lock held (`locked=True`).
+	'''
+
+	log = logging.getLogger("Main.DedupQueue")
+
+	def __init__(self, resultHandler, workers=2, batchSize=DEDUP_BATCH_SIZE, dedupClient=None, **dedupArgs):
+		self.resultHandler = resultHandler
+		self.batchSize     = batchSize
+		self.client        = dedupClient or client
+		self.dedupArgs     = dedupArgs
+		if workers > 1:
+			self.dedupArgs["locked"] = True
+
+		self.queue    = queue.Queue(maxsize=DEDUP_QUEUE_SIZE)
+		self.pending  = 0
+		self.done     = 0
+		self.started  = time.time()
+		self.cond     = threading.Condition()
+
+		self.threads = [threading.Thread(target=self._worker, name="DedupQueue-%s" % x, daemon=True) for x in range(workers)]
+		for thread in self.threads:
+			thread.start()
+
+	def submit(self, archPath, fileHashes=None, context=None):
+		'''
+		Queue `archPath` for dedup. Blocks if the queue is full (so a fast producer
+		can't get too far ahead of the server). `context` is passed back in the result.
+		'''
+		with self.cond:
+			self.pending += 1
+		self.queue.put((archPath, fileHashes, context))
+
+	def _nextBatch(self):
+		item = self.queue.get()
+		if item is None:
+			return None
+		batch = [item]
+		while len(batch) < self.batchSize:
+			try:
+				item = self.queue.get(timeout=DEDUP_QUEUE_FLUSH_INTERVAL)
+			except queue.Empty:
+				break
+			if item is None:
+				# Shutting down. Leave it for the next get().
+				self.queue.put(None)
+				break
+			batch.append(item)
+		return batch
+
+	def _worker(self):
+		while True:
+			batch = self._nextBatch()
+			if batch is None:
+				return
+			try:
+				results = self.client.processDownloads([(path, hashes) for path, hashes, dummy_context in batch], **self.dedupArgs)
+				for result, (dummy_path, dummy_hashes, context) in zip(results, batch):
+					result.context = context
+				self.resultHandler(results)
+			except Exception:
+				self.log.error("Error processing dedup batch!")
+				for line in traceback.format_exc().split("\n"):
+					self.log.error(line)
+			finally:
+				with self.cond:
+					self.pending -= len(batch)
+					self.done    += len(batch)
+					self.cond.notify_all()
+
+	def join(self, timeout=None):
+		'''
+		Wait until everything submitted has been processed (and handed to the result handler).
+		Returns False on timeout.
+		'''
+		with self.cond:
+			return self.cond.wait_for(lambda: self.pending == 0, timeout)
+
+	def close(self):
+		'''
+		Wait for everything submitted to be processed, then stop the worker threads.
+		'''
+		self.join()
+		for dummy_thread in self.threads:
+			self.queue.put(None)
+		for thread in self.threads:
+			thread.join()
+
+	def getRate(self):
+		'''
+		Archives processed per second, since the queue was created.
+		'''
+		with self.cond:
+			return self.done / max(time.time() - self.started, 0.001)
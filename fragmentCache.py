@@ -0,0 +1,164 @@
+
+'''
+Cache for rendered page fragments (or any other value that's expensive to produce),
+for use from the mako templates.
+
+Usage, from a template:
+
+	${fragmentCache.fragment(("sidebar", whitelisted), 60, lambda: capture(renderSideBar, sqlCon))}
+
+The callable is only run if there is no live cached value for the key. Keys
+can also be tagged, and everything with a tag can be dropped at once with
+`invalidate(tag)` (e.g. when something the fragments display is changed through
+the web interface).
+
+The cache is per process, and is only ever refreshed by one thread at a time per
+key (other threads asking for the same key while it's being rendered wait for it,
+rather then rendering it again). A render that was already running when its key
+(or one of its tags) was invalidated is returned to its caller, but not cached,
+since it may be showing the state from before the change.
+'''
+
+import time
+import threading
+import logging
+
+# Max number of cached fragments. Past this, the ones closest to expiry are dropped.
+MAX_FRAGMENTS = 2000
+
+class FragmentCache(object):
+
+	log = logging.getLogger("Main.FragmentCache")
+
+	def __init__(self, maxItems=MAX_FRAGMENTS):
+		self.maxItems = maxItems
+		self.lock     = threading.Lock()
+
+		# key -> (expiry time, value)
+		self.items    = {}
+		# tag -> set of keys
+		self.tags     = {}
+		# key -> lock held while the fragment is being rendered
+		self.building = {}
+
+		# Invalidation counter. Each invalidate()/invalidateKey()/clear() bumps it, and
+		# records the new value against what it dropped, so an in-flight render can
+		# tell it was overtaken.
+		self.epoch        = 0
+		self.tagEpochs    = {}
+		self.keyEpochs    = {}
+		self.clearedEpoch = 0
+
+		self.hits     = 0
+		self.misses   = 0
+
+	def _getLive(self, key):
+		# Must be called with self.lock held.
+		item = self.items.get(key)
+		if item and item[0] > time.time():
+			return True, item[1]
+		return False, None
+
+	def fragment(self, key, ttl, render, tags=()):
+		'''
+		Return the cached value for `key`, calling `render()` to (re)build it if
+		it's not cached, or more then `ttl` seconds old.
+		`tags` are invalidation keys, for invalidate().
+		'''
+		with self.lock:
+			live, value = self._getLive(key)
+			if live:
+				self.hits += 1
+				return value
+			buildLock = self.building.setdefault(key, threading.Lock())
+
+		with buildLock:
+			# Someone else may have rendered it while we were waiting.
+			with self.lock:
+				live, value = self._getLive(key)
+				if live:
+					self.hits += 1
+					return value
+				self.misses += 1
+				startEpoch = self.epoch
+
+			stored = False
+			try:
+				value = render()
+
+				with self.lock:
+					if not self._invalidatedSince(key, tags, startEpoch):
+						self.items[key] = (time.time() + ttl, value)
+						for tag in tags:
+							self.tags.setdefault(tag, set()).add(key)
+						stored = True
+						self._prune()
+			finally:
+				with self.lock:
+					self.building.pop(key, None)
+					self.keyEpochs.pop(key, None)
+
+			if not stored:
+				self.log.info("Fragment %s was invalidated while rendering. Not caching it.", key)
+
+		return value
+
+	def _invalidatedSince(self, key, tags, startEpoch):
+		# Must be called with self.lock held.
+		if self.clearedEpoch > startEpoch or self.keyEpochs.get(key, 0) > startEpoch:
+			return True
+		return any(self.tagEpochs.get(tag, 0) > startEpoch for tag in tags)
+
+	def _prune(self):
+		# Must be called with self.lock held.
+		if len(self.items) <= self.maxItems:
+			return
+		now = time.time()
+		for key in [key for key, (expiry, dummy_value) in self.items.items() if expiry <= now]:
+			self.items.pop(key)
+		if len(self.items) > self.maxItems:
+			byExpiry = sorted(self.items, key=lambda key: self.items[key][0])
+			for key in byExpiry[:len(self.items) - self.maxItems]:
+				self.items.pop(key)
+
+	def invalidate(self, *tags):
+		'''
+		Drop all fragments tagged with any of `tags`.
+		'''
+		with self.lock:
+			self.epoch += 1
+			for tag in tags:
+				self.tagEpochs[tag] = self.epoch
+				for key in self.tags.pop(tag, set()):
+					self.items.pop(key, None)
+
+	def invalidateKey(self, key):
+		with self.lock:
+			self.epoch += 1
+			# Only matters to a render that's currently running (cleaned up when it finishes).
+			if key in self.building:
+				self.keyEpochs[key] = self.epoch
+			self.items.pop(key, None)
+
+	def clear(self):
+		with self.lock:
+			self.epoch += 1
+			self.clearedEpoch = self.epoch
+			self.items.clear()
+			self.tags.clear()
+
+	def getStats(self):
+		with self.lock:
+			return {
+				"items"  : len(self.items),
+				"hits"   : self.hits,
+				"misses" : self.misses,
+			}
+
+fragmentCache = FragmentCache()
+
+def fragment(key, ttl, render, tags=()):
+	return fragmentCache.fragment(key, ttl, render, tags)
+
+def invalidate(*tags):
+	fragmentCache.invalidate(*tags)
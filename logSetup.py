@@ -3,10 +3,14 @@
 import logging
 import colorama as clr
 
+import os
 import os.path
 import sys
 import time
+import queue
+import threading
 import traceback
+import psycopg2.extras
 # Pylint can't figure out what's in the record library for some reason
 #pylint: disable-msg=E1101
 
@@ -16,24 +20,46 @@ def getColor(idx):
 	return colours[idx%len(colours)]
 
 
+# Async database log writer tunables.
+# Records are queued by the logging thread, and written by a background thread in batches
+# of up to DB_LOG_BATCH_SIZE rows, at least every DB_LOG_FLUSH_INTERVAL seconds.
+# If the queue is full, the logging thread blocks for up to DB_LOG_QUEUE_TIMEOUT seconds
+# before the record is dropped (and counted).
+DB_LOG_QUEUE_SIZE     = 20000
+DB_LOG_BATCH_SIZE     = 500
+DB_LOG_FLUSH_INTERVAL = 1.0
+DB_LOG_QUEUE_TIMEOUT  = 0.5
+
 class DatabaseHandler(logging.Handler):
+	'''
+	Logging handler that writes records to the `logTable` table.
+
+	`emit()` just pushes the record onto a bounded queue. A background thread pulls
+	records off in batches, and writes them with one multi-row insert per batch, so
+	the thread doing the logging never waits on postgres.
 
+	The writer thread is per-process, and is re-created on the first record logged
+	after a fork(). It checks a pooled connection out for each batch, rather then
+	holding one for the life of the process.
+	'''
 
 	def __init__(self, level=logging.DEBUG):
 		logging.Handler.__init__(self, level)
 
-		import settings
-		import psycopg2
+		import dbPool
+		self.dbPool = dbPool.pool
 
-		try:
-			self.conn = psycopg2.connect(dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		except psycopg2.OperationalError:
-			self.conn = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+		self.statLock = threading.Lock()
+		self.ownerPid = None
+		self.writer   = None
+
+		with self.dbPool.connection() as conn:
+			self.checkInitDb(conn)
 
-		self.checkInitDb()
+		self.__startWriter()
 
-	def checkInitDb(self):
-		with self.conn.cursor() as cur:
+	def checkInitDb(self, conn):
+		with conn.cursor() as cur:
 
 			cur.execute('''CREATE TABLE IF NOT EXISTS logTable (
 												dbid      SERIAL PRIMARY KEY,
@@ -61,22 +87,136 @@ class DatabaseHandler(logging.Handler):
 				if not name.lower() in haveIndexes:
 					cur.execute(createCall)
 
-
-
+	def __startWriter(self):
+		self.ownerPid = os.getpid()
+		self.queue    = queue.Queue(maxsize=DB_LOG_QUEUE_SIZE)
+		self.stats    = {
+			'queued'       : 0,
+			'written'      : 0,
+			'dropped'      : 0,
+			'batches'      : 0,
+			'latencyTotal' : 0.0,
+			'latencyMax'   : 0.0,
+		}
+		self.writer = threading.Thread(target=self.__writerThread, name="DbLogWriter", daemon=True)
+		self.writer.start()
 
 	def emit(self, record):
 
+		# Forked off a child process. The writer thread didn't come with us.
+		if self.ownerPid != os.getpid():
+			with self.statLock:
+				if self.ownerPid != os.getpid():
+					self.__startWriter()
+
 		name    = record.name
 		logTime = record.created
 		level   = record.levelno
 		msg     = record.getMessage()
 		values  = (name, logTime, level, msg)
 
-		with self.conn.cursor() as cur:
-			cur.execute("BEGIN;")
-			cur.execute("INSERT INTO logTable (source, time, level, content) VALUES (%s, %s, %s, %s);", values)
-			cur.execute("COMMIT;")
+		try:
+			self.queue.put((time.time(), values), timeout=DB_LOG_QUEUE_TIMEOUT)
+		except queue.Full:
+			with self.statLock:
+				self.stats['dropped'] += 1
+			return
+
+		with self.statLock:
+			self.stats['queued'] += 1
+
+	def __writerThread(self):
+		while True:
+			batch = []
+			stop = False
+
+			# Block until there's something to write, then keep gathering until
+			# the batch is full or the flush interval has passed.
+			item = self.queue.get()
+			deadline = time.time() + DB_LOG_FLUSH_INTERVAL
+			while True:
+				if item is None:
+					stop = True
+					break
+				batch.append(item)
+				if len(batch) >= DB_LOG_BATCH_SIZE:
+					break
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					break
+				try:
+					item = self.queue.get(timeout=remaining)
+				except queue.Empty:
+					break
+
+			if batch:
+				self.__writeBatch(batch)
+
+			for dummy_x in range(len(batch) + (1 if stop else 0)):
+				self.queue.task_done()
+
+			if stop:
+				return
+
+	def __writeBatch(self, batch):
+		# Can't log failures here through `logging`, since that would feed straight back
+		# into the queue. Print to the console instead, like the rest of the logging setup.
+		for attempt in range(2):
+			try:
+				with self.dbPool.connection() as conn:
+					with conn.cursor() as cur:
+						psycopg2.extras.execute_values(cur,
+							"INSERT INTO logTable (source, time, level, content) VALUES %s;",
+							[values for dummy_queued, values in batch],
+							page_size=len(batch))
+				break
 
+			except Exception:
+				print("Error writing log records to database! Attempt %s." % attempt)
+				traceback.print_exc()
+		else:
+			with self.statLock:
+				self.stats['dropped'] += len(batch)
+			return
+
+		now = time.time()
+		latencies = [now - queued for queued, dummy_values in batch]
+		with self.statLock:
+			self.stats['written']      += len(batch)
+			self.stats['batches']      += 1
+			self.stats['latencyTotal'] += sum(latencies)
+			self.stats['latencyMax']    = max(self.stats['latencyMax'], max(latencies))
+
+	def getStats(self):
+		'''
+		Snapshot of the writer statistics. Latencies are the time (in seconds) from
+		a record being logged to it being committed to the database.
+		'''
+		with self.statLock:
+			ret = dict(self.stats)
+		ret['queueDepth']  = self.queue.qsize()
+		ret['latencyMean'] = ret['latencyTotal'] / ret['written'] if ret['written'] else 0.0
+		return ret
+
+	def flush(self, timeout=10):
+		'''
+		Wait (up to `timeout` seconds) for everything queued so far to be written.
+		'''
+		if self.ownerPid != os.getpid() or not self.writer.is_alive():
+			return
+		start = time.time()
+		while self.queue.unfinished_tasks and time.time() - start < timeout:
+			time.sleep(0.01)
+
+	def close(self):
+		if self.writer and self.ownerPid == os.getpid() and self.writer.is_alive():
+			self.flush()
+			try:
+				self.queue.put(None, timeout=DB_LOG_QUEUE_TIMEOUT)
+				self.writer.join(timeout=5)
+			except queue.Full:
+				pass
+		logging.Handler.close(self)
 
 
 
@@ -180,10 +320,21 @@ def exceptHook(exc_type, exc_value, exc_traceback):
 
 # Global hackyness to detect and warn on double-initialization of the logging systems.
 LOGGING_INITIALIZED = False
+DB_LOG_HANDLER = None
+
+def getDbLogStats():
+	'''
+	Queue/drop/latency counters for the database log writer, or None if
+	database logging isn't running.
+	'''
+	if DB_LOG_HANDLER:
+		return DB_LOG_HANDLER.getStats()
+	return None
 
 def initLogging(logLevel=logging.INFO, logToDb=True):
 
 	global LOGGING_INITIALIZED
+	global DB_LOG_HANDLER
 	if LOGGING_INITIALIZED:
 		current_stack = traceback.format_stack()
 		print("ERROR - Logging initialized twice!")
@@ -212,6 +363,7 @@ def initLogging(logLevel=logging.INFO, logToDb=True):
 		try:
 			dbLog = DatabaseHandler()
 			mainLogger.addHandler(dbLog)
+			DB_LOG_HANDLER = dbLog
 		except:
 			print("Warning! Failed to instantiate database logging interface!")
 			traceback.print_exc()
@@ -243,3 +395,5 @@ if __name__ == "__main__":
 	log.warn("Testing logging - level: warn")
 	log.error("Testing logging - level: error")
 	log.critical("Testing logging - level: critical")
+	logging.shutdown()
+	print(getDbLogStats())
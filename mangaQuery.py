@@ -0,0 +1,151 @@
+
+'''
+Paged queries against the `mangaitems` table, for the web interface tables.
+
+Pages are addressed by keyset cursors (a "retreivaltime,dbid" pair), rather then
+by offset, so fetching page 50 costs the same as fetching page 1. A page going
+"before" a cursor continues down the table (older items), and a page going
+"after" a cursor goes back up it (newer items).
+
+`distinct` is done in the database as well. A row is only returned if there is
+no newer (non-deleted) row for the same series, which postgres can check with
+a single probe of the `(seriesName, retreivalTime, dbId)` aggregate index per row,
+while walking the `retreivaltime DESC` special indexes in order. The number of
+rows touched therefore only depends on the page size (and how many rows are
+skipped as duplicates), not on how deep into the table the page is.
+
+'''
+
+import nameTools as nt
+
+# Same column order as `mangaCols` in the table templates, since
+# the rendering code unpacks the rows positionally.
+MANGA_COLUMNS = (
+		'dbid',
+		'dlstate',
+		'sourcesite',
+		'sourceurl',
+		'retreivaltime',
+		'sourceid',
+		'seriesname',
+		'filename',
+		'originname',
+		'downloadpath',
+		'flags',
+		'tags',
+		'note',
+	)
+
+RETREIVALTIME_COL = MANGA_COLUMNS.index('retreivaltime')
+DBID_COL          = MANGA_COLUMNS.index('dbid')
+
+def makeCursor(row):
+	'''
+	Build the (url-safe) cursor string for a row returned by fetchMangaItems().
+	'''
+	return "%r,%d" % (row[RETREIVALTIME_COL], row[DBID_COL])
+
+def parseCursor(cursor):
+	'''
+	Parse a cursor string from makeCursor(). Returns a (retreivaltime, dbid)
+	tuple, or None if `cursor` is empty or malformed.
+	'''
+	if not cursor:
+		return None
+	try:
+		retreivalTime, dbId = cursor.split(",")
+		return float(retreivalTime), int(dbId)
+	except ValueError:
+		return None
+
+def buildFilters(alias, tableKey=None, seriesName=None, getErrored=False, includeUploads=False, distinct=False):
+	'''
+	Build the WHERE clauses (and parameters) for the common filter arguments,
+	against the table aliased as `alias`.
+	'''
+	clauses = []
+	params  = []
+
+	if tableKey:
+		if isinstance(tableKey, str):
+			tableKey = [tableKey]
+		elif not isinstance(tableKey, (list, tuple)):
+			raise ValueError("Invalid table-key type! Type: '%s'" % type(tableKey))
+		clauses.append("{alias}.sourcesite IN %s".format(alias=alias))
+		params.append(tuple(tableKey))
+
+	if seriesName:
+		clauses.append("{alias}.seriesname = %s".format(alias=alias))
+		params.append(seriesName)
+
+	if getErrored:
+		clauses.append("{alias}.dlstate < 1".format(alias=alias))
+	elif not includeUploads:
+		clauses.append("{alias}.dlstate < 3".format(alias=alias))
+
+	# Deleted items are left out of the distinct listing entirely (and
+	# don't hide older items in the same series).
+	if distinct:
+		clauses.append("({alias}.tags IS NULL OR {alias}.tags NOT LIKE '%%deleted%%')".format(alias=alias))
+
+	return clauses, params
+
+
+def fetchMangaItems(cur, limit=100, before=None, after=None, distinct=False, tableKey=None, seriesName=None, getErrored=False, includeUploads=False):
+	'''
+	Fetch a page of rows from `mangaitems`, newest first.
+
+	`before` and `after` are cursors (either strings from makeCursor(), or
+	(retreivaltime, dbid) tuples). If neither is passed, the first page is returned.
+	`limit` of None returns everything matching (used for the single-series listing).
+	`seriesName` is run through the MangaUpdates name canonizer.
+
+	Returns a list of row tuples, in MANGA_COLUMNS order.
+	'''
+
+	if distinct and seriesName:
+		raise ValueError("Cannot filter for distinct on a single series!")
+	if before and after:
+		raise ValueError("Cannot page both before and after a cursor!")
+
+	if seriesName:
+		seriesName = nt.getCanonicalMangaUpdatesName(seriesName)
+
+	if isinstance(before, str):
+		before = parseCursor(before)
+	if isinstance(after, str):
+		after = parseCursor(after)
+
+	clauses, params = buildFilters("m", tableKey, seriesName, getErrored, includeUploads, distinct)
+
+	if before:
+		clauses.append("(m.retreivaltime, m.dbid) < (%s, %s)")
+		params.extend(before)
+	elif after:
+		clauses.append("(m.retreivaltime, m.dbid) > (%s, %s)")
+		params.extend(after)
+
+	if distinct:
+		subClauses, subParams = buildFilters("n", tableKey, seriesName, getErrored, includeUploads, distinct)
+		subClauses = ["n.seriesname = m.seriesname", "(n.retreivaltime, n.dbid) > (m.retreivaltime, m.dbid)"] + subClauses
+		clauses.append("NOT EXISTS (SELECT 1 FROM mangaitems n WHERE %s)" % " AND ".join(subClauses))
+		params.extend(subParams)
+
+	# Paging backwards walks the index the other way, and the page gets flipped afterwards.
+	direction = "ASC" if after else "DESC"
+
+	query = "SELECT {cols} FROM mangaitems m".format(cols=", ".join("m.%s" % col for col in MANGA_COLUMNS))
+	if clauses:
+		query += " WHERE " + " AND ".join(clauses)
+	query += " ORDER BY m.retreivaltime {dir}, m.dbid {dir}".format(dir=direction)
+	if limit:
+		query += " LIMIT %s"
+		params.append(int(limit))
+
+	cur.execute(query, params)
+	rows = cur.fetchall()
+
+	if after:
+		rows.reverse()
+	return rows
+
@@ -1,11 +1,15 @@
 
 
 import re
+import sys
+import functools
+import collections
 
 import runStatus
 import copy
 import settings
 import logging
+import dbPool
 import psycopg2
 import time
 import logSetup
@@ -22,6 +26,9 @@ random.seed()
 
 # --------------------------------------------------------------
 
+# Maximum number of entries in each of the name-matching LRU caches.
+NAME_CACHE_SIZE = 2**14
+
 # Asshole scanlators who don't put their name in "[]"
 # Fuck you people. Seriously
 shitScanlators = ["rhs", "rh", "mri", "rhn", "se", "rhfk", "mw-rhs"]
@@ -72,18 +79,37 @@ def stripTrailingNumbers(inStr):
 	inStr = trailingNumRe.sub(" ", inStr)
 	return inStr
 
-# Execution time of ~ 0.000052889607680 second (52 microseconds)
+# Cached, since the same handful of series names get matched over and over
+# (every row of the web tables, every item in a feed, etc...).
+# The output only depends on the input string, so the cache never has to be invalidated.
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
 def prepFilenameForMatching(inStr):
 	# inStr = cleanUnicode(inStr)
 	inStr = makeFilenameSafe(inStr)
 	inStr = sanitizeString(inStr)
 	return inStr.lower()
 
+multiSpaceRe = re.compile(r" {2,}")
+
+# Note: Chained `str.replace()` calls are actually faster then either `str.translate()`
+# or a character-class regex for strings this short (replace() with no match is
+# basically a memchr). The speedups here come from skipping work that can't do anything
+# (the non-ascii replacements on ascii strings, the space collapsing when there are no
+# double spaces), and from collapsing spaces in one regex pass rather then looping.
 def makeFilenameSafe(inStr):
 
-	# FUCK YOU SMART-QUOTES.
-	inStr = inStr.replace("“",  " ") \
-				 .replace("”",  " ")
+	if not inStr.isascii():
+		# FUCK YOU SMART-QUOTES.
+		inStr = inStr.replace("“",  " ") \
+					 .replace("”",  " ")
+
+		# zero-width space bullshit (goddammit unicode)
+		inStr = inStr.replace("\u2009",  " ") \
+					 .replace("\u200A",  " ") \
+					 .replace("\u200B",  " ") \
+					 .replace("\u200C",  " ") \
+					 .replace("\u200D",  " ") \
+					 .replace("\uFEFF",  " ")
 
 	inStr = inStr.replace("%20", " ") \
 				 .replace("<",  " ") \
@@ -94,20 +120,11 @@ def makeFilenameSafe(inStr):
 				 .replace("\\", " ") \
 				 .replace("|",  " ") \
 				 .replace("?",  " ") \
-				 .replace("*",  " ") \
-				 .replace('"', " ")
-
-	# zero-width space bullshit (goddammit unicode)
-	inStr = inStr.replace("\u2009",  " ") \
-				 .replace("\u200A",  " ") \
-				 .replace("\u200B",  " ") \
-				 .replace("\u200C",  " ") \
-				 .replace("\u200D",  " ") \
-				 .replace("\uFEFF",  " ")
+				 .replace("*",  " ")
 
 	# Collapse all the repeated spaces down.
-	while inStr.find("  ")+1:
-		inStr = inStr.replace("  ", " ")
+	if "  " in inStr:
+		inStr = multiSpaceRe.sub(" ", inStr)
 
 
 	# inStr = inStr.rstrip(".")  # Windows file names can't end in dot. For some reason.
@@ -128,9 +145,10 @@ def cleanUnicode(inStr):
 bracketStripRe = re.compile(r"(\[[\+\~\-\!\d\w &:]*\])")
 
 def removeBrackets(inStr):
-	inStr = bracketStripRe.sub(" ", inStr)
-	while inStr.find("  ")+1:
-		inStr = inStr.replace("  ", " ")
+	if "[" in inStr:
+		inStr = bracketStripRe.sub(" ", inStr)
+	if "  " in inStr:
+		inStr = multiSpaceRe.sub(" ", inStr)
 	return inStr
 
 # Basically used for dir-path cleaning to prep for matching, and not much else
@@ -138,26 +156,22 @@ def sanitizeString(inStr, flatten=True):
 	baseName = inStr
 	if flatten:
 		# Adding "-" processing.
-		baseName = baseName.replace("-", " ")
-		baseName = baseName.replace("!", " ")
-
-		baseName = baseName.replace("~", "")		 # Spot fixes. We'll see if they break anything
-		baseName = baseName.replace(".", "")
-		baseName = baseName.replace(";", "")
-		baseName = baseName.replace(":", "")
-		baseName = baseName.replace("-", "")
-		baseName = baseName.replace("?", "")
-		baseName = baseName.replace('"', "")
-		baseName = baseName.replace("'", "")
+		baseName = baseName.replace("-", " ") \
+						   .replace("!", " ")
+
+		baseName = baseName.replace("~", "") \
+						   .replace(".", "") \
+						   .replace(";", "") \
+						   .replace(":", "") \
+						   .replace("?", "") \
+						   .replace('"', "") \
+						   .replace("'", "")		 # Spot fixes. We'll see if they break anything
 
 	# Bracket stripping has to be done /after/ special chars are cleaned,
 	# otherwise, they can break the regex.
+	# It also collapses any repeated spaces.
 	baseName = removeBrackets(baseName)				#clean brackets
 
-	# baseName = baseName.replace("'", "")
-	while baseName.find("  ")+1:
-		baseName = baseName.replace("  ", " ")
-
 	# baseName = unicodedata.normalize('NFKD', baseName).encode("ascii", errors="ignore")  # This will probably break shit
 
 
@@ -223,14 +237,16 @@ def isProbablyImage(fileName):
 
 	return False
 
-def extractChapterVol(inStr):
+# Becuase some series have numbers in their title, we need to preferrentially
+# chose numbers preceeded by known "chapter" strings when we're looking for chapter numbers
+# and only fall back to any numbers (chpRe2) if the search-by-prefix has failed.
+chpRe1 = re.compile(r"(?<!volume)(?<!vol)(?<!v)(?<!of)(?<!season) ?(?:chapter |ch|c)(?: |_|\.)?(\d+)", re.IGNORECASE)
+chpRe2 = re.compile(r"(?<!volume)(?<!vol)(?<!v)(?<!of)(?<!season) ?(?: |_)(?: |_|\.)?(\d+)", re.IGNORECASE)
+volRe  = re.compile(r"(?: |_|\-)(?:volume|vol|v|season)(?: |_|\.)?(\d+)", re.IGNORECASE)
 
-	# Becuase some series have numbers in their title, we need to preferrentially
-	# chose numbers preceeded by known "chapter" strings when we're looking for chapter numbers
-	# and only fall back to any numbers (chpRe2) if the search-by-prefix has failed.
-	chpRe1 = re.compile(r"(?<!volume)(?<!vol)(?<!v)(?<!of)(?<!season) ?(?:chapter |ch|c)(?: |_|\.)?(\d+)", re.IGNORECASE)
-	chpRe2 = re.compile(r"(?<!volume)(?<!vol)(?<!v)(?<!of)(?<!season) ?(?: |_)(?: |_|\.)?(\d+)", re.IGNORECASE)
-	volRe = re.compile(r"(?: |_|\-)(?:volume|vol|v|season)(?: |_|\.)?(\d+)", re.IGNORECASE)
+# Called for every row of the web tables, so the results are cached.
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def extractChapterVol(inStr):
 
 	chap = None
 	for chRe in [chpRe1, chpRe2]:
@@ -253,6 +269,212 @@ def extractChapterVol(inStr):
 # ------------------------------------------------------
 
 
+# Shared, incrementally-updated in-memory copy of one of the name-mapping tables.
+# All the lookup wrappers backed by the same table share a single instance, so
+# each table is only loaded (and held in memory) once per process.
+#
+# Rows are stored per-buId as tuples of interned strings, and each value column
+# has a reverse map of lowercased value -> tuple of buIds.
+# Refreshes after the initial load only fetch the rows for buIds that the
+# `nameLookupChanges` log (see schemaUpdater/nameChangeTracker.py) says have
+# changed. If the change log isn't available, a full reload is done instead.
+# Refreshes build a new mapping and swap it in, rather then editing the one
+# other threads may be reading.
+class NameLookupIndex(object):
+
+	log = logging.getLogger("Main.NSLookup.Index")
+
+	# Minimum time between refreshes, so several wrappers sharing
+	# one index don't each trigger a round-trip.
+	MIN_REFRESH_INTERVAL = 30
+
+	# changeIds come from a sequence, so they're handed out when a row is written, not when the
+	# transaction commits. A change with a lower id can therefore show up after a higher one has
+	# been seen. Each refresh re-reads the changes logged in the last CHANGE_LAG seconds
+	# (skipping the ones it's already applied), so they're not missed.
+	CHANGE_LAG = 60 * 15
+
+	def __init__(self, table, valueCols):
+		self.table     = table
+		self.valueCols = valueCols
+
+		self.updateLock  = threading.Lock()
+		self.dataLock    = threading.Lock()
+		self.loaded      = False
+		self.lastRefresh = 0
+		self.lastChange  = None
+		self.lastChangeTime = 0
+		self.seenChanges = {}
+
+		self.rows    = {}
+		self.reverse = dict([(col.lower(), {}) for col in valueCols])
+
+		self.allQueryStr    = 'SELECT buId, %s FROM %s;' % (", ".join(valueCols), table)
+		self.changeQueryStr = 'SELECT buId, %s FROM %s WHERE buId = ANY(%%s);' % (", ".join(valueCols), table)
+
+	def _intern(self, val):
+		if isinstance(val, str):
+			return sys.intern(val)
+		return val
+
+	def _addRow(self, rows, reverse, buId, values):
+		buKey = buId.lower()
+		values = tuple([self._intern(val) for val in values])
+		rows[buKey] = rows.get(buKey, ()) + (values, )
+		for col, val in zip(self.valueCols, values):
+			if val is None:
+				continue
+			revMap = reverse[col.lower()]
+			key = self._intern(val.lower())
+			have = revMap.get(key, ())
+			if buId not in have:
+				revMap[key] = have + (buId, )
+
+	def _removeBuId(self, rows, reverse, buId):
+		buKey = buId.lower()
+		for values in rows.pop(buKey, ()):
+			for col, val in zip(self.valueCols, values):
+				if val is None:
+					continue
+				revMap = reverse[col.lower()]
+				key = val.lower()
+				have = tuple([item for item in revMap.get(key, ()) if item.lower() != buKey])
+				if have:
+					revMap[key] = have
+				else:
+					revMap.pop(key, None)
+
+	def _swap(self, rows, reverse):
+		# Readers only ever see a complete mapping. The old one is left as-is for
+		# anyone still iterating over it.
+		with self.dataLock:
+			self.rows    = rows
+			self.reverse = reverse
+
+	def _getLastChange(self, cur):
+		'''
+		Return (max changeId, database time), or None if change tracking isn't available.
+		'''
+		try:
+			cur.execute("SELECT max(changeId), extract(epoch from now()) FROM nameLookupChanges WHERE tableName=%s;", (self.table, ))
+			lastChange, dbTime = cur.fetchone()
+			return lastChange or 0, dbTime
+		except psycopg2.Error:
+			# Change tracking table doesn't exist (schema not updated yet?).
+			cur.connection.rollback()
+			return None
+
+	def _fullLoad(self, cur):
+		self.log.info("Full load of %s name lookup index.", self.table)
+		lastChange = self._getLastChange(cur)
+		cur.execute(self.allQueryStr)
+		rets = cur.fetchall()
+
+		rows    = {}
+		reverse = dict([(col.lower(), {}) for col in self.valueCols])
+		for row in rets:
+			if row[0] is None:
+				continue
+			self._addRow(rows, reverse, self._intern(row[0]), row[1:])
+		self._swap(rows, reverse)
+
+		if lastChange is None:
+			self.lastChange = None
+		else:
+			self.lastChange, self.lastChangeTime = lastChange
+		self.seenChanges = {}
+		clearNameCaches()
+		self.log.info("Loaded %s rows for %s series from %s.", len(rets), len(rows), self.table)
+
+	def _incrementalLoad(self, cur):
+		lastChange = self._getLastChange(cur)
+		if lastChange is None:
+			self._fullLoad(cur)
+			return
+		dummy_lastChange, dbTime = lastChange
+		cur.execute("SELECT changeId, buId, changeTime FROM nameLookupChanges WHERE tableName=%s AND (changeId>%s OR changeTime>%s);",
+				(self.table, self.lastChange, self.lastChangeTime - self.CHANGE_LAG))
+		changes = [change for change in cur.fetchall() if change[0] not in self.seenChanges]
+
+		self.lastChange     = max([self.lastChange] + [changeId for changeId, dummy_buId, dummy_changeTime in changes])
+		self.lastChangeTime = dbTime
+		for changeId, dummy_buId, changeTime in changes:
+			self.seenChanges[changeId] = changeTime
+		self.seenChanges = dict([(changeId, changeTime) for changeId, changeTime in self.seenChanges.items() if changeTime > dbTime - self.CHANGE_LAG])
+
+		changed = set([buId for dummy_changeId, buId, dummy_changeTime in changes if buId is not None])
+		if not changed:
+			return
+
+		cur.execute(self.changeQueryStr, (list(changed), ))
+		rets = cur.fetchall()
+
+		# Applied to a copy, which then replaces the current mapping, so lookups
+		# running at the same time never see a half-updated index.
+		rows    = dict(self.rows)
+		reverse = dict([(col, dict(revMap)) for col, revMap in self.reverse.items()])
+		for buId in changed:
+			self._removeBuId(rows, reverse, buId)
+		for row in rets:
+			self._addRow(rows, reverse, self._intern(row[0]), row[1:])
+		self._swap(rows, reverse)
+
+		clearNameCaches()
+		self.log.info("Incremental refresh of %s: %s changed series.", self.table, len(changed))
+
+	def refresh(self, force=False):
+		with self.updateLock:
+			if not force and self.loaded and time.time() - self.lastRefresh < self.MIN_REFRESH_INTERVAL:
+				return
+
+			with dbPool.pool.connection() as conn:
+				with conn.cursor() as cur:
+					if self.loaded and self.lastChange is not None:
+						self._incrementalLoad(cur)
+					else:
+						self._fullLoad(cur)
+
+			self.loaded = True
+			self.lastRefresh = time.time()
+
+	def ensureLoaded(self):
+		if not self.loaded:
+			self.refresh()
+
+	def getValues(self, buId, col):
+		idx = self.valueCols.index(col)
+		with self.dataLock:
+			rows = self.rows
+		return set([values[idx] for values in rows.get(buId.lower(), ()) if values[idx] is not None])
+
+	def getIds(self, col, value):
+		with self.dataLock:
+			reverse = self.reverse
+		return set(reverse[col.lower()].get(value.lower(), ()))
+
+	def iteritems(self, fromCol, toCol):
+		with self.dataLock:
+			rows, reverse = self.rows, self.reverse
+		if fromCol == "buId":
+			idx = self.valueCols.index(toCol)
+			for key, buRows in rows.items():
+				for values in buRows:
+					yield key, values[idx]
+		else:
+			for key, buIds in reverse[fromCol.lower()].items():
+				for buId in buIds:
+					yield key, buId
+
+	def keyCount(self, fromCol):
+		with self.dataLock:
+			rows, reverse = self.rows, self.reverse
+		if fromCol == "buId":
+			return len(rows)
+		return len(reverse[fromCol.lower()])
+
+nameListIndex = NameLookupIndex('munamelist',  ["name", "fsSafeName"])
+seriesIndex   = NameLookupIndex('mangaseries', ["buName"])
+
 # proxy that makes a DB look like a dict
 # Opens a dynamically specifiable database, though the database must be one of a predefined set.
 class MtNamesMapWrapper(object):
@@ -260,11 +482,11 @@ class MtNamesMapWrapper(object):
 	log = logging.getLogger("Main.NSLookup")
 
 	modes = {
-		"buId->fsName" : {"cols" : ["buId", "fsSafeName"], "table" : 'munamelist',  'failOnMissing' : False},
-		"buId->name"   : {"cols" : ["buId", "name"],       "table" : 'munamelist',  'failOnMissing' : False},
-		"fsName->buId" : {"cols" : ["fsSafeName", "buId"], "table" : 'munamelist',  'failOnMissing' : False},
-		"buId->buName" : {"cols" : ["buId", "buName"],     "table" : 'mangaseries', 'failOnMissing' : False},
-		"buName->buId" : {"cols" : ["buName", "buId"],     "table" : 'mangaseries', 'failOnMissing' : False}
+		"buId->fsName" : {"cols" : ["buId", "fsSafeName"], "table" : 'munamelist',  'failOnMissing' : False, "index" : nameListIndex},
+		"buId->name"   : {"cols" : ["buId", "name"],       "table" : 'munamelist',  'failOnMissing' : False, "index" : nameListIndex},
+		"fsName->buId" : {"cols" : ["fsSafeName", "buId"], "table" : 'munamelist',  'failOnMissing' : False, "index" : nameListIndex},
+		"buId->buName" : {"cols" : ["buId", "buName"],     "table" : 'mangaseries', 'failOnMissing' : False, "index" : seriesIndex},
+		"buName->buId" : {"cols" : ["buName", "buId"],     "table" : 'mangaseries', 'failOnMissing' : False, "index" : seriesIndex}
 	}
 
 	loaded = False
@@ -275,29 +497,19 @@ class MtNamesMapWrapper(object):
 	NEEDS_REFRESHING = True
 	REFRESH_INTERVAL = 60*2.5
 
-	# define conn to shut up pylinter
-	conn = None
 	def __init__(self, mode):
 
-
-		self.updateLock = threading.Lock()
-
-
 		self.log.info("Loading NSLookup")
 
 		if not mode in self.modes:
 			raise ValueError("Specified mapping mode not valid")
 		self.modeKey = mode
 		self.mode = self.modes[mode]
+		self.index = self.mode["index"]
+		self.fromCol, self.toCol = self.mode["cols"]
 		self.openDB()
 
-		self.lastUpdate = 0
-		self.lutItems = {}
-
-		self.queryStr = 'SELECT %s FROM %s WHERE %s=%%s;' % (self.mode["cols"][1], self.mode["table"], self.mode["cols"][0])
-		self.allQueryStr = 'SELECT %s, %s FROM %s;' % (self.mode["cols"][0], self.mode["cols"][1], self.mode["table"])
-		self.log.info("Mode %s, Query %s", mode, self.queryStr)
-		self.log.info("Mode %s, IteratorQuery %s",  mode, self.allQueryStr)
+		self.log.info("Mode %s, table %s, %s -> %s", mode, self.mode["table"], self.fromCol, self.toCol)
 
 		if runStatus.preloadDicts:
 			self.loaded = True
@@ -309,33 +521,20 @@ class MtNamesMapWrapper(object):
 
 	def refresh(self):
 		self.log.info("Refresh call! for %s mapping cache.", self.modeKey)
-		tmp = {}
-		for key, buId in self.iteritems():
-			key = key.lower()
-
-			if not key in tmp:
-				tmp[key] = set([buId])
-			else:
-				tmp[key].add(buId)
-
-		self.log.info("Refresh call complete. Have %s keys", len(tmp))
-		self.lutItems = tmp
+		self.index.refresh()
+		self.log.info("Refresh call complete. Have %s keys", self.index.keyCount(self.fromCol))
 
+	# Connections are checked out of the shared pool per-query, since lookups
+	# only hit the DB on refresh.
 	def openDB(self):
-		self.log.info( "NSLookup Opening DB...")
-		try:
-			self.conn = psycopg2.connect(dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		except psycopg2.OperationalError:
-			self.conn = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+		self.log.info( "NSLookup checking DB...")
 
-		# self.conn.autocommit = True
-		self.log.info("opened")
+		with dbPool.pool.connection() as conn:
+			with conn.cursor() as cur:
+				cur.execute('''SELECT tablename FROM pg_catalog.pg_tables WHERE tablename='%s';''' % self.mode["table"])
+				rets = cur.fetchall()
 
-		with self.conn.cursor() as cur:
-			cur.execute('''SELECT tablename FROM pg_catalog.pg_tables WHERE tablename='%s';''' % self.mode["table"])
-			rets = cur.fetchall()
-
-		self.conn.commit()
+		self.log.info("checked")
 		if rets:
 			rets = rets[0]
 		if not self.mode["table"] in rets:   # If the DB doesn't exist, set it up.
@@ -347,49 +546,142 @@ class MtNamesMapWrapper(object):
 				runStatus.preloadDicts = False
 
 	def closeDB(self):
-		self.log.info( "Closing DB...")
-		self.conn.close()
-		self.log.info( "done")
+		pass
 
 	def iteritems(self):
-
-
-		with self.conn.cursor() as cur:
-			cur.execute(self.allQueryStr)
-			rets = cur.fetchall()
-
-		self.conn.commit()
-
-		for fsSafeName, buId in rets:
-			yield fsSafeName, buId
+		self.index.ensureLoaded()
+		return self.index.iteritems(self.fromCol, self.toCol)
 
 
 	def __getitem__(self, key):
 		if not self.loaded:
 			self.loaded = True
-			self.refresh()
+			self.index.ensureLoaded()
 
 		# if we have a key filtering function, run the key through it
 		if "keyfunc" in self.mode:
 			key = self.mode["keyfunc"](key)
 
-		# db is all CITEXT, so we emulate that by calling lower on ALL THE THINGS
-		key = key.lower()
+		# db is all CITEXT, so the index lower()s ALL THE THINGS. The returned
+		# set is a fresh copy, so callers can't clobber the index contents.
+		if self.fromCol == "buId":
+			return self.index.getValues(key, self.toCol)
+		return self.index.getIds(self.fromCol, key)
 
-		if not key in self.lutItems:
-			return []
+	def __contains__(self, key):
+		return len(self[key]) > 0
 
-		# Have to do list comprehension so we don't return the item by reference,
-		# which can lead to it getting clobbered.
-		return [item for item in self.lutItems[key]]
 
-	def __contains__(self, key):
 
-		if key in self.lutItems[key]:
-			return True
+
+# Maximum number of files the file metadata cache will hold.
+FILE_META_CACHE_SIZE = 2**16
+
+# How long cached metadata is trusted for files that aren't under one of the
+# inotify-watched directories (and therefore won't be invalidated when they change).
+FILE_META_UNWATCHED_TTL = 60
+
+# Cache of file existence and size, for the web interface tables, so rendering a
+# page doesn't need a stat() per row (which is slow as hell on a NAS-backed library).
+# Keyed on (dirPath, fileName). Entries under the directories the DirNameProxy
+# watches are kept until the EventHandler sees a change to them, everything else
+# expires after FILE_META_UNWATCHED_TTL seconds.
+# Also keeps per-thread hit/stat() counters, so a request can report how well
+# the cache did for it.
+class FileMetaCache(object):
+
+	def __init__(self, maxSize=FILE_META_CACHE_SIZE):
+		self.maxSize = maxSize
+		self.lock = threading.Lock()
+		self.entries = collections.OrderedDict()
+		self.watchedRoots = []
+		self.local = threading.local()
+
+	def addWatchedRoot(self, path):
+		path = os.path.normpath(path)
+		with self.lock:
+			if path not in self.watchedRoots:
+				self.watchedRoots.append(path)
+
+	def clearWatchedRoots(self):
+		with self.lock:
+			self.watchedRoots = []
+			self.entries.clear()
+
+	def isWatched(self, dirPath):
+		for root in self.watchedRoots:
+			if dirPath == root or dirPath.startswith(root + os.sep):
+				return True
 		return False
 
+	def __count(self, key):
+		if not hasattr(self.local, "stats"):
+			self.resetRequestStats()
+		self.local.stats[key] += 1
+
+	def getSize(self, dirPath, fileName):
+		'''
+		Return the size of file `fileName` in `dirPath`, or None if it doesn't exist.
+		Errors other then the file not being there are raised (and not cached).
+		'''
+		key = (os.path.normpath(dirPath), fileName)
+		now = time.time()
+		with self.lock:
+			if key in self.entries:
+				size, expires = self.entries[key]
+				if expires is None or expires > now:
+					self.entries.move_to_end(key)
+					self.__count("hits")
+					return size
+
+		self.__count("stats")
+		try:
+			size = os.stat(os.path.join(dirPath, fileName)).st_size
+		except (FileNotFoundError, NotADirectoryError):
+			size = None
 
+		expires = None if self.isWatched(key[0]) else now + FILE_META_UNWATCHED_TTL
+		with self.lock:
+			self.entries[key] = (size, expires)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxSize:
+				self.entries.popitem(last=False)
+
+		return size
+
+	def exists(self, dirPath, fileName):
+		try:
+			return self.getSize(dirPath, fileName) is not None
+		except OSError:
+			return False
+
+	def invalidate(self, dirPath, fileName=None):
+		'''
+		Drop the cached entry for `fileName` in `dirPath`, or if `fileName` is None,
+		everything in or below `dirPath`.
+		'''
+		dirPath = os.path.normpath(dirPath)
+		with self.lock:
+			if fileName is not None:
+				self.entries.pop((dirPath, fileName), None)
+				return
+			stale = [key for key in self.entries if key[0] == dirPath or key[0].startswith(dirPath + os.sep)]
+			for key in stale:
+				del self.entries[key]
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def resetRequestStats(self):
+		self.local.stats = {"hits" : 0, "stats" : 0}
+
+	def getRequestStats(self):
+		if not hasattr(self.local, "stats"):
+			self.resetRequestStats()
+		return dict(self.local.stats)
+
+fileMetaCache = FileMetaCache()
 
 
 class EventHandler(pyinotify.ProcessEvent):
@@ -401,6 +693,15 @@ class EventHandler(pyinotify.ProcessEvent):
 		self.updateLock = threading.Lock()
 
 	def process_default(self, event):
+
+		# Queue overflowed, so events were lost. We have no idea what changed.
+		if event.mask & pyinotify.IN_Q_OVERFLOW:
+			fileMetaCache.clear()
+		elif event.dir or not event.name:
+			fileMetaCache.invalidate(event.pathname)
+		else:
+			fileMetaCache.invalidate(event.path, event.name)
+
 		self.updateLock.acquire()
 		# print("Dir monitor detected change!", event)
 		for path in self.paths.keys():
@@ -505,6 +806,7 @@ class DirNameProxy(object):
 					self.log.info("Instantiating observer for path %s", self.paths[key]["dir"])
 
 					self.paths[key]["observer"] = self.wm.add_watch(self.paths[key]["dir"], MONITORED_FS_EVENTS, rec=True)
+					fileMetaCache.addWatchedRoot(self.paths[key]["dir"])
 
 
 				else:
@@ -526,6 +828,7 @@ class DirNameProxy(object):
 			self.log.info("Unoading DirLookup")
 			self.notifier.stop()
 			self.notifierRunning = False
+			fileMetaCache.clearWatchedRoots()
 
 	def getDirDict(self, dlPath):
 
@@ -815,6 +1118,8 @@ class DirNameProxy(object):
 
 ## If we have the series name in the synonym database, look it up there, and use the ID
 ## to fetch the proper name from the MangaUpdates database
+## Results are cached until the next time the name lookup tables change (see clearNameCaches()).
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
 def getCanonicalMangaUpdatesName(sourceSeriesName):
 
 	mId = getMangaUpdatesId(sourceSeriesName)
@@ -827,6 +1132,7 @@ muIdRegex = re.compile(r'\[MuId (\d+)\]')
 
 ## If we have the series name in the synonym database, look it up there, and use the ID
 ## to fetch the proper name from the MangaUpdates database
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
 def getMangaUpdatesId(sourceSeriesName):
 
 	# Allow the Id Override tag in the dirname to hard-code the Id.
@@ -844,6 +1150,12 @@ def getMangaUpdatesId(sourceSeriesName):
 	return False
 
 
+# Drop any cached lookups that depend on the contents of the name tables.
+# Called by the NameLookupIndex instances whenever their contents change.
+def clearNameCaches():
+	getCanonicalMangaUpdatesName.cache_clear()
+	getMangaUpdatesId.cache_clear()
+
 def getCanonNameByMuId(muId):
 
 	if muId:
@@ -12,6 +12,9 @@ import runStatus
 
 PHASH_DISTANCE = 4
 
+def defaultPathFilter():
+	return [item['dir'] for item in settings.mangaFolders.values()]
+
 
 class DownloadProcessor(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
@@ -77,7 +80,7 @@ class DownloadProcessor(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 	def scanIntersectingArchives(self, containerPath, intersections, phashThresh, moveToPath):
 
-		pathFilter = [item['dir'] for item in settings.mangaFolders.values()]
+		pathFilter = defaultPathFilter()
 		self.log.info("File intersections:")
 		keys = list(intersections)
 		keys.sort()
@@ -115,6 +118,34 @@ class DownloadProcessor(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 
 
 
+	def cleanDownload(self, archivePath, **kwargs):
+		'''
+		Run the archive cleaner over `archivePath`. Returns (tags, archivePath, fileHashes).
+		The archive cleaner hashes every file in the archive while it's scanning it. Those
+		get passed on to the deduper, so it doesn't have to re-read the archive.
+		'''
+		try:
+			archCleaner = ac.ArchCleaner()
+			return archCleaner.ingestArchive(archivePath, **kwargs)
+		except Exception:
+			self.log.critical("Error processing archive '%s'", archivePath)
+			self.log.critical(traceback.format_exc())
+			return "corrupt unprocessable", archivePath, None
+
+	def applyDedupResult(self, archivePath, retTags, dedupTags, bestMatch, crossReference=True):
+		'''
+		Merge the deduper's tags into `retTags`, and cross-link the archive to it's
+		duplicate (if there was one). Returns the combined tags.
+		'''
+		retTags = (retTags + " " + dedupTags).strip()
+
+		if bestMatch and crossReference:
+			isPhash = False
+			if "phash-duplicate" in retTags:
+				isPhash = True
+			self.crossLink(archivePath, bestMatch, isPhash=isPhash)
+		return retTags
+
 	def processDownload(self, seriesName, archivePath, deleteDups=False, includePHash=False, pathFilter=None, crossReference=True, doUpload=True, **kwargs):
 
 		if 'phashThresh' in kwargs:
@@ -134,34 +165,19 @@ class DownloadProcessor(ScrapePlugins.RetreivalDbBase.ScraperDbBase):
 			moveToPath = False
 
 		if moveToPath:
-			retTags = ""
+			retTags, fileHashes = "", None
 		else:
-			archCleaner = ac.ArchCleaner()
-			try:
-				retTags, archivePath = archCleaner.processNewArchive(archivePath, **kwargs)
-			except Exception:
-				self.log.critical("Error processing archive '%s'", archivePath)
-				self.log.critical(traceback.format_exc())
-				retTags = "corrupt unprocessable"
-
-
+			retTags, archivePath, fileHashes = self.cleanDownload(archivePath, **kwargs)
 
 		# Limit dedup matches to the served directories.
 		if not pathFilter:
-			pathFilter = [item['dir'] for item in settings.mangaFolders.values()]
+			pathFilter = defaultPathFilter()
 
 		# Let the remote deduper do it's thing.
 		# It will delete duplicates automatically.
 		dc = deduplicator.archChecker.ArchChecker(archivePath, phashDistance=phashThresh, pathFilter=pathFilter, lock=False)
-		retTagsTmp, bestMatch, intersections = dc.process(moveToPath=moveToPath)
-		retTags += " " + retTagsTmp
-		retTags = retTags.strip()
-
-		if bestMatch and crossReference:
-			isPhash = False
-			if "phash-duplicate" in retTags:
-				isPhash = True
-			self.crossLink(archivePath, bestMatch, isPhash=isPhash)
+		retTagsTmp, bestMatch, intersections = dc.process(moveToPath=moveToPath, fileHashes=fileHashes)
+		retTags = self.applyDedupResult(archivePath, retTags, retTagsTmp, bestMatch, crossReference)
 
 
 		# try:
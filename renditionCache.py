@@ -0,0 +1,281 @@
+
+'''
+Downscaled renditions (and thumbnails) of reader pages and book covers.
+
+Pages and covers are served at full resolution, which is mostly wasted on
+phones (or over a slow link). Requests can instead ask for one of the named
+`RENDITION_WIDTHS` (`?size=small`), and get a width-bounded JPEG (or WebP, if
+the browser says it takes it) version.
+
+Renditions are generated in a process pool (decoding/resizing is CPU bound, and
+would otherwise hold the GIL in the web-server), and stored in an on-disk cache
+keyed by the hash of the source image, so the same page in two different
+archives (or the same archive at two different paths) is only rendered once.
+The cache is bounded in size, and the least recently used renditions are
+deleted to keep it there.
+
+Pillow is optional. Without it, the original image is always served.
+'''
+
+import os
+import os.path
+import hashlib
+import logging
+import threading
+import traceback
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import io
+
+import settings
+
+try:
+	import PIL.Image
+except ImportError:
+	PIL = None
+
+# Named sizes (max width, in pixels) that can be requested.
+RENDITION_WIDTHS = {
+	"thumb"  : 240,
+	"small"  : 800,
+	"medium" : 1280,
+	"large"  : 1920,
+}
+
+RENDITION_QUALITY = {
+	"jpeg" : 85,
+	"webp" : 80,
+}
+
+DEFAULT_CACHE_DIR       = 'renditionCache'
+DEFAULT_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+RENDITION_WORKERS       = max(1, (os.cpu_count() or 2) - 1)
+
+# How long a request will wait for it's rendition before just sending the original.
+RENDITION_TIMEOUT       = 30
+
+def parseSize(sizeName):
+	'''
+	Map a `size` query parameter to a width, or None if it's missing or not one of RENDITION_WIDTHS.
+	'''
+	if not sizeName:
+		return None
+	return RENDITION_WIDTHS.get(sizeName.lower())
+
+def acceptsWebp(request):
+	return "image/webp" in request.headers.get("Accept", "")
+
+
+# Runs in the worker processes.
+def renderImage(content, width, fmt):
+	'''
+	Scale the image in `content` (bytes) down to at most `width` pixels wide, and
+	encode it as `fmt` ("jpeg" or "webp"). Returns the encoded bytes, or None if
+	the image shouldn't be (or can't be) re-encoded.
+	'''
+
+	try:
+		img = PIL.Image.open(io.BytesIO(content))
+	except OSError:
+		# Not a format Pillow knows.
+		return None
+
+	# Re-encoding would throw away the animation.
+	if getattr(img, "is_animated", False):
+		return None
+
+	srcWidth, srcHeight = img.size
+	if srcWidth > width:
+		height = max(1, int(round(srcHeight * width / srcWidth)))
+	else:
+		width, height = srcWidth, srcHeight
+
+	# Let the JPEG decoder do most of the downscaling itself (decoding at 1/2, 1/4 or 1/8
+	# scale), which is much faster then decoding at full resolution then resizing.
+	img.draft("RGB", (width, height))
+
+	if img.mode not in ("RGB", "L"):
+		if fmt == "webp" and img.mode in ("RGBA", "LA", "P"):
+			img = img.convert("RGBA")
+		else:
+			img = img.convert("RGB")
+
+	if img.size != (width, height):
+		img = img.resize((width, height), PIL.Image.LANCZOS)
+
+	out = io.BytesIO()
+	img.save(out, format=fmt.upper(), quality=RENDITION_QUALITY[fmt], optimize=(fmt == "jpeg"))
+	return out.getvalue()
+
+
+class RenditionCache(object):
+
+	log = logging.getLogger("Main.Renditions")
+
+	def __init__(self, cacheDir=None, maxBytes=None, workers=RENDITION_WORKERS):
+		self.cacheDir = cacheDir or getattr(settings, "renditionCachePath", DEFAULT_CACHE_DIR)
+		self.maxBytes = maxBytes or getattr(settings, "RENDITION_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)
+		self.workers  = workers
+
+		self.lock     = threading.Lock()
+		self.pool     = None
+
+		# Renditions currently being generated, so concurrent requests for the same one share the work.
+		self.pending  = {}
+
+		# Renditions that turned out no smaller then their source (or that Pillow declined), so they aren't retried every request.
+		self.useOriginal = set()
+
+		# Cached file path -> size, least recently used first. Loaded from the cache directory on first use.
+		self.entries  = None
+		self.curBytes = 0
+
+		self.stats = {
+			"hits"      : 0,
+			"misses"    : 0,
+			"bytesIn"   : 0,
+			"bytesOut"  : 0,
+			"errors"    : 0,
+		}
+
+	def enabled(self):
+		return PIL is not None
+
+	def _loadEntries(self):
+		if self.entries is not None:
+			return
+
+		found = []
+		for root, dummy_dirs, files in os.walk(self.cacheDir):
+			for fileN in files:
+				fPath = os.path.join(root, fileN)
+				try:
+					stat = os.stat(fPath)
+				except OSError:
+					continue
+				found.append((stat.st_mtime, fPath, stat.st_size))
+
+		found.sort()
+		self.entries  = collections.OrderedDict((fPath, size) for dummy_mtime, fPath, size in found)
+		self.curBytes = sum(self.entries.values())
+
+	def _evict(self):
+		while self.curBytes > self.maxBytes and self.entries:
+			fPath, size = self.entries.popitem(last=False)
+			self.curBytes -= size
+			try:
+				os.unlink(fPath)
+			except OSError:
+				pass
+
+	def _getPool(self):
+		if not self.pool:
+			self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+		return self.pool
+
+	def cachePath(self, contentHash, width, fmt):
+		return os.path.join(self.cacheDir, contentHash[:2], "%s-%s.%s" % (contentHash, width, fmt))
+
+	def getRendition(self, content, width, webp=False):
+		'''
+		Get `content` (the bytes of an image) scaled down to `width` pixels wide.
+		Returns (renditionBytes, mimeType), or None if the original should just be
+		served as-is (no Pillow, not an image Pillow can handle, rendering failed, etc...).
+		'''
+
+		if not self.enabled() or not width:
+			return None
+
+		fmt  = "webp" if webp else "jpeg"
+		mime = "image/%s" % fmt
+		path = self.cachePath(hashlib.sha1(content).hexdigest(), width, fmt)
+
+		with self.lock:
+			if path in self.useOriginal:
+				return None
+			self._loadEntries()
+			cached = path in self.entries
+			if cached:
+				self.entries.move_to_end(path)
+
+		if cached:
+			try:
+				with open(path, "rb") as fp:
+					rendered = fp.read()
+				with self.lock:
+					self.stats["hits"]     += 1
+					self.stats["bytesIn"]  += len(content)
+					self.stats["bytesOut"] += len(rendered)
+				return rendered, mime
+			except OSError:
+				with self.lock:
+					if path in self.entries:
+						self.curBytes -= self.entries.pop(path)
+
+		with self.lock:
+			self.stats["misses"] += 1
+			if path in self.pending:
+				future = self.pending[path]
+			else:
+				future = self._getPool().submit(renderImage, content, width, fmt)
+				self.pending[path] = future
+
+		failed = False
+		try:
+			rendered = future.result(timeout=RENDITION_TIMEOUT)
+		except Exception as e:
+			failed = True
+			self.log.error("Failed to generate rendition for '%s'", path)
+			for line in traceback.format_exc().split("\n"):
+				self.log.error(line)
+			rendered = None
+			with self.lock:
+				self.stats["errors"] += 1
+				# A broken process pool won't come back, so start a new one next time.
+				if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+					self.pool = None
+
+		with self.lock:
+			if self.pending.get(path) is future:
+				self.pending.pop(path)
+
+		# Failures may be transient (timeouts, a dead worker), so those will be retried.
+		if failed:
+			return None
+
+		# Only worth sending if it's actually smaller then the original.
+		if not rendered or len(rendered) >= len(content):
+			with self.lock:
+				if len(self.useOriginal) > 100000:
+					self.useOriginal.clear()
+				self.useOriginal.add(path)
+			return None
+
+		with self.lock:
+			if not path in self.entries:
+				try:
+					os.makedirs(os.path.dirname(path), exist_ok=True)
+					tmpPath = "%s.%s.tmp" % (path, threading.get_ident())
+					with open(tmpPath, "wb") as fp:
+						fp.write(rendered)
+					os.replace(tmpPath, path)
+					self.entries[path] = len(rendered)
+					self.curBytes += len(rendered)
+					self._evict()
+				except OSError:
+					self.log.error("Could not write rendition to cache dir '%s'", self.cacheDir)
+
+			self.stats["bytesIn"]  += len(content)
+			self.stats["bytesOut"] += len(rendered)
+
+		return rendered, mime
+
+	def getStats(self):
+		with self.lock:
+			ret = dict(self.stats)
+			ret["cachedBytes"] = self.curBytes
+			ret["cachedItems"] = len(self.entries) if self.entries is not None else 0
+		return ret
+
+renditions = RenditionCache()
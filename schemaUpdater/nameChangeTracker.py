@@ -0,0 +1,70 @@
+
+
+# Change tracking for the tables backing the nameTools lookup maps.
+# Every insert/delete (and update of a name column) on `munamelist` and `mangaseries`
+# logs the affected buId to `nameLookupChanges`, so the in-memory lookup indexes
+# can re-fetch just the changed series rather then re-reading the whole table.
+
+TRACKED_TABLES = {
+	'munamelist'  : 'buId, name, fsSafeName',
+	'mangaseries' : 'buId, buName',
+}
+
+def setupNameChangeTracking(conn):
+
+	cur = conn.cursor()
+
+	cur.execute('''CREATE TABLE IF NOT EXISTS nameLookupChanges (
+										changeId      BIGSERIAL PRIMARY KEY,
+										tableName     TEXT     NOT NULL,
+										buId          TEXT,
+										changeTime    DOUBLE PRECISION NOT NULL
+										);''')
+
+	cur.execute("SELECT relname FROM pg_class;")
+	haveItems = cur.fetchall()
+	haveItems = [index[0] for index in haveItems]
+
+	if not 'namelookupchanges_tablename_index' in haveItems:
+		cur.execute('''CREATE INDEX nameLookupChanges_tableName_index ON nameLookupChanges (tableName, changeId);''')
+	if not 'namelookupchanges_time_index' in haveItems:
+		cur.execute('''CREATE INDEX nameLookupChanges_time_index ON nameLookupChanges (changeTime);''')
+
+	cur.execute("SELECT tgname FROM pg_trigger;")
+	haveTriggers = cur.fetchall()
+	haveTriggers = [trigger[0] for trigger in haveTriggers]
+
+	wantTriggers = [table for table in TRACKED_TABLES if table in haveItems and not '%s_name_change_trigger' % table in haveTriggers]
+	if not wantTriggers:
+		conn.commit()
+		return
+
+	print("Ensuring commit hooks for name-lookup change tracking exist.")
+
+	cur.execute('''
+
+CREATE OR REPLACE FUNCTION log_name_lookup_change() RETURNS trigger AS $$
+	BEGIN
+		IF (TG_OP = 'DELETE' OR TG_OP = 'UPDATE') THEN
+			INSERT INTO nameLookupChanges(tableName, buId, changeTime) VALUES (TG_TABLE_NAME, OLD.buId, extract(epoch from now()));
+		END IF;
+		IF (TG_OP = 'INSERT' OR TG_OP = 'UPDATE') THEN
+			INSERT INTO nameLookupChanges(tableName, buId, changeTime) VALUES (TG_TABLE_NAME, NEW.buId, extract(epoch from now()));
+		END IF;
+		RETURN NULL;
+	END;
+
+$$ LANGUAGE plpgsql;
+	''')
+
+	for table in wantTriggers:
+		cur.execute('''DROP TRIGGER IF EXISTS {tableName}_name_change_trigger ON {tableName};'''.format(tableName=table))
+		cur.execute('''CREATE TRIGGER {tableName}_name_change_trigger
+							AFTER INSERT OR DELETE OR UPDATE OF {cols} ON {tableName}
+							FOR EACH ROW EXECUTE PROCEDURE log_name_lookup_change();'''.format(tableName=table, cols=TRACKED_TABLES[table]))
+
+	conn.commit()
+	print("Hooks created.")
+
+def trimNameChanges(cur, thresholdTime):
+	cur.execute('''DELETE FROM nameLookupChanges WHERE changeTime<%s;''', (thresholdTime, ))
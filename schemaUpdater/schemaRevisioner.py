@@ -6,10 +6,13 @@ import sys
 
 from schemaUpdater.rowCountTracker import setupTableCountersPostgre         # Rev 9 is the first postgres rev
 from schemaUpdater.rowCountTracker import doTableCountsPostgre         # Rev 9 is the first postgres rev
+from schemaUpdater.nameChangeTracker import setupNameChangeTracking
+from schemaUpdater.tagCountTracker import setupTagCountTracking
+from schemaUpdater.tagArrays import setupTagArrays
 
 
 
-CURRENT_SCHEMA = 10
+CURRENT_SCHEMA = 13
 
 def getSchemaRev(conn):
 	cur = conn.cursor()
@@ -100,6 +103,21 @@ def updateDatabaseSchema(fastExit=False):
 			setupTableCountersPostgre(conn)
 			updateSchemaRevNo(10)
 
+		rev = getSchemaRev(conn)
+		if rev == 10:
+			setupNameChangeTracking(conn)
+			updateSchemaRevNo(11)
+
+		rev = getSchemaRev(conn)
+		if rev == 11:
+			setupTagCountTracking(conn)
+			updateSchemaRevNo(12)
+
+		rev = getSchemaRev(conn)
+		if rev == 12:
+			setupTagArrays(conn, checkBackfill=True)
+			updateSchemaRevNo(13)
+
 		rev = getSchemaRev(conn)
 
 		if fastExit:
@@ -0,0 +1,109 @@
+# Indexed tag arrays for the item tables.
+# `tags` stays the space-separated string everything displays, but each row also
+# gets a `tagArr` TEXT[] column holding the lowercased, de-duplicated tags, with a
+# GIN index on it. A trigger keeps `tagArr` in sync whenever `tags` is written.
+#
+# Tag filters can then be exact index lookups (`tagArr @> ARRAY[...]` for "all of",
+# `tagArr && ARRAY[...]` for "any of"), rather then `tags LIKE '%tag%'` scans (which
+# also match substrings of other tags).
+
+TRACKED_TABLES = ["MangaItems", "HentaiItems"]
+
+# Rows are backfilled in chunks of this many dbIds, so a big table doesn't
+# get rewritten in one giant transaction.
+BACKFILL_CHUNK = 50000
+
+TAG_ARRAY_EXPR = r'''ARRAY(SELECT DISTINCT lower(tag) FROM regexp_split_to_table({src}::text, '\s+') AS tag WHERE tag != '')'''
+
+def setupTagArrays(conn, checkBackfill=False):
+	'''
+	Make sure the tag-array column, trigger, backfill and index are in place.
+
+	The GIN index is only created once the backfill has finished, so it doubles as the
+	"backfill done" marker, and checking for it is cheap enough to do on every plugin
+	startup. `checkBackfill` additionally scans for rows the backfill missed (the schema
+	migration does this). It reads the whole table, so it's not done by default.
+	'''
+
+	cur = conn.cursor()
+
+	cur.execute("SELECT relname FROM pg_class;")
+	haveItems = cur.fetchall()
+	haveItems = [index[0] for index in haveItems]
+
+	cur.execute("SELECT tgname FROM pg_trigger;")
+	haveTriggers = cur.fetchall()
+	haveTriggers = [trigger[0] for trigger in haveTriggers]
+
+	cur.execute("SELECT table_name FROM information_schema.columns WHERE column_name = 'tagarr';")
+	haveColumns = cur.fetchall()
+	haveColumns = [column[0] for column in haveColumns]
+
+	# Each step is checked on it's own, so a setup that was interrupted part way
+	# (during the backfill, say) is picked up where it stopped the next time around.
+	# An interrupted backfill leaves the index missing, so it's redone from there.
+	wantTables = []
+	for table in TRACKED_TABLES:
+		tableName = table.lower()
+		if not tableName in haveItems:
+			continue
+		if (not tableName in haveColumns
+				or not '%s_tag_array_trigger' % tableName in haveTriggers
+				or not '%s_tagarr_gin_index' % tableName in haveItems):
+			wantTables.append(table)
+			continue
+
+		if not checkBackfill:
+			continue
+
+		# The trigger never leaves tagArr NULL (rows without tags get an empty array),
+		# so any NULLs are rows an unfinished backfill didn't get to.
+		cur.execute('''SELECT EXISTS (SELECT 1 FROM {tableName} WHERE tagArr IS NULL);'''.format(tableName=tableName))
+		if cur.fetchone()[0]:
+			wantTables.append(table)
+
+	if not wantTables:
+		conn.commit()
+		return
+
+	print("Ensuring tag arrays and their commit hooks exist.")
+
+	cur.execute('''
+
+CREATE OR REPLACE FUNCTION sync_tag_array() RETURNS trigger AS $$
+	BEGIN
+		NEW.tagArr := {expr};
+		RETURN NEW;
+	END;
+
+$$ LANGUAGE plpgsql;
+	'''.format(expr=TAG_ARRAY_EXPR.format(src="NEW.tags")))
+
+	for table in wantTables:
+		tableName = table.lower()
+		cur.execute('''ALTER TABLE {tableName} ADD COLUMN IF NOT EXISTS tagArr TEXT[];'''.format(tableName=tableName))
+		if not '%s_tag_array_trigger' % tableName in haveTriggers:
+			cur.execute('''CREATE TRIGGER {tableName}_tag_array_trigger
+								BEFORE INSERT OR UPDATE OF tags ON {tableName}
+								FOR EACH ROW EXECUTE PROCEDURE sync_tag_array();'''.format(tableName=tableName))
+		conn.commit()
+
+		# The trigger handles anything written from here on. Fill in the existing rows
+		# (only the ones still NULL, so a resumed backfill doesn't redo what's done).
+		cur.execute('''SELECT min(dbid), max(dbid) FROM {tableName} WHERE tagArr IS NULL;'''.format(tableName=tableName))
+		minId, maxId = cur.fetchone()
+		if minId is not None:
+			print("Backfilling tag arrays for %s rows %s-%s." % (table, minId, maxId))
+			for start in range(minId, maxId+1, BACKFILL_CHUNK):
+				cur.execute('''UPDATE {tableName} SET tagArr = {expr} WHERE dbid >= %s AND dbid < %s AND tagArr IS NULL;'''.format(
+						tableName = tableName,
+						expr      = TAG_ARRAY_EXPR.format(src="tags")),
+					(start, start+BACKFILL_CHUNK))
+				conn.commit()
+
+		if not '%s_tagarr_gin_index' % tableName in haveItems:
+			cur.execute('''CREATE INDEX {tableName}_tagArr_gin_index ON {tableName} USING gin(tagArr);'''.format(tableName=tableName))
+		conn.commit()
+
+	print("Tag arrays set up.")
+
@@ -0,0 +1,119 @@
+
+# Maintained per-tag item counts for the `tags` column of the item tables.
+# Every insert/delete (and update of the tags column) on a tracked table adjusts
+# the per-tag quantity in `tagCounts`, so the tag listings can just read the
+# precomputed counts rather then splitting the tags of every row in the table.
+#
+# Tags are whitespace-separated, and counted exactly the way the tag pages
+# did it (case-sensitive, one count per occurence).
+
+TRACKED_TABLES = ["MangaItems", "HentaiItems"]
+
+def setupTagCountTracking(conn):
+
+	cur = conn.cursor()
+
+	cur.execute('''CREATE TABLE IF NOT EXISTS tagCounts (
+										tableName     TEXT    NOT NULL,
+										tag           TEXT    NOT NULL,
+										quantity      BIGINT  NOT NULL,
+										PRIMARY KEY (tableName, tag)
+										);''')
+
+	cur.execute("SELECT relname FROM pg_class;")
+	haveItems = cur.fetchall()
+	haveItems = [index[0] for index in haveItems]
+
+	if not 'tagcounts_quantity_index' in haveItems:
+		cur.execute('''CREATE INDEX tagCounts_quantity_index ON tagCounts (tableName, quantity DESC, tag DESC);''')
+
+	cur.execute("SELECT tgname FROM pg_trigger;")
+	haveTriggers = cur.fetchall()
+	haveTriggers = [trigger[0] for trigger in haveTriggers]
+
+	wantTriggers = [table for table in TRACKED_TABLES if table.lower() in haveItems and not '%s_tag_count_trigger' % table.lower() in haveTriggers]
+	if not wantTriggers:
+		conn.commit()
+		return
+
+	print("Ensuring commit hooks for tag-count tracking exist.")
+
+	# The per-tag rows are updated in sorted order, so concurrent transactions
+	# touching overlapping tags can't deadlock each other.
+	cur.execute(r'''
+
+CREATE OR REPLACE FUNCTION update_tag_counts() RETURNS trigger AS $$
+	BEGIN
+		IF (TG_OP = 'UPDATE') THEN
+			IF (OLD.tags IS NOT DISTINCT FROM NEW.tags) THEN
+				RETURN NULL;
+			END IF;
+		END IF;
+
+		IF (TG_OP = 'DELETE' OR TG_OP = 'UPDATE') THEN
+			INSERT INTO tagCounts (tableName, tag, quantity)
+				SELECT TG_TABLE_NAME, tag, -count(*) FROM regexp_split_to_table(OLD.tags::text, '\s+') AS tag WHERE tag != '' GROUP BY tag ORDER BY tag
+				ON CONFLICT (tableName, tag) DO UPDATE SET quantity = tagCounts.quantity + EXCLUDED.quantity;
+		END IF;
+		IF (TG_OP = 'INSERT' OR TG_OP = 'UPDATE') THEN
+			INSERT INTO tagCounts (tableName, tag, quantity)
+				SELECT TG_TABLE_NAME, tag, count(*) FROM regexp_split_to_table(NEW.tags::text, '\s+') AS tag WHERE tag != '' GROUP BY tag ORDER BY tag
+				ON CONFLICT (tableName, tag) DO UPDATE SET quantity = tagCounts.quantity + EXCLUDED.quantity;
+		END IF;
+		RETURN NULL;
+	END;
+
+$$ LANGUAGE plpgsql;
+	''')
+
+	for table in wantTriggers:
+		cur.execute('''CREATE TRIGGER {tableName}_tag_count_trigger
+							AFTER INSERT OR DELETE OR UPDATE OF tags ON {tableName}
+							FOR EACH ROW EXECUTE PROCEDURE update_tag_counts();'''.format(tableName=table.lower()))
+
+		# Any rows already in the table weren't seen by the trigger.
+		countTableTags(cur, table)
+
+	conn.commit()
+	print("Hooks created.")
+
+# (Re)build the counts for `table` from scratch.
+# Writes to the table are blocked until the enclosing transaction commits, so
+# the trigger can't update counts that are about to be replaced.
+def countTableTags(cur, table):
+	print("Counting tags in table %s." % table)
+	cur.execute("LOCK TABLE {tableName} IN SHARE MODE;".format(tableName=table))
+	cur.execute("DELETE FROM tagCounts WHERE tableName=%s;", (table.lower(), ))
+	cur.execute(r'''INSERT INTO tagCounts (tableName, tag, quantity)
+						SELECT %s, tag, count(*) FROM {tableName}, regexp_split_to_table({tableName}.tags::text, '\s+') AS tag
+						WHERE tag != '' GROUP BY tag;'''.format(tableName=table), (table.lower(), ))
+
+def doTagCounts(conn):
+
+	cur = conn.cursor()
+
+	cur.execute("SELECT relname FROM pg_class;")
+	haveItems = cur.fetchall()
+	haveItems = [index[0] for index in haveItems]
+
+	for table in TRACKED_TABLES:
+		if table.lower() in haveItems:
+			countTableTags(cur, table)
+			conn.commit()
+
+	print("Tags counted.")
+
+def getTagCounts(cur, table, limit=None):
+	'''
+	Fetch (tag, quantity) for all the tags in use in item table `table`,
+	most common first.
+	'''
+
+	query = '''SELECT tag, quantity FROM tagCounts WHERE tableName=%s AND quantity > 0 ORDER BY quantity DESC, tag DESC'''
+	params = [table.lower()]
+	if limit:
+		query += " LIMIT %s"
+		params.append(limit)
+	cur.execute(query, params)
+	return cur.fetchall()
+
@@ -4,6 +4,13 @@ import time
 from UniversalArchiveInterface import ArchiveReader
 import nameTools as nt
 import logging
+import threading
+import collections
+import queue
+import io
+import os
+import contextlib
+import traceback
 
 from natsort import natsorted
 
@@ -13,19 +20,331 @@ from natsort import natsorted
 # The ViewerSession() objects are then managed by the SessionPoolManager(), which
 # is owned by the web-server, and of which there (should) only be one.
 # there is some borg-class stuff going on to make SessionPoolManager() share
-# it's state across all threads (probably an issue if I was concerned much about
-# scaling up, but I'm not, so it's not)
+# it's state across all threads. The session dict is only touched with the pool lock
+# held, and each session has it's own lock for it's state, so the (30-odd) cherrypy
+# worker threads don't stomp on each other.
+#
+# Sessions don't own archive handles. Open ArchiveReader()s are checked out of the
+# process-wide `archiveHandles` pool for the duration of a read, so parallel requests
+# for pages of the same archive each get their own handle, and the total number of
+# open archives is capped.
+
+# Max number of archive handles open at once (idle and in use), across all sessions.
+MAX_OPEN_ARCHIVES      = 16
+# Idle handles are closed after this long (in seconds).
+ARCHIVE_IDLE_TIMEOUT   = 60*10
+# How long a request will wait for a handle to free up, when all of them are in use.
+ARCHIVE_CHECKOUT_TIMEOUT = 30
+
+# Interval (in seconds) the background pruner runs at.
+SESSION_PRUNE_INTERVAL = 60
+
+
+# Page listings for recently viewed archives, shared across all sessions.
+# Building the listing means opening the archive and natsorting the file list,
+# which is slow for big RAR files, so each archive only gets indexed once
+# (until it changes on disk).
+PAGE_INDEX_CACHE_SIZE = 500
+
+# Pages after the one being viewed are decompressed in the background, into a
+# memory cache (again shared across sessions), so turning the page is just a copy.
+PREFETCH_PAGES         = 5
+PAGE_CACHE_MAX_BYTES   = 256 * 1024 * 1024
+PREFETCH_QUEUE_SIZE    = 50
+
+# Key an archive by its path, as well as its mtime and size, so replaced or
+# rewritten archives are re-read.
+def archiveKey(archPath):
+	stat = os.stat(archPath)
+	return (archPath, stat.st_mtime, stat.st_size)
+
+def getImageNames(archHandle):
+	archFiles = archHandle.getFileList()
+	ret = []
+	for item in archFiles:
+		if nt.isProbablyImage(item):
+			ret.append(item)
+	if not ret:
+		raise ValueError("No Images in archive! \n Archive contents = %s" % "\n		".join(archFiles))
+
+	# Natsorted evaluates '-' to mean a negative number
+	# This breaks sorting (it reverses it) for filenames where the spaces
+	# have been replaced with hyphens.
+	# As a work-around, and since I do not currently anticipate the need to
+	# properly sort negative numbers, use a lambda
+	# to replace all hyphens with spaces for sorting.
+	return tuple(natsorted(ret, key=lambda x: x.replace("-", " ")))
+
+class ArchiveHandlePool(object):
+	'''
+	LRU pool of open ArchiveReader() instances, keyed by archiveKey().
+
+	A handle is only ever used by one thread at a time (they aren't thread-safe),
+	via `with archiveHandles.handle(archKey) as arch:`. Idle handles for an archive
+	are reused. Once `maxOpen` handles are open, the least recently used idle
+	handle is closed to make room, and if there are none idle, checkout waits
+	for one to be returned.
+	'''
+
+	log = logging.getLogger("Main.ArchiveHandles")
+
+	def __init__(self, maxOpen=MAX_OPEN_ARCHIVES):
+		self.maxOpen = maxOpen
+		self.cond    = threading.Condition()
+
+		# (archKey, handle) -> time returned, least recently used first.
+		self.idle    = collections.OrderedDict()
+		self.inUse   = 0
+
+		self.opened  = 0
+		self.evicted = 0
+
+	def _close(self, handle):
+		try:
+			handle.close()
+		except Exception:
+			self.log.error("Failed to close archive handle!")
+
+	def checkout(self, archKey):
+		toClose = None
+		with self.cond:
+			deadline = time.time() + ARCHIVE_CHECKOUT_TIMEOUT
+			while True:
+				for idleKey in reversed(self.idle):
+					if idleKey[0] == archKey:
+						self.idle.pop(idleKey)
+						self.inUse += 1
+						return idleKey[1]
+
+				if self.inUse + len(self.idle) < self.maxOpen:
+					break
+				if self.idle:
+					(dummy_key, toClose), dummy_time = self.idle.popitem(last=False)
+					self.evicted += 1
+					break
+
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					raise ValueError("Timed out waiting for a free archive handle!")
+				self.cond.wait(remaining)
+
+			self.inUse += 1
+			self.opened += 1
+
+		# Archives are opened/closed outside the lock, since that can be slow.
+		if toClose:
+			self._close(toClose)
+		try:
+			return ArchiveReader(archKey[0])
+		except Exception:
+			with self.cond:
+				self.inUse -= 1
+				self.cond.notify()
+			raise
+
+	def checkin(self, archKey, handle, discard=False):
+		with self.cond:
+			self.inUse -= 1
+			if not discard:
+				self.idle[(archKey, handle)] = time.time()
+			self.cond.notify()
+		if discard:
+			self._close(handle)
+
+	@contextlib.contextmanager
+	def handle(self, archKey):
+		arch = self.checkout(archKey)
+		try:
+			yield arch
+		except Exception:
+			# Don't hand out a handle that may be in a broken state.
+			self.checkin(archKey, arch, discard=True)
+			raise
+		else:
+			self.checkin(archKey, arch)
+
+	def pruneIdle(self, maxAge=ARCHIVE_IDLE_TIMEOUT):
+		toClose = []
+		with self.cond:
+			now = time.time()
+			for idleKey, returned in list(self.idle.items()):
+				if now - returned > maxAge:
+					self.idle.pop(idleKey)
+					toClose.append(idleKey[1])
+			self.cond.notify_all()
+		for handle in toClose:
+			self._close(handle)
+		return len(toClose)
+
+	def getStats(self):
+		with self.cond:
+			return {
+				"idle"    : len(self.idle),
+				"inUse"   : self.inUse,
+				"opened"  : self.opened,
+				"evicted" : self.evicted,
+			}
+
+archiveHandles = ArchiveHandlePool()
+
+class ArchiveCache(object):
+	'''
+	The page indexes (sorted image names) of recently viewed archives, and
+	a byte-limited LRU of decompressed page contents, with a background thread
+	filling the page cache ahead of the reader.
+
+	There's one of these per process (`archiveCache`, below).
+	'''
+
+	log = logging.getLogger("Main.ArchiveCache")
+
+	def __init__(self, maxIndexes=PAGE_INDEX_CACHE_SIZE, maxBytes=PAGE_CACHE_MAX_BYTES):
+		self.maxIndexes = maxIndexes
+		self.maxBytes   = maxBytes
+
+		self.lock       = threading.Lock()
+		self.indexes    = collections.OrderedDict()
+		self.pages      = collections.OrderedDict()
+		self.pageBytes  = 0
+
+		self.stats = {
+			"indexHits"   : 0,
+			"indexMisses" : 0,
+			"pageHits"    : 0,
+			"pageMisses"  : 0,
+			"prefetched"  : 0,
+			"prefetchErrors" : 0,
+		}
+
+		self.prefetchQueue  = queue.Queue(maxsize=PREFETCH_QUEUE_SIZE)
+		self.prefetchThread = None
+
+	def _count(self, stat):
+		self.stats[stat] += 1
+
+	def getIndex(self, archKey, archHandle=None):
+		'''
+		Get the sorted page names for the archive identified by `archKey` (from archiveKey()).
+		If the archive isn't cached, it's read through `archHandle` (or opened, if that's None).
+		'''
+		with self.lock:
+			if archKey in self.indexes:
+				self.indexes.move_to_end(archKey)
+				self._count("indexHits")
+				return self.indexes[archKey]
+			self._count("indexMisses")
+
+		if archHandle is None:
+			with archiveHandles.handle(archKey) as arch:
+				names = getImageNames(arch)
+		else:
+			names = getImageNames(archHandle)
+
+		with self.lock:
+			self.indexes[archKey] = names
+			while len(self.indexes) > self.maxIndexes:
+				self.indexes.popitem(last=False)
+		return names
+
+	def getPage(self, archKey, internalPath):
+		with self.lock:
+			pageKey = (archKey, internalPath)
+			if pageKey in self.pages:
+				self.pages.move_to_end(pageKey)
+				self._count("pageHits")
+				return self.pages[pageKey]
+			self._count("pageMisses")
+			return None
+
+	def hasPage(self, archKey, internalPath):
+		with self.lock:
+			return (archKey, internalPath) in self.pages
+
+	def putPage(self, archKey, internalPath, content):
+		# Don't let a single huge file flush the whole cache.
+		if len(content) > self.maxBytes / 4:
+			return
+
+		with self.lock:
+			pageKey = (archKey, internalPath)
+			if pageKey in self.pages:
+				return
+			self.pages[pageKey] = content
+			self.pageBytes += len(content)
+			while self.pageBytes > self.maxBytes:
+				dummy_key, dropped = self.pages.popitem(last=False)
+				self.pageBytes -= len(dropped)
+
+	def prefetch(self, archKey, internalPaths):
+		'''
+		Queue `internalPaths` from archive `archKey` to be decompressed into the page cache.
+		If the prefetcher is backed up, the request is just dropped.
+		'''
+		internalPaths = [path for path in internalPaths if not self.hasPage(archKey, path)]
+		if not internalPaths:
+			return
+
+		self._ensurePrefetcher()
+		try:
+			self.prefetchQueue.put_nowait((archKey, internalPaths))
+		except queue.Full:
+			pass
+
+	def _ensurePrefetcher(self):
+		with self.lock:
+			if self.prefetchThread and self.prefetchThread.is_alive():
+				return
+			self.prefetchThread = threading.Thread(target=self._prefetchLoop, name="ArchivePrefetch", daemon=True)
+			self.prefetchThread.start()
+
+	def _prefetchLoop(self):
+		while True:
+			archKey, internalPaths = self.prefetchQueue.get()
+			try:
+				with archiveHandles.handle(archKey) as arch:
+					for internalPath in internalPaths:
+						if self.hasPage(archKey, internalPath):
+							continue
+						self.putPage(archKey, internalPath, arch.open(internalPath).read())
+						with self.lock:
+							self._count("prefetched")
+
+			except Exception:
+				self.log.error("Failed to prefetch pages from '%s'", archKey[0])
+				with self.lock:
+					self._count("prefetchErrors")
+
+	def getStats(self):
+		with self.lock:
+			ret = dict(self.stats)
+			ret["indexes"]   = len(self.indexes)
+			ret["pages"]     = len(self.pages)
+			ret["pageBytes"] = self.pageBytes
+
+		indexLookups = ret["indexHits"] + ret["indexMisses"]
+		pageLookups  = ret["pageHits"]  + ret["pageMisses"]
+		ret["indexHitRate"] = ret["indexHits"] / indexLookups if indexLookups else 0
+		ret["pageHitRate"]  = ret["pageHits"]  / pageLookups  if pageLookups  else 0
+		return ret
+
+archiveCache = ArchiveCache()
 
 class ViewerSession(object):
 
-	archFiles = None
 	items     = None
 	def __init__(self):
-		self.archHandle = None
+		self.archKey    = None
+
+		# The web-server can request several pages for one session at the same time.
+		# This guards the session's state (which archive is open, and it's index), not the reads.
+		self.lock       = threading.Lock()
 		self.lastAccess = time.time()
 
 		self.pruneAge = 60*120		 # in Seconds, prune if no access for 120 minutes
 
+	def touch(self):
+		self.lastAccess = time.time()
+
 	def shouldPrune(self):
 		lastChange = time.time() - self.lastAccess
 		if lastChange > self.pruneAge:
@@ -34,37 +353,21 @@ class ViewerSession(object):
 			return False
 
 	def checkOpenArchive(self, archPath):
-		if not self.archHandle or self.archHandle.archPath != archPath:
-			self.archHandle = ArchiveReader(archPath)
-			self.buildImageLookupDict()
+		archKey = archiveKey(archPath)
+		with self.lock:
+			if self.archKey != archKey:
+				# The archive itself is only opened once a page that's not cached is requested.
+				self.items   = self.buildImageLookupDict(archKey)
+				self.archKey = archKey
 
-		self.lastAccess = time.time()
+		self.touch()
 
-	def getImageNames(self):
-		if not self.archHandle:
-			raise ValueError()
-
-		self.archFiles = self.archHandle.getFileList()
-		ret = []
-		for item in self.archFiles:
-			if nt.isProbablyImage(item):
-				ret.append(item)
-		if not ret:
-			raise ValueError("No Images in archive! \n Archive contents = %s" % "\n		".join(self.archFiles))
-		return ret
-
-	def buildImageLookupDict(self):
-		names = self.getImageNames()
-
-		# Natsorted evaluates '-' to mean a negative number
-		# This breaks sorting (it reverses it) for filenames where the spaces
-		# have been replaced with hyphens.
-		# As a work-around, and since I do not currently anticipate the need to
-		# properly sort negative numbers, use a lambda
-		# to replace all hyphens with spaces for sorting.
-		names = natsorted(names, key=lambda x: x.replace("-", " "))
+	def getImageNames(self, archKey):
+		return archiveCache.getIndex(archKey)
 
-		self.items = dict(zip(range(len(names)), names))
+	def buildImageLookupDict(self, archKey):
+		names = self.getImageNames(archKey)
+		return dict(zip(range(len(names)), names))
 
 	def getKeys(self):
 		try:
@@ -72,23 +375,58 @@ class ViewerSession(object):
 			return keys
 
 		except AttributeError:
-			raise ValueError("No Images in archive! \n Archive contents = %s" % "\n		".join(self.archFiles))
+			raise ValueError("No Images in archive!")
 
-	def getItemByKey(self, itemKey):
-		if not itemKey in self.items:
+	def getItemInfo(self, itemKey):
+		'''
+		Returns the (archiveKey(), internal path) of the page at `itemKey`, without reading it.
+		'''
+		with self.lock:
+			archKey, items = self.archKey, self.items
+
+		if not items or not itemKey in items:
+			raise KeyError("Invalid key. Not in archive!")
+		return archKey, items[itemKey]
+
+	def getItemByKey(self, itemKey, archKey=None):
+		'''
+		Returns a file-like object of the page at `itemKey`, and it's internal path.
+		If `archKey` is passed (from getItemInfo()), the page is read from that archive
+		even if the session has switched to another one since.
+		'''
+		with self.lock:
+			if archKey is None or archKey == self.archKey:
+				archKey, items = self.archKey, self.items
+			else:
+				items = None
+		self.touch()
+
+		if items is None and archKey is not None:
+			names = archiveCache.getIndex(archKey)
+			items = dict(zip(range(len(names)), names))
+
+		if not items or not itemKey in items:
 			raise KeyError("Invalid key. Not in archive!")
 
-		internalPath = self.items[itemKey]
-		itemContent = self.archHandle.open(internalPath)
-		return itemContent, internalPath
+		internalPath = items[itemKey]
+
+		# Start decompressing the next few pages while this one is sent.
+		following = range(itemKey+1, itemKey+1+PREFETCH_PAGES)
+		archiveCache.prefetch(archKey, [items[key] for key in following if key in items])
 
+		itemContent = archiveCache.getPage(archKey, internalPath)
+		if itemContent is None:
+			with archiveHandles.handle(archKey) as arch:
+				itemContent = arch.open(internalPath).read()
+			archiveCache.putPage(archKey, internalPath, itemContent)
 
-	def __del__(self):
-		if self.archHandle:
-			del self.archHandle
+		return io.BytesIO(itemContent), internalPath
 
-# There are some subtle race conditions here (a cookie item being deleted after it's checked to
-# exist, before it's subsequentially accessed). I'm ignoring them at the moment.
+
+# A session can still be pruned between a request checking it exists, and it
+# being fetched (`__getitem__` will then raise KeyError). Fetching a session
+# marks it as accessed, so this can only happen to sessions that have been idle
+# for `pruneAge`.
 
 class SessionPoolManager(object):
 
@@ -99,48 +437,71 @@ class SessionPoolManager(object):
 	lastSession = 0
 	sessions = {}
 
+	lock = threading.RLock()
+	pruneThread = None
+
 	log = logging.getLogger("Main.SessionMgr")
 
 	def __init__(self):
 		self.__dict__ = self._shared_state
-
+		self.startPruner()
 
 	def __getitem__(self, key):
-		return self.sessions[key]
+		with self.lock:
+			session = self.sessions[key]
+		session.touch()
+		return session
 
 	def __contains__(self, key):
-		return key in self.sessions
+		with self.lock:
+			return key in self.sessions
 
 	def getNewSessionKey(self):
-		self.prune()
 		self.log.info("Creating session")
 
-		self.lastSession += 1
-		newKey = self.lastSession
-		self.sessions[newKey] = ViewerSession()
+		with self.lock:
+			self.lastSession += 1
+			newKey = self.lastSession
+			self.sessions[newKey] = ViewerSession()
 
+		# Enforce the session limit immediately, the age-based pruning can wait for the pruner.
+		self.prune()
 		return newKey
 
+	def startPruner(self):
+		with self.lock:
+			if self.pruneThread and self.pruneThread.is_alive():
+				return
+			self.pruneThread = threading.Thread(target=self._pruneLoop, name="SessionPruner", daemon=True)
+			self.pruneThread.start()
+
+	def _pruneLoop(self):
+		while True:
+			time.sleep(SESSION_PRUNE_INTERVAL)
+			try:
+				self.prune()
+				closed = archiveHandles.pruneIdle()
+				if closed:
+					self.log.info("Closed %s idle archive handles", closed)
+			except Exception:
+				self.log.error("Error while pruning sessions!")
+				for line in traceback.format_exc().split("\n"):
+					self.log.error(line)
 
 	def prune(self):
-		self.log.info("Checking if any of %s session cookies need to be pruned due to age", len(self.sessions))
-		for key in list(self.sessions.keys()):
-			if self.sessions[key].shouldPrune():
-				self.log.info("Pruning stale session with ID %s", key)
-				try:
+		with self.lock:
+			self.log.info("Checking if any of %s session cookies need to be pruned due to age", len(self.sessions))
+			for key in list(self.sessions.keys()):
+				if self.sessions[key].shouldPrune():
+					self.log.info("Pruning stale session with ID %s", key)
 					self.sessions.pop(key)
-				except KeyError:
-					self.log.error("Failed to prune session?")
-					self.log.error("Current sessions:")
-					for key, session in self.sessions.items():
-						self.log.error("	'{key}' -> '{sess}'".format(key=key, sess=session))
-		if len(self.sessions) > self.max_sessions:
-			self.log.info("Need to prune sessions due to session limits")
-			sessionList = list(self.sessions.keys())
-			sessionList.sort()
-			while len(sessionList) > self.max_sessions:
-				delSession = sessionList.pop(0)
-				self.log.info("Pruning oldest session with ID %s", delSession)
-				self.sessions.pop(delSession)
 
+			if len(self.sessions) > self.max_sessions:
+				self.log.info("Need to prune sessions due to session limits")
+				sessionList = list(self.sessions.keys())
+				sessionList.sort()
+				while len(sessionList) > self.max_sessions:
+					delSession = sessionList.pop(0)
+					self.log.info("Pruning oldest session with ID %s", delSession)
+					self.sessions.pop(delSession)
 
@@ -17,6 +17,13 @@ DATABASE_IP      = "127.0.0.1"
 # Note that a local socket will be tried before the DATABASE_IP value, so if DATABASE_IP is
 # invalid, it may work anyways.
 
+# Maximum number of pooled database connections per process (optional, defaults to 10).
+# The web server raises this for itself, since it serves many concurrent requests.
+# DATABASE_POOL_SIZE = 10
+
+# Seconds to wait for a free pooled connection before giving up (optional, defaults to 300).
+# DATABASE_POOL_TIMEOUT = 300
+
 
 # Note: Paths have to be absolute.
 pickedDir        = r"/SOMETHING/MP"
@@ -47,6 +54,20 @@ webMvcPath       = '/SOMETHING/MangaCMS/ctnt/mvcCtnt'
 staticCtntPath   = '/SOMETHING/MangaCMS/ctnt/staticContent'
 bookCachePath    = '/SOMETHING/MangaCMS/BookCache'
 
+# Downscaled page/cover images for the reader (`?size=small`, etc...) are cached here.
+# The cache is pruned to stay under RENDITION_CACHE_MAX_BYTES.
+renditionCachePath        = '/SOMETHING/MangaCMS/RenditionCache'
+RENDITION_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+# Cached feed/listing pages, for the scrapers that only re-parse pages that have changed.
+# Entries not seen for HTTP_CACHE_MAX_AGE seconds are dropped, and the cache is kept under HTTP_CACHE_MAX_BYTES.
+httpCachePath             = '/SOMETHING/MangaCMS/HttpCache'
+HTTP_CACHE_MAX_BYTES      = 512 * 1024 * 1024
+HTTP_CACHE_MAX_AGE        = 60 * 60 * 24 * 30
+
+# Checkpoints for the library dedup scans (`dir-clean`, `dirs-clean`), so interrupted runs can resume.
+dedupCheckpointPath       = '/SOMETHING/MangaCMS/DedupCheckpoints'
+
 # Path to the directory of images that get auto-removed from archives on download.
 badImageDir  = r"/SOMETHING/MangaCMS/removeImages"
 
@@ -1,27 +1,17 @@
 
-import psycopg2
-import settings
+import dbPool
 
 
 # Manage the small table used to track plugin run state.
 
 def getConn():
 	'''
-	Try to get a local connection to the postgres DB. If that fails, try a IP connection. Will raise
-	an exception if the IP connection cannot be made.
+	Check a connection out of the process-wide connection pool.
 
-	Returns a psycopg2 connection on success.
+	Returns a psycopg2 connection on success. The caller has to hand it back
+	with `dbPool.pool.putconn()` when done.
 	'''
-	try:
-		con = psycopg2.connect(dbname  = settings.DATABASE_DB_NAME,
-								user    = settings.DATABASE_USER,
-								password= settings.DATABASE_PASS)
-	except:
-		con = psycopg2.connect(host    = settings.DATABASE_IP,
-								dbname  = settings.DATABASE_DB_NAME,
-								user    = settings.DATABASE_USER,
-								password= settings.DATABASE_PASS)
-	return con
+	return dbPool.pool.getconn()
 
 def checkStatusTableExists():
 	'''
@@ -29,18 +19,15 @@ def checkStatusTableExists():
 	the plugin RunBase will fail with an exception.
 	'''
 
-	con = getConn()
-	cur = con.cursor()
+	with dbPool.pool.connection() as con:
+		cur = con.cursor()
 
-	cur.execute('''CREATE TABLE IF NOT EXISTS pluginStatus (name        text,
-														running     boolean,
-														lastRun     double precision,
-														lastRunTime double precision,
-														lastError   double precision DEFAULT 0,
-														PRIMARY KEY(name))''')
-
-	con.commit()
-	con.close()
+		cur.execute('''CREATE TABLE IF NOT EXISTS pluginStatus (name        text,
+															running     boolean,
+															lastRun     double precision,
+															lastRunTime double precision,
+															lastError   double precision DEFAULT 0,
+															PRIMARY KEY(name))''')
 
 
 def getStatus(cur, pluginName):
@@ -57,10 +44,9 @@ def resetAllRunningFlags():
 
 	checkStatusTableExists()
 	print("Resetting run state for all plugins!")
-	con = getConn()
-	cur = con.cursor()
-	cur.execute('''UPDATE pluginstatus SET running=false;''')
-	con.commit()
-	con.close()
+	with dbPool.pool.connection() as con:
+		cur = con.cursor()
+		cur.execute('''UPDATE pluginstatus SET running=false;''')
+
 
 
@@ -0,0 +1,93 @@
+import os
+import os.path
+import zipfile
+
+import pytest
+
+import archCleaner
+
+ADVERT = b"ADVERT" * 1000
+
+@pytest.fixture
+def badContent(tmp_path, monkeypatch):
+	badDir = tmp_path / "bad"
+	badDir.mkdir()
+	(badDir / "ad.png").write_bytes(ADVERT)
+	registry = archCleaner.BadContentRegistry(badImageDir=str(badDir))
+	monkeypatch.setattr(archCleaner, "badContent", registry)
+	return registry
+
+def make_zip(path, members):
+	with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zfp:
+		for name, contents in members:
+			zfp.writestr(name, contents)
+	return path
+
+PAGES = [("%02d.jpg" % x, os.urandom(1000) + b"\0" * 5000) for x in range(5)]
+
+def test_registry(badContent, tmp_path, monkeypatch):
+	assert badContent.maybeBad(len(ADVERT))
+	assert not badContent.maybeBad(len(ADVERT) + 1)
+	assert not badContent.maybeBad(len(ADVERT), 1234)
+
+	# Picks up new images, once the reload interval has passed.
+	monkeypatch.setattr(archCleaner, "BAD_CONTENT_RELOAD_INTERVAL", 0)
+	os.utime(badContent.badImageDir, (0, 0))
+	(tmp_path / "bad" / "other.png").write_bytes(b"other")
+	assert badContent.maybeBad(5)
+
+def test_ingest_removes_advert(badContent, tmp_path):
+	path = make_zip(str(tmp_path / "a.zip"), PAGES[:2] + [("ad.jpg", ADVERT), ("__MACOSX/junk", b"junk")] + PAGES[2:])
+	before = {info.filename : info for info in zipfile.ZipFile(path).infolist()}
+
+	tags, newPath, fileHashes = archCleaner.ArchCleaner().ingestArchive(path)
+	assert tags == ""
+	assert newPath == path
+	assert [name for name, dummy_hash, dummy_size in fileHashes] == [name for name, dummy_ctnt in PAGES]
+
+	with zipfile.ZipFile(path) as zfp:
+		assert zfp.testzip() is None
+		assert zfp.namelist() == [name for name, dummy_ctnt in PAGES[:2]] + ["ad.jpg.deleted.txt"] + [name for name, dummy_ctnt in PAGES[2:]]
+		for name, contents in PAGES:
+			assert zfp.read(name) == contents
+			# Copied across still compressed.
+			assert zfp.getinfo(name).compress_type == zipfile.ZIP_DEFLATED
+			assert zfp.getinfo(name).compress_size == before[name].compress_size
+
+def test_clean_untouched(badContent, tmp_path):
+	path = make_zip(str(tmp_path / "a.zip"), PAGES)
+	mtime = os.stat(path).st_mtime_ns
+
+	newPath, fileCount = archCleaner.ArchCleaner().cleanZip(path)
+	assert newPath == path
+	assert fileCount == len(PAGES)
+	assert os.stat(path).st_mtime_ns == mtime
+
+def test_clean_without_hashing(badContent, tmp_path, monkeypatch):
+	path = make_zip(str(tmp_path / "a.zip"), PAGES + [("ad.jpg", ADVERT), ("Thumbs.db", b"junk")])
+
+	# Only the member that could be the advert should be read.
+	badContent.reload()
+	hashed = []
+	realMd5 = archCleaner.hashlib.md5
+	monkeypatch.setattr(archCleaner.hashlib, "md5", lambda data: hashed.append(data) or realMd5(data))
+
+	archCleaner.ArchCleaner().cleanZip(path)
+	assert hashed == [ADVERT]
+
+	with zipfile.ZipFile(path) as zfp:
+		assert zfp.namelist() == [name for name, dummy_ctnt in PAGES] + ["ad.jpg.deleted.txt"]
+		for name, contents in PAGES:
+			assert zfp.read(name) == contents
+
+def test_rebuild_keeps_timestamps(badContent, tmp_path):
+	path = str(tmp_path / "a.zip")
+	with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zfp:
+		for name, contents in PAGES[:2] + [("ad.jpg", ADVERT)]:
+			zfp.writestr(zipfile.ZipInfo(name, (2001, 2, 3, 4, 5, 6)), contents)
+
+	archCleaner.ArchCleaner().ingestArchive(path)
+	with zipfile.ZipFile(path) as zfp:
+		assert zfp.namelist() == [name for name, dummy_ctnt in PAGES[:2]] + ["ad.jpg.deleted.txt"]
+		assert all(info.date_time == (2001, 2, 3, 4, 5, 6) for info in zfp.infolist())
+	assert not os.path.exists(path + ".tmp")
@@ -0,0 +1,151 @@
+import runStatus
+runStatus.preloadDicts = False
+
+import io
+import os
+import time
+import tempfile
+import threading
+
+import sessionManager
+
+# Stands in for UniversalArchiveInterface.ArchiveReader, counting how often archives get opened and read.
+class FakeArchive(object):
+	opens  = 0
+	reads  = 0
+	closes = 0
+	contents = {
+		"page-10.jpg" : b"10",
+		"page-2.jpg"  : b"2",
+		"page-1.jpg"  : b"1",
+		"notes.txt"   : b"txt",
+	}
+	def __init__(self, archPath):
+		FakeArchive.opens += 1
+		self.archPath = archPath
+
+	def getFileList(self):
+		return list(self.contents.keys())
+
+	def open(self, internalPath):
+		FakeArchive.reads += 1
+		return io.BytesIO(self.contents[internalPath])
+
+	def close(self):
+		FakeArchive.closes += 1
+
+def setup_module(module):
+	module.oldReader, sessionManager.ArchiveReader = sessionManager.ArchiveReader, FakeArchive
+
+def teardown_module(module):
+	sessionManager.ArchiveReader = module.oldReader
+
+def make_archive():
+	fd, path = tempfile.mkstemp(suffix=".zip")
+	os.close(fd)
+	return path
+
+def test_shared_index():
+	oldCache, sessionManager.archiveCache = sessionManager.archiveCache, sessionManager.ArchiveCache()
+	try:
+		path = make_archive()
+		FakeArchive.opens = 0
+
+		first = sessionManager.ViewerSession()
+		first.checkOpenArchive(path)
+		assert [first.items[key] for key in first.getKeys()] == ["page-1.jpg", "page-2.jpg", "page-10.jpg"]
+
+		second = sessionManager.ViewerSession()
+		second.checkOpenArchive(path)
+		assert second.items == first.items
+		assert FakeArchive.opens == 1
+
+		stats = sessionManager.archiveCache.getStats()
+		assert stats["indexHits"] == 1 and stats["indexMisses"] == 1
+	finally:
+		sessionManager.archiveCache = oldCache
+
+def test_prefetch():
+	oldCache, sessionManager.archiveCache = sessionManager.archiveCache, sessionManager.ArchiveCache()
+	try:
+		path = make_archive()
+		session = sessionManager.ViewerSession()
+		session.checkOpenArchive(path)
+
+		fp, name = session.getItemByKey(0)
+		assert (fp.read(), name) == (b"1", "page-1.jpg")
+
+		archKey = sessionManager.archiveKey(path)
+		for dummy_x in range(100):
+			if sessionManager.archiveCache.hasPage(archKey, "page-10.jpg"):
+				break
+			time.sleep(0.01)
+
+		FakeArchive.reads = 0
+		fp, name = session.getItemByKey(2)
+		assert (fp.read(), name) == (b"10", "page-10.jpg")
+		assert FakeArchive.reads == 0
+		assert sessionManager.archiveCache.getStats()["prefetched"] == 2
+	finally:
+		sessionManager.archiveCache = oldCache
+
+def test_page_cache_limit():
+	cache = sessionManager.ArchiveCache(maxBytes=100)
+	for x in range(10):
+		cache.putPage("arch", x, b"x" * 20)
+	assert cache.getStats()["pageBytes"] <= 100
+	assert not cache.hasPage("arch", 0)
+	assert cache.hasPage("arch", 9)
+
+def test_handle_pool():
+	pool = sessionManager.ArchiveHandlePool(maxOpen=2)
+	FakeArchive.opens, FakeArchive.closes = 0, 0
+
+	# Concurrent users of one archive get separate handles.
+	first  = pool.checkout("a")
+	second = pool.checkout("a")
+	assert first is not second
+
+	# Everything's in use, so a third checkout has to wait for a handle to come back.
+	got = []
+	waiter = threading.Thread(target=lambda: got.append(pool.checkout("b")))
+	waiter.start()
+	time.sleep(0.05)
+	assert not got
+	pool.checkin("a", first)
+	waiter.join(1)
+	assert got and FakeArchive.closes == 1
+	pool.checkin("b", got[0])
+
+	# Idle handles are reused.
+	with pool.handle("b") as arch:
+		assert arch is got[0]
+	assert FakeArchive.opens == 3
+
+	pool.checkin("a", second)
+	assert pool.pruneIdle(maxAge=-1) == 2
+	assert pool.getStats()["idle"] == 0
+
+def test_session_pool():
+	manager = sessionManager.SessionPoolManager()
+	keys = [manager.getNewSessionKey() for dummy_x in range(manager.max_sessions + 5)]
+	assert len(manager.sessions) == manager.max_sessions
+	assert keys[0] not in manager
+	assert keys[-1] in manager
+
+	# Fetching a session counts as accessing it.
+	manager.sessions[keys[-1]].lastAccess = 0
+	manager.sessions[keys[-2]].lastAccess = 0
+	manager[keys[-1]]
+	manager.prune()
+	assert keys[-1] in manager
+	assert keys[-2] not in manager
+
+if __name__ == "__main__":
+	setup_module(globals())
+	test_shared_index()
+	test_prefetch()
+	test_page_cache_limit()
+	test_handle_pool()
+	test_session_pool()
+	print("OK")
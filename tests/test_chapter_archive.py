@@ -0,0 +1,72 @@
+
+import runStatus
+runStatus.preloadDicts = False
+
+import os
+import time
+import random
+import zipfile
+import tempfile
+
+from ScrapePlugins.RetreivalBase import ChapterArchiveWriter
+
+
+def fakeFetch(imgCnt, imgUrl):
+	# Jitter, so concurrent fetches complete out of order.
+	time.sleep(random.random() * 0.01)
+	return "{num:03.0f} - {srcName}".format(num=imgCnt, srcName=imgUrl), imgUrl.encode("utf-8") * 100
+
+def failingFetch(imgCnt, imgUrl):
+	if imgCnt == 3:
+		raise ValueError("Failed to retreive image!")
+	return fakeFetch(imgCnt, imgUrl)
+
+def get_jobs(count=40):
+	return list(enumerate(["image-%s.jpg" % x for x in range(count)], 1))
+
+def test_ordered_write():
+	runStatus.run = True
+	for workers in (1, 4):
+		tmpDir = tempfile.mkdtemp()
+		fqFName = os.path.join(tmpDir, "test.zip")
+		with ChapterArchiveWriter(fqFName) as arch:
+			assert arch.fetchPages(get_jobs(), fakeFetch, workers=workers)
+			assert not os.path.exists(fqFName)
+			arch.commit()
+
+		assert os.listdir(tmpDir) == ["test.zip"]
+		names = zipfile.ZipFile(fqFName).namelist()
+		assert names == [fakeFetch(num, url)[0] for num, url in get_jobs()]
+
+def test_failure_cleanup():
+	runStatus.run = True
+	for workers in (1, 4):
+		tmpDir = tempfile.mkdtemp()
+		fqFName = os.path.join(tmpDir, "test.zip")
+		try:
+			with ChapterArchiveWriter(fqFName) as arch:
+				arch.fetchPages(get_jobs(), failingFetch, workers=workers)
+				arch.commit()
+			assert False, "Should have raised!"
+		except ValueError:
+			pass
+
+		assert os.listdir(tmpDir) == []
+
+def test_exit_flag():
+	tmpDir = tempfile.mkdtemp()
+	fqFName = os.path.join(tmpDir, "test.zip")
+	runStatus.run = False
+	try:
+		with ChapterArchiveWriter(fqFName) as arch:
+			assert not arch.fetchPages(get_jobs(), fakeFetch, workers=4)
+	finally:
+		runStatus.run = True
+
+	assert os.listdir(tmpDir) == []
+
+if __name__ == "__main__":
+	test_ordered_write()
+	test_failure_cleanup()
+	test_exit_flag()
+	print("OK")
@@ -0,0 +1,57 @@
+import time
+
+import dbTiming
+
+class FakeCursor(object):
+	rowcount = -1
+	def __init__(self):
+		self.closed = False
+	def execute(self, query, args=None):
+		time.sleep(float(args[0]) if args else 0)
+		self.rowcount = 3
+	def fetchall(self):
+		return [(1, ), (2, ), (3, )]
+	def __enter__(self):
+		return self
+	def __exit__(self, *args):
+		self.closed = True
+
+class FakeConn(object):
+	closed = False
+	def cursor(self):
+		return FakeCursor()
+
+def test_timed_cursor():
+	log = dbTiming.QueryLog("/page")
+	conn = dbTiming.TimedConnection(FakeConn(), log)
+	with conn.cursor() as cur:
+		cur.execute("SELECT  *\n  FROM x WHERE y=%s;", (0.01, ))
+		assert cur.fetchall() == [(1, ), (2, ), (3, )]
+	assert not conn.closed
+	assert len(log.queries) == 1
+	duration, rows, query = log.queries[0]
+	assert duration >= 0.01 and rows == 3
+
+def test_stats():
+	stats = dbTiming.QueryStats()
+	for x in range(dbTiming.SLOW_QUERY_COUNT + 10):
+		log = dbTiming.QueryLog("/page-%s" % (x % 2))
+		log.record(b"SELECT   %d" % x, x, 1)
+		log.record("SELECT 0", 0, 1)
+		stats.add(log)
+
+	slow = stats.getSlowQueries()
+	assert len(slow) == dbTiming.SLOW_QUERY_COUNT
+	assert slow[0][:3] == (dbTiming.SLOW_QUERY_COUNT + 9, 1, "SELECT %d" % (dbTiming.SLOW_QUERY_COUNT + 9))
+
+	pages = stats.getPageStats()
+	assert [page[0] for page in pages] == ["/page-1", "/page-0"]
+	assert pages[0][1:3] == ((dbTiming.SLOW_QUERY_COUNT + 10) // 2, dbTiming.SLOW_QUERY_COUNT + 10)
+
+	stats.reset()
+	assert not stats.getSlowQueries() and not stats.getPageStats()
+
+if __name__ == "__main__":
+	test_timed_cursor()
+	test_stats()
+	print("OK")
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+pytest.importorskip("rpyc")
+
+import deduplicator.dedupClient as dedupClient
+
+class FakeRoot(object):
+	def __init__(self, server):
+		self.server = server
+
+	def processDownload(self, archPath, **kwargs):
+		self.server.calls.append(("single", archPath, kwargs))
+		if archPath == "broken":
+			raise ValueError("Broken archive")
+		return "", None, {}
+
+	def processDownloadHashes(self, archPath, fileHashes, **kwargs):
+		self.server.calls.append(("hashes", archPath, kwargs))
+		return "duplicate", "/other/" + archPath, {}
+
+class FakeBatchRoot(FakeRoot):
+	def processDownloads(self, items, **kwargs):
+		self.server.calls.append(("batch", [path for path, dummy_hashes in items], kwargs))
+		return [("", None, {}) for dummy_item in items]
+
+class FakeConn(object):
+	def __init__(self, server):
+		self.root   = server.rootCls(server)
+		self.closed = False
+
+	def close(self):
+		self.closed = True
+
+class FakeServer(object):
+	def __init__(self, rootCls=FakeRoot):
+		self.rootCls = rootCls
+		self.calls   = []
+		self.conns   = []
+
+	def connect(self):
+		conn = FakeConn(self)
+		self.conns.append(conn)
+		return conn
+
+def make_client(server, poolSize=2):
+	client = dedupClient.DedupClient(poolSize=poolSize)
+	client._connect = server.connect
+	return client
+
+def test_connection_reuse():
+	server = FakeServer()
+	client = make_client(server)
+	for dummy_x in range(5):
+		assert client.processDownload("a.zip") == ("", None, {})
+	assert len(server.conns) == 1
+	assert client.getStats()["idle"] == 1
+
+def test_closed_connection_replaced():
+	server = FakeServer()
+	client = make_client(server)
+	client.processDownload("a.zip")
+	server.conns[0].closed = True
+	client.processDownload("b.zip")
+	assert len(server.conns) == 2
+	assert client.getStats()["open"] == 1
+
+def test_hashes_passed():
+	server = FakeServer()
+	client = make_client(server)
+	status, bestMatch, dummy_intersections = client.processDownload("a.zip", [("1.jpg", "abc", 10)])
+	assert status == "duplicate"
+	assert bestMatch == "/other/a.zip"
+	assert server.calls[0][0] == "hashes"
+
+def test_batch_fallback():
+	server = FakeServer()
+	client = make_client(server)
+	results = client.processDownloads(["a.zip", "broken", ("c.zip", None)], distance=4, locked=False)
+	assert [result.archPath for result in results] == ["a.zip", "broken", "c.zip"]
+	assert results[0].error is None
+	assert isinstance(results[1].error, ValueError)
+	assert all(call[2]["distance"] == 4 for call in server.calls)
+	# The single calls run concurrently, so they have to hold the server lock.
+	assert all(call[2]["locked"] for call in server.calls)
+	assert len(server.conns) <= 2
+
+def test_batch_call():
+	server = FakeServer(FakeBatchRoot)
+	client = make_client(server)
+	paths = ["%s.zip" % x for x in range(dedupClient.DEDUP_BATCH_SIZE + 5)]
+	results = client.processDownloads(paths)
+	assert [result.archPath for result in results] == paths
+	assert [call[0] for call in server.calls] == ["batch", "batch"]
+
+def test_pool_limit():
+	server = FakeServer()
+	client = make_client(server, poolSize=3)
+	threads = [threading.Thread(target=client.processDownloads, args=(["%s.zip" % x for x in range(20)], )) for dummy_x in range(4)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert len(server.conns) <= 3
+	assert len(server.calls) == 80
+
+def test_queue():
+	server = FakeServer()
+	client = make_client(server)
+
+	handled = []
+	lock = threading.Lock()
+	def handler(results):
+		with lock:
+			handled.append(results)
+
+	queue = dedupClient.DedupQueue(handler, batchSize=4, dedupClient=client, locked=False)
+	for x in range(10):
+		queue.submit("%s.zip" % x, context=x)
+	queue.close()
+
+	results = [result for batch in handled for result in batch]
+	assert sorted(result.context for result in results) == list(range(10))
+	assert all(result.archPath == "%s.zip" % result.context for result in results)
+	assert all(len(batch) <= 4 for batch in handled)
+	assert all(call[2]["locked"] for call in server.calls)
+	assert not any(thread.is_alive() for thread in queue.threads)
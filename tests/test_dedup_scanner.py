@@ -0,0 +1,87 @@
+import os
+import os.path
+
+import pytest
+
+import runStatus
+import processDownload
+import deduplicator.archChecker
+import utilities.dedupScanner as dedupScanner
+
+def make_file(path, size):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, "wb") as fp:
+		fp.write(b"x" * size)
+
+@pytest.fixture
+def library(tmp_path):
+	make_file(str(tmp_path / "lib" / "b" / "big.zip"), 30)
+	make_file(str(tmp_path / "lib" / "b" / "small.zip"), 10)
+	make_file(str(tmp_path / "lib" / "a" / "one.zip"), 20)
+	make_file(str(tmp_path / "lib" / "top.zip"), 5)
+	return str(tmp_path / "lib")
+
+class FakeProcessor(object):
+	def cleanDownload(self, archivePath):
+		if archivePath.endswith("big.zip"):
+			raise ValueError("Broken!")
+		return "cleaned", archivePath, []
+
+	def applyDedupResult(self, archivePath, retTags, dedupTags, bestMatch, crossReference=True):
+		return (retTags + " " + dedupTags).strip()
+
+class FakeChecker(object):
+	def __init__(self, archPath, **kwargs):
+		self.arch = archPath
+
+	def process(self, fileHashes=None):
+		return "deduped", None, {}
+
+@pytest.fixture
+def fake_workers(monkeypatch):
+	# The pool forks, so the workers see these too.
+	monkeypatch.setattr(processDownload, "MangaProcessor", FakeProcessor)
+	monkeypatch.setattr(deduplicator.archChecker, "ArchChecker", FakeChecker)
+	monkeypatch.setattr(runStatus, "run", True)
+
+def test_iter_files(library):
+	names = [os.path.relpath(path, library) for path, dummy_mtime, dummy_size in dedupScanner.iterFiles(library)]
+	assert names == ["a/one.zip", "b/small.zip", "b/big.zip", "top.zip"]
+
+	for path, mtime, size in dedupScanner.iterFiles(library):
+		assert dedupScanner.fileKey(path) == (path, mtime, size)
+
+def test_checkpoint_roundtrip(tmp_path, library):
+	checkpoint = dedupScanner.ScanCheckpoint.forDirs([library], str(tmp_path / "cp"))
+	keys = list(dedupScanner.iterFiles(library))
+	checkpoint.markDone(keys[:2])
+	checkpoint.close()
+
+	checkpoint = dedupScanner.ScanCheckpoint.forDirs([library], str(tmp_path / "cp"))
+	assert all(checkpoint.isDone(key) for key in keys[:2])
+	assert not any(checkpoint.isDone(key) for key in keys[2:])
+
+	# Changed files aren't considered done.
+	path, mtime, size = keys[0]
+	assert not checkpoint.isDone((path, mtime + 1, size))
+	checkpoint.close()
+
+def test_parallel_scan_resumes(tmp_path, library, fake_workers):
+	tagged = []
+	def scan():
+		checkpoint = dedupScanner.ScanCheckpoint.forDirs([library], str(tmp_path / "cp"))
+		scanner = dedupScanner.ParallelScanner(tagged.extend, workers=2, checkpoint=checkpoint)
+		return scanner.run([library])
+
+	progress = scan()
+	assert progress.found == 4
+	assert progress.processed == 3
+	assert progress.failed == 1
+	assert sorted(os.path.basename(path) for path, dummy_tags in tagged) == ["one.zip", "small.zip", "top.zip"]
+	assert all(tags == "cleaned deduped" for dummy_path, tags in tagged)
+
+	# The failed archive is retried, everything else is skipped.
+	progress = scan()
+	assert progress.skipped == 3
+	assert progress.failed == 1
+	assert progress.processed == 0
@@ -0,0 +1,153 @@
+
+import os
+import hashlib
+import tempfile
+import threading
+import http.server
+
+import webFunctions
+
+# Local stand-in for a file host. Serves FILE_DATA, honours `Range: bytes=N-` requests,
+# and can be told to cut off the first few transfers partway through, to exercise
+# the resume logic.
+
+FILE_DATA = os.urandom(3 * 1024 * 1024 + 17)
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+	disable_nagle_algorithm = True
+
+	truncateNext = 0
+	supportRanges = True
+	requests = []
+
+	def do_GET(self):
+		if self.path != "/file.zip":
+			self.send_error(404)
+			return
+
+		FixtureHandler.requests.append(self.headers.get("Range"))
+		start = 0
+		rangeHdr = self.headers.get("Range")
+		if rangeHdr and self.supportRanges:
+			start = int(rangeHdr.split("=")[1].rstrip("-"))
+			self.send_response(206)
+			self.send_header("Content-Range", "bytes %d-%d/%d" % (start, len(FILE_DATA)-1, len(FILE_DATA)))
+		else:
+			self.send_response(200)
+
+		body = FILE_DATA[start:]
+		self.send_header("Content-Type", "application/zip")
+		self.send_header("Content-Disposition", "attachment; filename=test.zip")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+
+		if FixtureHandler.truncateNext:
+			FixtureHandler.truncateNext -= 1
+			self.wfile.write(body[:len(body) // 3])
+			self.wfile.flush()
+			self.close_connection = True
+			return
+
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+def start_server(truncate=0, supportRanges=True):
+	FixtureHandler.truncateNext = truncate
+	FixtureHandler.supportRanges = supportRanges
+	FixtureHandler.requests = []
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	return server, "http://127.0.0.1:%s/file.zip" % server.server_address[1]
+
+def fetch(url, wg=None):
+	if wg is None:
+		wg = webFunctions.WebGetRobust()
+	wg.retryDelay = 0
+	tmpDir = tempfile.mkdtemp()
+	ret = wg.getFileToPath(url, tmpDir, hashAlgos=("md5", "sha1"))
+
+	assert os.path.dirname(ret['path']) == tmpDir
+	with open(ret['path'], "rb") as fp:
+		assert fp.read() == FILE_DATA
+	assert ret['size'] == len(FILE_DATA)
+	assert ret['name'] == "test.zip"
+	assert ret['hashes']['md5'] == hashlib.md5(FILE_DATA).hexdigest()
+	assert ret['hashes']['sha1'] == hashlib.sha1(FILE_DATA).hexdigest()
+
+	os.unlink(ret['path'])
+	os.rmdir(tmpDir)
+
+
+def test_download():
+	server, url = start_server()
+	try:
+		fetch(url)
+		assert FixtureHandler.requests == [None]
+	finally:
+		server.shutdown()
+
+def test_resume():
+	server, url = start_server(truncate=2)
+	try:
+		fetch(url)
+		assert FixtureHandler.requests[0] is None
+		assert len(FixtureHandler.requests) == 3
+		assert all(item.startswith("bytes=") for item in FixtureHandler.requests[1:])
+	finally:
+		server.shutdown()
+
+def test_no_range_support():
+	server, url = start_server(truncate=1, supportRanges=False)
+	try:
+		fetch(url)
+		assert len(FixtureHandler.requests) == 2
+	finally:
+		server.shutdown()
+
+def test_handles_closed():
+	server, url = start_server(truncate=2)
+	try:
+		wg = webFunctions.WebGetRobust()
+		handles = []
+		realOpen = wg.opener.open
+		def recordingOpen(*args, **kwargs):
+			handle = realOpen(*args, **kwargs)
+			handles.append(handle)
+			return handle
+		wg.opener.open = recordingOpen
+
+		fetch(url, wg)
+		assert len(handles) == 3
+		assert all(handle.closed for handle in handles)
+	finally:
+		server.shutdown()
+
+def test_failure_cleanup():
+	server, url = start_server()
+	wg = webFunctions.WebGetRobust()
+	wg.retryDelay = 0
+	tmpDir = tempfile.mkdtemp()
+	try:
+		for badUrl in (url.replace("file.zip", "missing.zip"), "http://127.0.0.1:1/file.zip"):
+			try:
+				wg.getFileToPath(badUrl, tmpDir)
+				assert False, "Should have raised!"
+			except AssertionError:
+				raise
+			except Exception:
+				pass
+		assert os.listdir(tmpDir) == []
+		os.rmdir(tmpDir)
+	finally:
+		server.shutdown()
+
+if __name__ == "__main__":
+	test_download()
+	test_resume()
+	test_no_range_support()
+	test_handles_closed()
+	test_failure_cleanup()
+	print("OK")
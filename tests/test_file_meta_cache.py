@@ -0,0 +1,94 @@
+import runStatus
+runStatus.preloadDicts = False
+
+import os
+import time
+import types
+import tempfile
+
+import pyinotify
+import nameTools as nt
+
+def make_event(path, name, isDir=False, mask=pyinotify.IN_MODIFY):
+	return types.SimpleNamespace(path=path, name=name, pathname=os.path.join(path, name), dir=isDir, mask=mask)
+
+def write(path, size):
+	with open(path, "wb") as fp:
+		fp.write(b"\x00" * size)
+
+
+def test_watched_invalidation():
+	tmpDir = tempfile.mkdtemp()
+	cache = nt.FileMetaCache()
+	cache.addWatchedRoot(tmpDir)
+
+	# The event handler invalidates the module-level cache.
+	oldCache, nt.fileMetaCache = nt.fileMetaCache, cache
+	try:
+		handler = nt.EventHandler([tmpDir])
+
+		assert cache.getSize(tmpDir, "a.zip") is None
+		write(os.path.join(tmpDir, "a.zip"), 10)
+		assert cache.getSize(tmpDir, "a.zip") is None
+
+		handler.process_default(make_event(tmpDir, "a.zip", mask=pyinotify.IN_CREATE))
+		assert cache.getSize(tmpDir, "a.zip") == 10
+		assert cache.exists(tmpDir, "a.zip")
+
+		os.unlink(os.path.join(tmpDir, "a.zip"))
+		handler.process_default(make_event(tmpDir, "a.zip", mask=pyinotify.IN_DELETE))
+		assert not cache.exists(tmpDir, "a.zip")
+
+		# Changes to a directory drop everything under it.
+		subDir = os.path.join(tmpDir, "series")
+		os.mkdir(subDir)
+		assert not cache.exists(subDir, "b.zip")
+		write(os.path.join(subDir, "b.zip"), 5)
+		handler.process_default(make_event(tmpDir, "series", isDir=True, mask=pyinotify.IN_MOVED_TO))
+		assert cache.getSize(subDir, "b.zip") == 5
+	finally:
+		nt.fileMetaCache = oldCache
+
+def test_unwatched_expiry():
+	tmpDir = tempfile.mkdtemp()
+	cache = nt.FileMetaCache()
+
+	assert not cache.exists(tmpDir, "c.zip")
+	write(os.path.join(tmpDir, "c.zip"), 3)
+	assert not cache.exists(tmpDir, "c.zip")
+
+	oldTtl, nt.FILE_META_UNWATCHED_TTL = nt.FILE_META_UNWATCHED_TTL, 0
+	try:
+		cache.invalidate(tmpDir, "c.zip")
+		assert cache.exists(tmpDir, "c.zip")
+		time.sleep(0.01)
+		os.unlink(os.path.join(tmpDir, "c.zip"))
+		assert not cache.exists(tmpDir, "c.zip")
+	finally:
+		nt.FILE_META_UNWATCHED_TTL = oldTtl
+
+def test_request_stats():
+	tmpDir = tempfile.mkdtemp()
+	cache = nt.FileMetaCache()
+	cache.addWatchedRoot(tmpDir)
+
+	cache.resetRequestStats()
+	for dummy_x in range(5):
+		for name in ("a.zip", "b.zip", "c.zip"):
+			cache.exists(tmpDir, name)
+	assert cache.getRequestStats() == {"hits" : 12, "stats" : 3}
+
+def test_size_limit():
+	tmpDir = tempfile.mkdtemp()
+	cache = nt.FileMetaCache(maxSize=10)
+	cache.addWatchedRoot(tmpDir)
+	for x in range(25):
+		cache.exists(tmpDir, "%s.zip" % x)
+	assert len(cache.entries) == 10
+
+if __name__ == "__main__":
+	test_watched_invalidation()
+	test_unwatched_expiry()
+	test_request_stats()
+	test_size_limit()
+	print("OK")
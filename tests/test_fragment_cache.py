@@ -0,0 +1,88 @@
+import time
+import threading
+
+import fragmentCache
+
+def test_ttl():
+	cache = fragmentCache.FragmentCache()
+	calls = []
+	def render():
+		calls.append(1)
+		return "frag %s" % len(calls)
+
+	assert cache.fragment("a", 60, render) == "frag 1"
+	assert cache.fragment("a", 60, render) == "frag 1"
+	assert cache.fragment("b", 0, render) == "frag 2"
+	assert cache.fragment("b", 0, render) == "frag 3"
+	assert cache.getStats() == {"items" : 2, "hits" : 1, "misses" : 3}
+
+def test_invalidate():
+	cache = fragmentCache.FragmentCache()
+	cache.fragment("a", 60, lambda: 1, tags=("status", ))
+	cache.fragment("b", 60, lambda: 2)
+	cache.invalidate("status")
+	assert cache.fragment("a", 60, lambda: 3) == 3
+	assert cache.fragment("b", 60, lambda: 4) == 2
+	cache.invalidateKey("b")
+	assert cache.fragment("b", 60, lambda: 5) == 5
+
+def test_single_render():
+	cache = fragmentCache.FragmentCache()
+	calls = []
+	def render():
+		calls.append(1)
+		time.sleep(0.05)
+		return "slow"
+
+	threads = [threading.Thread(target=cache.fragment, args=("a", 60, render)) for dummy_x in range(5)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert len(calls) == 1
+
+def test_size_limit():
+	cache = fragmentCache.FragmentCache(maxItems=10)
+	for x in range(25):
+		cache.fragment(x, 60 + x, lambda: x)
+	assert cache.getStats()["items"] == 10
+	assert cache.fragment(24, 60, lambda: None) == 24
+
+def test_render_error():
+	cache = fragmentCache.FragmentCache()
+	def render():
+		raise ValueError("Broken")
+	try:
+		cache.fragment("a", 60, render)
+		assert False, "Should have raised!"
+	except ValueError:
+		pass
+	assert cache.building == {}
+	assert cache.fragment("a", 60, lambda: 1) == 1
+
+def test_invalidate_during_render():
+	cache = fragmentCache.FragmentCache()
+	def render():
+		# A download reset (say) lands while the fragment is being built.
+		cache.invalidate("status")
+		return "stale"
+
+	assert cache.fragment("a", 60, render, tags=("status", )) == "stale"
+	assert cache.fragment("a", 60, lambda: "fresh", tags=("status", )) == "fresh"
+	assert cache.fragment("a", 60, lambda: "newer", tags=("status", )) == "fresh"
+
+	def renderKey():
+		cache.invalidateKey("b")
+		return "stale"
+	assert cache.fragment("b", 60, renderKey) == "stale"
+	assert cache.fragment("b", 60, lambda: "fresh") == "fresh"
+	assert cache.keyEpochs == {}
+
+if __name__ == "__main__":
+	test_ttl()
+	test_invalidate()
+	test_single_render()
+	test_size_limit()
+	test_render_error()
+	test_invalidate_during_render()
+	print("OK")
@@ -0,0 +1,166 @@
+
+import os
+import json
+import time
+import tempfile
+import threading
+import http.server
+
+import webFunctions
+
+# Local stand-in for a feed host.
+# `/etag/*` pages support conditional requests, `/plain/*` pages don't (so only the
+# body hash can tell they're unchanged). Page content can be changed by bumping `version`.
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+	disable_nagle_algorithm = True
+
+	version = 1
+	requests = []
+
+	def do_GET(self):
+		FixtureHandler.requests.append((self.path, self.headers.get("If-None-Match")))
+
+		etag = '"v%s"' % self.version
+		if self.path.startswith("/etag") and self.headers.get("If-None-Match") == etag:
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.end_headers()
+			return
+
+		body = "<html><body><div class='item'>Version %s</div></body></html>" % self.version
+		body = body.encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "text/html;charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		if self.path.startswith("/etag"):
+			self.send_header("ETag", etag)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+def start_server():
+	FixtureHandler.version = 1
+	FixtureHandler.requests = []
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	return server, "http://127.0.0.1:%s" % server.server_address[1]
+
+def get_wg():
+	wg = webFunctions.WebGetRobust(httpCache=True)
+	wg.httpCache = webFunctions.HttpCache(tempfile.mkdtemp())
+	return wg
+
+
+def test_conditional_request():
+	server, baseUrl = start_server()
+	try:
+		wg = get_wg()
+		url = baseUrl + "/etag/feed"
+
+		assert "Version 1" in wg.getpageIfChanged(url)
+		wg.commitCache()
+		assert wg.getpageIfChanged(url) is None
+		assert FixtureHandler.requests[-1] == ("/etag/feed", '"v1"')
+
+		FixtureHandler.version = 2
+		assert "Version 2" in wg.getSoupIfChanged(url).get_text()
+		wg.commitCache()
+		assert wg.getSoupIfChanged(url) is None
+
+		assert wg.getCacheStats() == {'notModified' : 2, 'unchanged' : 0, 'changed' : 2}
+	finally:
+		server.shutdown()
+
+def test_body_hash():
+	server, baseUrl = start_server()
+	try:
+		wg = get_wg()
+		url = baseUrl + "/plain/feed"
+
+		assert "Version 1" in wg.getpageIfChanged(url)
+		wg.commitCache()
+		assert wg.getpageIfChanged(url) is None
+
+		FixtureHandler.version = 2
+		assert "Version 2" in wg.getpageIfChanged(url)
+
+		assert wg.getCacheStats() == {'notModified' : 0, 'unchanged' : 1, 'changed' : 2}
+	finally:
+		server.shutdown()
+
+def test_cache_disabled():
+	server, baseUrl = start_server()
+	try:
+		wg = webFunctions.WebGetRobust()
+		url = baseUrl + "/etag/feed"
+
+		assert "Version 1" in wg.getpageIfChanged(url)
+		assert "Version 1" in wg.getpageIfChanged(url)
+		assert all(etag is None for dummy_path, etag in FixtureHandler.requests)
+	finally:
+		server.shutdown()
+
+def test_uncommitted():
+	server, baseUrl = start_server()
+	try:
+		wg = get_wg()
+		url = baseUrl + "/etag/feed"
+
+		# Never committed (the run died before storing what was on the page), so it's still new.
+		assert "Version 1" in wg.getpageIfChanged(url)
+		assert "Version 1" in wg.getpageIfChanged(url)
+		assert FixtureHandler.requests[-1] == ("/etag/feed", None)
+
+		wg.discardCache()
+		wg.commitCache()
+		assert "Version 1" in wg.getpageIfChanged(url)
+		wg.commitCache([url])
+		assert wg.getpageIfChanged(url) is None
+	finally:
+		server.shutdown()
+
+def test_plain_getpage_uncached():
+	server, baseUrl = start_server()
+	try:
+		wg = get_wg()
+		url = baseUrl + "/etag/feed"
+
+		assert "Version 1" in wg.getpage(url)
+		wg.commitCache()
+		assert "Version 1" in wg.getpage(url)
+		assert all(etag is None for dummy_path, etag in FixtureHandler.requests)
+		assert wg.getCacheStats() == {'notModified' : 0, 'unchanged' : 0, 'changed' : 0}
+	finally:
+		server.shutdown()
+
+def test_prune():
+	cache = webFunctions.HttpCache(tempfile.mkdtemp(), maxBytes=2500, maxAge=3600)
+	for x in range(5):
+		cache.put("http://example.org/%s" % x, "x" * 1000, "hash")
+
+	# Anything past maxAge goes, then the least recently validated, until it's under maxBytes.
+	metaTimes = {x : time.time() - 100 * (5 - x) for x in range(5)}
+	metaTimes[4] = time.time() - 7200
+	for root, dummy_dirs, files in os.walk(cache.cacheDir):
+		for fileN in files:
+			if fileN.endswith(".json"):
+				with open(os.path.join(root, fileN)) as fp:
+					x = int(json.load(fp)['url'].split("/")[-1])
+				os.utime(os.path.join(root, fileN), (metaTimes[x], metaTimes[x]))
+
+	cache.prune()
+	have = [x for x in range(5) if cache.get("http://example.org/%s" % x)[0]]
+	assert have == [2, 3]
+
+if __name__ == "__main__":
+	test_conditional_request()
+	test_body_hash()
+	test_cache_disabled()
+	test_uncommitted()
+	test_plain_getpage_uncached()
+	test_prune()
+	print("OK")
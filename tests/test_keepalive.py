@@ -0,0 +1,114 @@
+
+import time
+import gzip
+import threading
+import http.server
+
+import webFunctions
+
+# Local stand-in for a remote host. Speaks HTTP/1.1, so connections are kept alive
+# unless the client asks otherwise, and counts how many connections it accepts.
+
+PAGE_SIZE = 32 * 1024
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	# Headers and body go out as separate writes. Without this, Nagle + delayed-ACK
+	# stalls every response on a reused connection by ~40 ms.
+	disable_nagle_algorithm = True
+	connections = 0
+
+	def setup(self):
+		FixtureHandler.connections += 1
+		super().setup()
+
+	def do_GET(self):
+		if self.path.startswith("/redirect"):
+			self.send_response(302)
+			self.send_header("Location", "/page.html")
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
+		if self.path.startswith("/page"):
+			body = gzip.compress("<html><head><title>Test</title></head><body>Über</body></html>".encode("utf-8"))
+			self.send_response(200)
+			self.send_header("Content-Type", "text/html;charset=utf-8")
+			self.send_header("Content-Encoding", "gzip")
+			self.send_header("Set-Cookie", "session=wat; Path=/")
+		else:
+			body = b"\xff" * PAGE_SIZE
+			self.send_response(200)
+			self.send_header("Content-Type", "image/jpeg")
+
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+def start_server():
+	FixtureHandler.connections = 0
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	return server, "http://127.0.0.1:%s" % server.server_address[1]
+
+
+def test_keepalive_reuse():
+	server, baseUrl = start_server()
+	try:
+		wg = webFunctions.WebGetRobust(keepAlive=True)
+
+		page = wg.getpage(baseUrl + "/page.html")
+		assert page == "<html><head><title>Test</title></head><body>Über</body></html>"
+		assert any(cookie.name == "session" for cookie in wg.cj)
+
+		for x in range(10):
+			content, handle = wg.getpage(baseUrl + "/image-%s.jpg" % x, returnMultiple=True)
+			assert len(content) == PAGE_SIZE
+			assert handle.geturl() == baseUrl + "/image-%s.jpg" % x
+
+		page, handle = wg.getpage(baseUrl + "/redirect", returnMultiple=True)
+		assert handle.geturl() == baseUrl + "/page.html"
+
+		assert FixtureHandler.connections == 1
+	finally:
+		server.shutdown()
+
+def test_stale_connection():
+	server, baseUrl = start_server()
+	try:
+		wg = webFunctions.WebGetRobust(keepAlive=True)
+		wg.getpage(baseUrl + "/image.jpg")
+
+		# Simulate the remote end timing out the idle connection.
+		for conns in wg.connPool.idle.values():
+			for conn, dummy_idleSince in conns:
+				conn.sock.shutdown(2)
+
+		content = wg.getpage(baseUrl + "/image.jpg")
+		assert len(content) == PAGE_SIZE
+	finally:
+		server.shutdown()
+
+
+def benchmark(requests=200):
+	server, baseUrl = start_server()
+	try:
+		for keepAlive in (False, True):
+			wg = webFunctions.WebGetRobust(keepAlive=keepAlive)
+			start = time.time()
+			for x in range(requests):
+				wg.getpage(baseUrl + "/image-%s.jpg" % x)
+			elapsed = time.time() - start
+			print("keepAlive=%5s: %s requests in %0.2f s (%0.1f req/s)" % (keepAlive, requests, elapsed, requests / elapsed))
+	finally:
+		server.shutdown()
+
+if __name__ == "__main__":
+	test_keepalive_reuse()
+	test_stale_connection()
+	print("OK")
+	benchmark()
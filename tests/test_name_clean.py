@@ -0,0 +1,130 @@
+
+import runStatus
+runStatus.preloadDicts = False
+
+import time
+
+import nameTools as nt
+from tests.title_test_data import data as test_data
+
+# Reference copies of the original chained-`str.replace()` implementations.
+# The optimized versions in nameTools must produce exactly the same output.
+
+def ref_makeFilenameSafe(inStr):
+	inStr = inStr.replace("“",  " ") \
+				 .replace("”",  " ")
+
+	inStr = inStr.replace("%20", " ") \
+				 .replace("<",  " ") \
+				 .replace(">",  " ") \
+				 .replace(":",  " ") \
+				 .replace("\"", " ") \
+				 .replace("/",  " ") \
+				 .replace("\\", " ") \
+				 .replace("|",  " ") \
+				 .replace("?",  " ") \
+				 .replace("*",  " ") \
+				 .replace('"', " ")
+
+	inStr = inStr.replace("\u2009",  " ") \
+				 .replace("\u200A",  " ") \
+				 .replace("\u200B",  " ") \
+				 .replace("\u200C",  " ") \
+				 .replace("\u200D",  " ") \
+				 .replace("\uFEFF",  " ")
+
+	while inStr.find("  ")+1:
+		inStr = inStr.replace("  ", " ")
+
+	inStr = inStr.rstrip("! ")
+	inStr = inStr.strip(" ")
+
+	return inStr
+
+def ref_removeBrackets(inStr):
+	inStr = nt.bracketStripRe.sub(" ", inStr)
+	while inStr.find("  ")+1:
+		inStr = inStr.replace("  ", " ")
+	return inStr
+
+def ref_sanitizeString(inStr, flatten=True):
+	baseName = inStr
+	if flatten:
+		baseName = baseName.replace("-", " ")
+		baseName = baseName.replace("!", " ")
+
+		baseName = baseName.replace("~", "")
+		baseName = baseName.replace(".", "")
+		baseName = baseName.replace(";", "")
+		baseName = baseName.replace(":", "")
+		baseName = baseName.replace("-", "")
+		baseName = baseName.replace("?", "")
+		baseName = baseName.replace('"', "")
+		baseName = baseName.replace("'", "")
+
+	baseName = ref_removeBrackets(baseName)
+
+	while baseName.find("  ")+1:
+		baseName = baseName.replace("  ", " ")
+
+	return baseName.lower().strip()
+
+def ref_prepFilenameForMatching(inStr):
+	inStr = ref_makeFilenameSafe(inStr)
+	inStr = ref_sanitizeString(inStr)
+	return inStr.lower()
+
+
+# A few hand-written nasty cases on top of the title corpus.
+extra_data = [
+	"“Smart” quotes!!!",
+	"Ugly%20url%20encoded<name>",
+	"zero​width﻿  spaces here",
+	"   lots     of    spaces   ",
+	"[Group] Series - Name ~ v01 ch002 [+++]",
+	"Trailing bangs! ! !",
+	"%2“0 odd escapes %%20",
+	"",
+]
+
+def get_inputs():
+	inputs = [key for key, dummy_value in test_data]
+	inputs.extend(extra_data)
+	return inputs
+
+def test_equivalence():
+	for inStr in get_inputs():
+		assert nt.makeFilenameSafe(inStr) == ref_makeFilenameSafe(inStr), inStr
+		assert nt.sanitizeString(inStr) == ref_sanitizeString(inStr), inStr
+		assert nt.sanitizeString(inStr, flatten=False) == ref_sanitizeString(inStr, flatten=False), inStr
+		assert nt.removeBrackets(inStr) == ref_removeBrackets(inStr), inStr
+		assert nt.prepFilenameForMatching(inStr) == ref_prepFilenameForMatching(inStr), inStr
+
+
+def timeit(func, inputs, passes):
+	start = time.perf_counter()
+	for dummy_x in range(passes):
+		for inStr in inputs:
+			func(inStr)
+	return time.perf_counter() - start
+
+def benchmark(passes=20):
+	inputs = get_inputs()
+
+	print("Benchmarking over %s strings, %s passes." % (len(inputs), passes))
+
+	ref  = timeit(ref_prepFilenameForMatching, inputs, passes)
+	new  = timeit(nt.prepFilenameForMatching.__wrapped__, inputs, passes)
+	nt.prepFilenameForMatching.cache_clear()
+	hot  = timeit(nt.prepFilenameForMatching, inputs, passes)
+
+	print("Reference implementation:   %0.4f s" % ref)
+	print("Optimized (uncached):       %0.4f s (%0.1fx)" % (new, ref / new))
+	print("LRU cached:                 %0.4f s (%0.1fx)" % (hot, ref / hot))
+	print(nt.prepFilenameForMatching.cache_info())
+
+
+if __name__ == "__main__":
+	test_equivalence()
+	print("Output equivalent.")
+	benchmark()
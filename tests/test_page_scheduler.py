@@ -0,0 +1,104 @@
+
+import runStatus
+runStatus.preloadDicts = False
+
+import os
+import time
+import zipfile
+import tempfile
+import threading
+import urllib.request
+import http.server
+
+import ScrapePlugins.RetreivalBase as rb
+
+# Local stand-in for an image host. Every request takes PAGE_LATENCY seconds,
+# which is roughly what a remote CDN round-trip costs.
+PAGE_LATENCY = 0.05
+PAGE_SIZE    = 64 * 1024
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+	def do_GET(self):
+		time.sleep(PAGE_LATENCY)
+		self.send_response(200)
+		self.send_header("Content-Type", "image/jpeg")
+		self.send_header("Content-Length", str(PAGE_SIZE))
+		self.end_headers()
+		self.wfile.write(b"\xff" * PAGE_SIZE)
+
+	def log_message(self, *args):
+		pass
+
+def start_server():
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	return server, "http://127.0.0.1:%s" % server.server_address[1]
+
+def fetch(imgCnt, imgUrl):
+	with urllib.request.urlopen(imgUrl) as handle:
+		return "{num:03.0f} - {srcName}".format(num=imgCnt, srcName=imgUrl.split("/")[-1]), handle.read()
+
+def fetch_chapter(baseUrl, pages, workers, rate=None, burst=1):
+	def throttle(imgCnt, imgUrl):
+		rb.waitForHost(imgUrl, rate, burst)
+
+	jobs = [(num, "%s/page-%s.jpg" % (baseUrl, num)) for num in range(1, pages+1)]
+	tmpDir = tempfile.mkdtemp()
+	fqFName = os.path.join(tmpDir, "chapter.zip")
+	with rb.ChapterArchiveWriter(fqFName) as arch:
+		assert arch.fetchPages(jobs, fetch, workers=workers, throttle=throttle if rate else None)
+		arch.commit()
+
+	assert len(zipfile.ZipFile(fqFName).namelist()) == pages
+	os.unlink(fqFName)
+	os.rmdir(tmpDir)
+
+
+def test_token_bucket():
+	bucket = rb.TokenBucket(rate=20, burst=5)
+	start = time.monotonic()
+	for dummy_x in range(15):
+		bucket.acquire()
+	elapsed = time.monotonic() - start
+
+	# 5 requests go out as a burst, the remaining 10 at 20/second.
+	assert 0.4 <= elapsed < 1.0, elapsed
+
+def test_host_buckets_shared():
+	a = rb.getHostBucket("http://example.org/a.jpg", 10, 2)
+	b = rb.getHostBucket("http://EXAMPLE.org/b/c.png", 5, 4)
+	assert a is b
+	assert a.rate == 5
+	assert a.burst == 2
+	assert rb.getHostBucket("http://example.com/", 10) is not a
+
+def test_concurrent_fetch():
+	runStatus.run = True
+	server, baseUrl = start_server()
+	try:
+		fetch_chapter(baseUrl, pages=20, workers=4)
+	finally:
+		server.shutdown()
+
+
+def benchmark(chapters=5, pages=30):
+	runStatus.run = True
+	server, baseUrl = start_server()
+	print("Fetching %s chapters of %s pages, %0.0f ms per request." % (chapters, pages, PAGE_LATENCY * 1000))
+	try:
+		for workers, rate in [(1, None), (2, None), (4, None), (8, None), (8, 40)]:
+			start = time.time()
+			for dummy_x in range(chapters):
+				fetch_chapter(baseUrl, pages, workers, rate, burst=workers)
+			elapsed = time.time() - start
+			print("Workers: %s, rate limit: %4s/s -> %6.1f chapters/minute" % (workers, rate, chapters / elapsed * 60))
+	finally:
+		server.shutdown()
+
+if __name__ == "__main__":
+	test_token_bucket()
+	test_host_buckets_shared()
+	test_concurrent_fetch()
+	print("OK")
+	benchmark()
@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+
+import pytest
+
+PIL = pytest.importorskip("PIL.Image")
+
+import renditionCache
+
+def make_image(width, height, fmt="PNG"):
+	# Noise, so the PNG doesn't compress down to nothing.
+	img = PIL.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+	out = io.BytesIO()
+	img.save(out, format=fmt)
+	return out.getvalue()
+
+def test_parse_size():
+	assert renditionCache.parseSize("small") == renditionCache.RENDITION_WIDTHS["small"]
+	assert renditionCache.parseSize("THUMB") == renditionCache.RENDITION_WIDTHS["thumb"]
+	assert renditionCache.parseSize("huge") is None
+	assert renditionCache.parseSize(None) is None
+
+def test_render_width():
+	out = renditionCache.renderImage(make_image(1000, 1500), 200, "jpeg")
+	img = PIL.open(io.BytesIO(out))
+	assert img.format == "JPEG"
+	assert img.size == (200, 300)
+
+	# Never upscaled.
+	out = renditionCache.renderImage(make_image(100, 50), 200, "webp")
+	assert PIL.open(io.BytesIO(out)).size == (100, 50)
+
+	assert renditionCache.renderImage(b"not an image", 200, "jpeg") is None
+
+def test_cache():
+	cacheDir = tempfile.mkdtemp()
+	cache = renditionCache.RenditionCache(cacheDir=cacheDir, workers=1)
+	src = make_image(600, 600)
+
+	body, mime = cache.getRendition(src, 240)
+	assert mime == "image/jpeg"
+	assert len(body) < len(src)
+	assert cache.getRendition(src, 240) == (body, mime)
+	stats = cache.getStats()
+	assert stats["hits"] == 1 and stats["misses"] == 1
+
+	# A new instance picks up what's already on disk.
+	cache = renditionCache.RenditionCache(cacheDir=cacheDir, workers=1)
+	assert cache.getRendition(src, 240) == (body, mime)
+	assert cache.getStats()["hits"] == 1
+
+def test_eviction():
+	cacheDir = tempfile.mkdtemp()
+	cache = renditionCache.RenditionCache(cacheDir=cacheDir, workers=1, maxBytes=1)
+	cache.getRendition(make_image(400, 400), 240)
+	cache.getRendition(make_image(401, 400), 240)
+	files = [fileN for dummy_root, dummy_dirs, fileNs in os.walk(cacheDir) for fileN in fileNs]
+	assert not files
+	assert cache.getStats()["cachedBytes"] == 0
+
+if __name__ == "__main__":
+	test_parse_size()
+	test_render_width()
+	test_cache()
+	test_eviction()
+	print("OK")
@@ -9,7 +9,11 @@ import rpyc
 import signal
 import traceback
 import os
+import threading
+import psycopg2.extras
 import deduplicator.archChecker
+import deduplicator.dedupClient
+import utilities.dedupScanner
 
 
 class DirDeduper(ScrapePlugins.DbBase.DbBase):
@@ -17,115 +21,154 @@ class DirDeduper(ScrapePlugins.DbBase.DbBase):
 	tableName  = "MangaItems"
 
 
-	def addTag(self, srcPath, newTags):
-		with self.conn.cursor() as cur:
+	def pickRow(self, srcPath, rows):
+		'''
+		Pick the row to tag for `srcPath`, out of the `(dbId, tags)` rows for that path.
+		Returns (dbId, tags), or None if there isn't one.
+		'''
+		tags = None
+		rowId = None
+		if len(rows) > 1:
+			exists = 0
+			for row in rows:
+
+				tagsTmp = row[1]
+				if tagsTmp == None:
+					tagsTmp = ''
+				if not "deleted" in tagsTmp and not "missing" in tagsTmp and not "duplicate" in tagsTmp:
+					exists += 1
+					rowId = row[0]
+					tags = row[1]
 
-			tags = None
-			rowId = None
 
-			cur.execute("BEGIN;")
-			basePath, fName = os.path.split(srcPath)
-			# print("fname='%s', path='%s'" % (fName, basePath))
-			cur.execute('''SELECT dbId, tags FROM {tableName} WHERE fileName=%s AND downloadPath=%s;'''.format(tableName=self.tableName), (fName, basePath))
-			rows = cur.fetchall()
-			if len(rows) > 1:
-				exists = 0
+			if exists > 1:
+
+				print("Rows")
 				for row in rows:
+					print(" = ", row)
+					print(" = ", "deleted" in row, not "missing" in row, not "duplicate" in row)
 
-					tagsTmp = row[1]
-					if tagsTmp == None:
-						tagsTmp = ''
-					if not "deleted" in tagsTmp and not "missing" in tagsTmp and not "duplicate" in tagsTmp:
-						exists += 1
-						rowId = row[0]
-						tags = row[1]
+				self.log.error("More then one row for the same path! Wat?")
 
+				row = rows[-1]
+				tags = row[1]
+				rowId = row[0]
 
-				if exists > 1:
+		elif rows:
+			row = rows[-1]
+			tags = row[1]
+			rowId = row[0]
+		else:
+			self.log.info("File {fname} not in manga database!".format(fname=srcPath))
+			return None
 
-					print("Rows")
-					for row in rows:
-						print(" = ", row)
-						print(" = ", "deleted" in row, not "missing" in row, not "duplicate" in row)
+		if not rowId:
+			self.log.warning("WAt?")
+			return None
 
-					self.log.error("More then one row for the same path! Wat?")
+		return rowId, tags
 
-					row = rows.pop()
-					tags = row[1]
-					rowId = row[0]
+	def addTags(self, pathTags):
+		'''
+		Add tags to the rows for a set of files. `pathTags` is a list of (file path, space separated tags).
+		All the rows are looked up in one query, and updated in another, in a single transaction.
+		'''
+		wanted = {}
+		for srcPath, newTags in pathTags:
+			wanted.setdefault(os.path.split(srcPath), []).extend(newTags.split())
+		if not wanted:
+			return
 
-			elif rows:
-				row = rows.pop()
-				tags = row[1]
-				rowId = row[0]
-			else:
-				self.log.info("File {fname} not in manga database!".format(fname=srcPath))
-				return
+		with self.conn.cursor() as cur:
+			cur.execute("BEGIN;")
 
-			if not rowId:
-				self.log.warning("WAt?")
-				return
+			basePaths = [basePath for basePath, dummy_fName in wanted]
+			fNames    = [fName    for dummy_basePath, fName in wanted]
+			cur.execute('''SELECT dbId, tags, downloadPath, fileName FROM {tableName}
+						WHERE (downloadPath, fileName) IN (SELECT * FROM unnest(%s::text[], %s::text[]));'''.format(tableName=self.tableName),
+					(basePaths, fNames))
 
-			if tags == None:
-				tags = ''
-			tags = set(tags.split())
-			for tag in newTags.split():
-				tags.add(tag.lower())
+			found = {}
+			for dbId, tags, basePath, fName in cur.fetchall():
+				found.setdefault((basePath, fName), []).append((dbId, tags))
 
-			cur.execute('''UPDATE {tableName} SET tags=%s WHERE dbId=%s;'''.format(tableName=self.tableName), (" ".join(tags), rowId))
+			updates = {}
+			for key, newTags in wanted.items():
+				row = self.pickRow(os.path.join(*key), found.get(key, []))
+				if not row:
+					continue
+				rowId, tags = row
+
+				if tags == None:
+					tags = ''
+				tags = set(updates.get(rowId, tags).split())
+				for tag in newTags:
+					tags.add(tag.lower())
+				updates[rowId] = " ".join(tags)
+
+			if updates:
+				psycopg2.extras.execute_values(cur,
+						'''UPDATE {tableName} SET tags=data.tags FROM (VALUES %s) AS data (dbId, tags) WHERE {tableName}.dbId=data.dbId;'''.format(tableName=self.tableName),
+						list(updates.items()))
 			cur.execute("COMMIT;")
 
+	def addTag(self, srcPath, newTags):
+		self.addTags([(srcPath, newTags)])
+
+	def dedupQueue(self, proc, pathFilter=None):
+		'''
+		Get a DedupQueue that cross-links, and tags the results for `proc` (a DownloadProcessor)
+		a batch at a time. Archives are submit()ted as (archivePath, fileHashes, context=cleaner tags).
+		'''
+		lock = threading.Lock()
+
+		def applyResults(results):
+			pathTags = []
+			# The processor and our connection are shared by the queue's workers.
+			with lock:
+				for result in results:
+					if result.error:
+						self.log.error("Dedup failed for '%s': %s", result.archPath, result.error)
+						continue
+					tags = proc.applyDedupResult(result.archPath, result.context or "", result.status, result.bestMatch)
+					if tags:
+						self.log.info("Adding tags to '%s': '%s'", result.archPath, tags)
+					pathTags.append((result.archPath, tags))
+				self.addTags(pathTags)
+
+		return deduplicator.dedupClient.DedupQueue(applyResults,
+				pathFilter = pathFilter or processDownload.defaultPathFilter(),
+				distance   = processDownload.PHASH_DISTANCE,
+				locked     = True)
+
+	def queueArchive(self, queue, proc, archivePath):
+		tags, archivePath, fileHashes = proc.cleanDownload(archivePath)
+		queue.submit(archivePath, fileHashes, context=tags)
+
 	def setupDbApi(self):
 		pass
 
-	def cleanDirectory(self, dirPath, delDir, includePhash=False, pathFilter=['']):
+	def cleanDirectory(self, dirPath, delDir, includePhash=False, pathFilter=[''], workers=None):
 
 		self.log.info("Cleaning path '%s'", dirPath)
 		items = os.listdir(dirPath)
 		items.sort()
-		for item in items:
-			item = os.path.join(dirPath, item)
-			if os.path.isdir(item):
-				print("Scanning", item)
-				self.cleanSingleDir(item, delDir, includePhash, pathFilter)
-
-
-
-	def cleanSingleDir(self, dirPath, delDir, includePhash=True, pathFilter=['']):
+		subDirs = [os.path.join(dirPath, item) for item in items if os.path.isdir(os.path.join(dirPath, item))]
+		self.parallelClean(subDirs, pathFilter, workers)
 
-		self.log.info("Processing subdirectory '%s'", dirPath)
-		if not dirPath.endswith("/"):
-			dirPath = dirPath + '/'
+	def cleanSingleDir(self, dirPath, delDir, includePhash=True, pathFilter=[''], workers=None):
 
-		items = os.listdir(dirPath)
-
-		items = [os.path.join(dirPath, item) for item in items]
+		self.log.info("Processing directory '%s'", dirPath)
+		self.parallelClean([dirPath], pathFilter, workers)
 
-		dirs = [i for i in items if os.path.isdir(i)]
-		self.log.info("Recursing into %s subdirectories!", len(dirs))
-		for subDir in dirs:
-			self.cleanSingleDir(subDir, delDir, includePhash, pathFilter)
-
-
-		parsedItems = [(os.path.getsize(i), i) for i in items if os.path.isfile(i)]
-
-		parsedItems.sort()
-
-
-		for dummy_num, basePath in parsedItems:
-			try:
-				# if not deduplicator.archChecker.ArchChecker.isArchive(basePath):
-				# 	print("Not archive!", basePath)
-				# 	continue
-
-				self.log.info("Scanning '%s'", basePath)
-
-				proc = processDownload.MangaProcessor()
-				tags = proc.processDownload(seriesName=None, archivePath=basePath, pathFilter=pathFilter)
-				self.addTag(basePath, tags)
-
-			except KeyboardInterrupt:
-				raise
+	def parallelClean(self, dirPaths, pathFilter=[''], workers=None, checkpointDir=None):
+		'''
+		Clean and dedup every archive under `dirPaths`, in a process pool (one worker per core, by default).
+		Progress is checkpointed, so running it again on the same directories resumes where it left off.
+		'''
+		checkpoint = utilities.dedupScanner.ScanCheckpoint.forDirs(dirPaths, checkpointDir)
+		scanner = utilities.dedupScanner.ParallelScanner(self.addTags, workers=workers, checkpoint=checkpoint, pathFilter=pathFilter)
+		return scanner.run(dirPaths)
 
 	def cleanBySourceKey(self, sourceKey, delDir, includePhash=True, pathFilter=['']):
 
@@ -145,24 +188,27 @@ class DirDeduper(ScrapePlugins.DbBase.DbBase):
 				continue
 			parsedItems.append((dbId, fqpath))
 
+		proc = processDownload.MangaProcessor()
+		queue = self.dedupQueue(proc, pathFilter)
 		for dummy_num, basePath in parsedItems:
 			try:
 
 				self.log.info("Scanning '%s'", basePath)
-
-				proc = processDownload.MangaProcessor()
-				tags = proc.processDownload(seriesName=None, archivePath=basePath, pathFilter=pathFilter)
-				self.addTag(basePath, tags)
+				self.queueArchive(queue, proc, basePath)
 
 			except KeyboardInterrupt:
 				raise
 
+		queue.close()
+
 	def cleanHHistory(self, delDir):
 		self.log.info("Querying for items.")
 		with self.conn.cursor() as cur:
 			cur.execute("SELECT dbid, filename, downloadpath, tags FROM hentaiitems WHERE sourcesite='sp' ORDER BY dbid ASC")
 			ret = cur.fetchall()
 
+		proc = processDownload.HentaiProcessor()
+		queue = self.dedupQueue(proc)
 		for dbid, filename, downloadpath, tags in ret:
 
 			if tags and 'was-duplicate' in tags.split():
@@ -175,10 +221,9 @@ class DirDeduper(ScrapePlugins.DbBase.DbBase):
 			if not os.path.exists(fpath):
 				continue
 
-			proc = processDownload.HentaiProcessor()
-			tags = proc.processDownload(seriesName=None, archivePath=fpath)
-			self.log.info("Adding tags: '%s'", tags)
-			self.addTag(fpath, tags)
+			self.queueArchive(queue, proc, fpath)
+
+		queue.close()
 
 
 
@@ -0,0 +1,270 @@
+
+'''
+Parallel, resumable library dedup scan (used by DirDeduper for `dir-clean` and `dirs-clean`).
+
+The directory tree is walked with os.scandir (which gets the file sizes from the
+directory listing, rather then stat()ing each file separately). Archives are
+cleaned and deduplicated in a pool of worker processes, one per core. Each
+worker builds it's MangaProcessor (and ArchCleaner) once, rather then once per archive.
+The dedup server lock is held for the deletion step, so two workers can't each
+delete the other's copy of the same archive.
+
+Every archive that has been processed (and tagged) is appended to a checkpoint
+file, keyed by (path, mtime, size). An interrupted run (ctrl+c, crash, reboot)
+started again on the same directories skips everything that was already done,
+unless the file has changed since.
+'''
+
+import os
+import os.path
+import time
+import hashlib
+import logging
+import traceback
+import concurrent.futures
+
+import settings
+import runStatus
+import processDownload
+import deduplicator.archChecker
+
+DEFAULT_CHECKPOINT_DIR = 'dedupCheckpoints'
+
+# Archives submitted to the pool per worker, ahead of the results coming back.
+QUEUE_DEPTH = 4
+
+# Results are tagged (and checkpointed) in batches of this many.
+TAG_BATCH_SIZE = 100
+
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 60
+
+def iterFiles(dirPath):
+	'''
+	Yield (path, mtime, size) for every file under `dirPath`, recursively.
+	Subdirectories are done first, and the files in each directory smallest first (the
+	order the serial scanner always used).
+	'''
+	try:
+		entries = list(os.scandir(dirPath))
+	except OSError:
+		return
+
+	entries.sort(key=lambda entry: entry.name)
+	files = []
+	for entry in entries:
+		try:
+			if entry.is_dir(follow_symlinks=False):
+				yield from iterFiles(entry.path)
+			elif entry.is_file():
+				stat = entry.stat()
+				files.append((stat.st_size, entry.path, stat.st_mtime))
+		except OSError:
+			continue
+
+	files.sort()
+	for size, path, mtime in files:
+		yield path, mtime, size
+
+def fileKey(path):
+	'''
+	Checkpoint key for `path`, or None if it doesn't exist (anymore).
+	'''
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+	return path, stat.st_mtime, stat.st_size
+
+class ScanCheckpoint(object):
+	'''
+	Append-only record of the files already processed by a scan.
+	Each line is `mtime \t size \t path`.
+	'''
+
+	log = logging.getLogger("Main.DirDedup.Checkpoint")
+
+	def __init__(self, path):
+		self.path = path
+		self.done = set()
+
+		if os.path.exists(path):
+			with open(path, "r", encoding="utf-8", errors="surrogateescape") as fp:
+				for line in fp:
+					try:
+						mtime, size, fPath = line.rstrip("\n").split("\t", 2)
+						self.done.add((fPath, float(mtime), int(size)))
+					except ValueError:
+						# Truncated last line, from a crash mid-write.
+						continue
+			self.log.info("Loaded %s already-scanned files from checkpoint '%s'", len(self.done), path)
+
+		dirPath = os.path.dirname(path)
+		if dirPath:
+			os.makedirs(dirPath, exist_ok=True)
+		self.fp = open(path, "a", encoding="utf-8", errors="surrogateescape")
+
+	@classmethod
+	def forDirs(cls, dirPaths, checkpointDir=None):
+		'''
+		Checkpoint for a scan of `dirPaths`. The same set of directories always maps to the same file.
+		'''
+		checkpointDir = checkpointDir or getattr(settings, "dedupCheckpointPath", DEFAULT_CHECKPOINT_DIR)
+		key = "\n".join(sorted(os.path.abspath(dirPath) for dirPath in dirPaths))
+		return cls(os.path.join(checkpointDir, "scan-%s.txt" % hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()))
+
+	def isDone(self, key):
+		return key in self.done
+
+	def markDone(self, keys):
+		for key in keys:
+			if key and not key in self.done:
+				self.done.add(key)
+				fPath, mtime, size = key
+				self.fp.write("%r\t%s\t%s\n" % (mtime, size, fPath))
+		self.fp.flush()
+		os.fsync(self.fp.fileno())
+
+	def close(self):
+		self.fp.close()
+
+class ScanProgress(object):
+
+	log = logging.getLogger("Main.DirDedup.Progress")
+
+	def __init__(self, interval=PROGRESS_INTERVAL):
+		self.interval  = interval
+		self.started   = time.time()
+		self.lastShown = self.started
+
+		self.found     = 0
+		self.skipped   = 0
+		self.processed = 0
+		self.failed    = 0
+		self.bytes     = 0
+
+	def report(self, force=False):
+		now = time.time()
+		if not force and now - self.lastShown < self.interval:
+			return
+		self.lastShown = now
+
+		elapsed = max(now - self.started, 0.001)
+		self.log.info("Scanned %s files (%s skipped from checkpoint, %s processed, %s failed). %0.2f archives/sec, %0.2f MB/sec. Elapsed: %0.0f sec.",
+				self.found, self.skipped, self.processed, self.failed,
+				self.processed / elapsed, self.bytes / elapsed / (1024 * 1024), elapsed)
+
+
+# Per worker-process state.
+workerProc = None
+
+def initWorker():
+	global workerProc
+	workerProc = processDownload.MangaProcessor()
+
+def dedupArchive(archivePath, pathFilter):
+	'''
+	Clean and dedup `archivePath`, in a worker process.
+	Returns (archivePath, newPath, tags, error). The archive cleaner may rename the archive
+	(rar -> zip), so `newPath` is where it ended up. `error` is a traceback string, if it failed.
+	'''
+	try:
+		tags, newPath, fileHashes = workerProc.cleanDownload(archivePath)
+		dc = deduplicator.archChecker.ArchChecker(newPath, phashDistance=processDownload.PHASH_DISTANCE, pathFilter=pathFilter, lock=True)
+		status, bestMatch, dummy_intersections = dc.process(fileHashes=fileHashes)
+		tags = workerProc.applyDedupResult(newPath, tags, status, bestMatch)
+		return archivePath, newPath, tags, None
+	except Exception:
+		return archivePath, archivePath, "", traceback.format_exc()
+
+class ParallelScanner(object):
+	'''
+	Run dedupArchive() for every file under `dirPaths`, in a process pool, and hand the
+	tags to `addTags` (DirDeduper.addTags) in batches.
+	'''
+
+	log = logging.getLogger("Main.DirDedup.Scanner")
+
+	def __init__(self, addTags, workers=None, checkpoint=None, pathFilter=None):
+		self.addTags    = addTags
+		self.workers    = workers or os.cpu_count() or 1
+		self.checkpoint = checkpoint
+		self.pathFilter = pathFilter
+
+		self.progress   = ScanProgress()
+		self.pending    = []
+
+	def _flush(self):
+		if not self.pending:
+			return
+		self.addTags([(newPath, tags) for dummy_key, newPath, tags in self.pending if tags])
+
+		# Only checkpointed once the tags are committed. The cleaned archive is recorded
+		# as well as the original, since cleaning can change (or rename) it.
+		if self.checkpoint:
+			keys = []
+			for key, newPath, dummy_tags in self.pending:
+				keys.append(key)
+				if newPath != key[0] or fileKey(newPath) != key:
+					keys.append(fileKey(newPath))
+			self.checkpoint.markDone(keys)
+		self.pending = []
+
+	def _collect(self, future, key):
+		archivePath, newPath, tags, error = future.result()
+		if error:
+			self.progress.failed += 1
+			self.log.error("Failed to process '%s'", archivePath)
+			for line in error.split("\n"):
+				self.log.error(line)
+			# Not checkpointed, so it gets retried next run.
+			return
+
+		self.progress.processed += 1
+		self.progress.bytes     += key[2]
+		if tags:
+			self.log.info("'%s': '%s'", newPath, tags)
+		self.pending.append((key, newPath, tags))
+		if len(self.pending) >= TAG_BATCH_SIZE:
+			self._flush()
+
+	def run(self, dirPaths):
+		inFlight = {}
+		maxInFlight = self.workers * QUEUE_DEPTH
+
+		with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker) as executor:
+			try:
+				for dirPath in dirPaths:
+					self.log.info("Scanning '%s' with %s workers", dirPath, self.workers)
+					for key in iterFiles(dirPath):
+						if not runStatus.run:
+							self.log.warning("Halt flag set. Stopping scan (it will resume from the checkpoint).")
+							break
+
+						self.progress.found += 1
+						if self.checkpoint and self.checkpoint.isDone(key):
+							self.progress.skipped += 1
+							continue
+
+						while len(inFlight) >= maxInFlight:
+							done, dummy_notDone = concurrent.futures.wait(inFlight, return_when=concurrent.futures.FIRST_COMPLETED)
+							for future in done:
+								self._collect(future, inFlight.pop(future))
+							self.progress.report()
+
+						inFlight[executor.submit(dedupArchive, key[0], self.pathFilter)] = key
+
+					if not runStatus.run:
+						break
+
+				for future in concurrent.futures.as_completed(list(inFlight)):
+					self._collect(future, inFlight.pop(future))
+					self.progress.report()
+
+			finally:
+				self._flush()
+				self.progress.report(force=True)
+				if self.checkpoint:
+					self.checkpoint.close()
+
+		return self.progress
@@ -18,6 +18,7 @@ import utilities.cleanDb
 import utilities.bookClean
 import utilities.cleanFiles
 import deduplicator.remoteInterface
+import schemaUpdater.tagCountTracker
 import UploadPlugins.Madokami.uploader
 
 def printHelp():
@@ -46,6 +47,8 @@ def printHelp():
 	print("		Does not currently use phashing.")
 	print("		'Deleted' files are actually moved to {del-dir}, to allow checking before actual deletion.")
 	print("		The moved files are named with the entire file-path, with the '/' being replaced with ';'.")
+	print("		Archives are processed in parallel (one process per core). Progress is checkpointed, so re-running")
+	print("		the same command after an interruption resumes where it left off.")
 	print()
 	print("	dir-clean {target-path} {del-dir}")
 	print("		Find duplicates in {target-path}, and remove them.")
@@ -53,6 +56,8 @@ def printHelp():
 	print("		Does not currently use phashing.")
 	print("		'Deleted' files are actually moved to {del-dir}, to allow checking before actual deletion.")
 	print("		The moved files are named with the entire file-path, with the '/' being replaced with ';'.")
+	print("		Archives are processed in parallel (one process per core). Progress is checkpointed, so re-running")
+	print("		the same command after an interruption resumes where it left off.")
 	print("	")
 	print("	dirs-restore {target-path}")
 	print("		Reverses the action of 'dirs-clean'. {target-path} is the directory specified as ")
@@ -143,6 +148,10 @@ def printHelp():
 	print("	fix-h-tags-case")
 	print("		Fix issues where mixed-case H tags were being duplicated.")
 	print("	")
+	print("	recount-tags")
+	print("		Rebuild the per-tag item counts used by the tag listings from scratch.")
+	print("		Only needed if the counts have drifted (e.g. rows were edited with the triggers disabled).")
+	print("	")
 
 	print("*********************************************************")
 	print("Remote deduper interface")
@@ -200,6 +209,8 @@ def parseOneArgCall(cmd):
 	elif mainArg.lower() == "fix-h-tags-case":
 		cleaner = utilities.cleanDb.HCleaner('None')
 		cleaner.cleanTags()
+	elif mainArg.lower() == "recount-tags":
+		schemaUpdater.tagCountTracker.doTagCounts(pc.conn)
 
 	else:
 		print("Unknown arg!")
@@ -17,6 +17,10 @@ import re
 import gzip
 import io
 import socket
+import http.client
+import hashlib
+import uuid
+import settings
 
 import base64
 import json
@@ -129,11 +133,286 @@ class PreemptiveBasicAuthHandler(urllib.request.HTTPBasicAuthHandler):
 
 	https_request = http_request
 
+
+# Persistent-connection transport.
+# urllib's stock handlers open a new TCP (and TLS) connection for every request, and
+# send `Connection: close`. For chapters with hundreds of images from the same CDN
+# host, the handshakes end up dominating the wall time.
+# These handlers drop in in place of urllib's HTTP/HTTPS handlers (so the cookie jar,
+# auth, redirect and error handling in the opener are all unchanged), but check
+# connections out of a per-host pool of idle keep-alive connections instead.
+
+# Idle connections older then this (seconds) are discarded rather then reused,
+# since the remote end has most likely timed them out anyways.
+KEEPALIVE_IDLE_TIMEOUT = 30
+
+# Maximum idle connections kept per host.
+KEEPALIVE_MAX_IDLE = 8
+
+class PooledHTTPResponse(http.client.HTTPResponse):
+	'''
+	HTTPResponse that hands its connection back to the pool once the body
+	has been completely read. A response that is closed before the body has
+	been consumed leaves the connection in an unknown state, so the connection
+	is dropped instead.
+	'''
+	releaseCallback = None
+
+	def _close_conn(self):
+		super()._close_conn()
+		callback, self.releaseCallback = self.releaseCallback, None
+		if callback:
+			callback(not self.will_close)
+
+	def close(self):
+		if self.fp and self.releaseCallback:
+			callback, self.releaseCallback = self.releaseCallback, None
+			callback(False)
+		super().close()
+
+class KeepAliveConnectionPool():
+	'''
+	Thread-safe pool of idle HTTP(S) connections, keyed by (scheme, host).
+	'''
+	def __init__(self, maxIdle=KEEPALIVE_MAX_IDLE):
+		self.maxIdle = maxIdle
+		self.idle    = {}
+		self.lock    = Lock()
+		self.stats   = {'opened' : 0, 'reused' : 0}
+
+	def get(self, key):
+		now = time.time()
+		with self.lock:
+			conns = self.idle.get(key, [])
+			while conns:
+				conn, idleSince = conns.pop()
+				if now - idleSince < KEEPALIVE_IDLE_TIMEOUT:
+					self.stats['reused'] += 1
+					return conn
+				conn.close()
+		return None
+
+	def put(self, key, conn):
+		with self.lock:
+			conns = self.idle.setdefault(key, [])
+			if len(conns) < self.maxIdle:
+				conns.append((conn, time.time()))
+				return
+		conn.close()
+
+	def connOpened(self):
+		with self.lock:
+			self.stats['opened'] += 1
+
+	def closeAll(self):
+		with self.lock:
+			idle, self.idle = self.idle, {}
+		for conns in idle.values():
+			for conn, dummy_idleSince in conns:
+				conn.close()
+
+class KeepAliveHandlerMixin():
+
+	def __init__(self, connPool, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.connPool = connPool
+
+	def do_open(self, http_class, req, **http_conn_args):
+
+		# Leave proxy tunnels to the stock implementation.
+		if req._tunnel_host:
+			return super().do_open(http_class, req, **http_conn_args)
+
+		host = req.host
+		if not host:
+			raise urllib.error.URLError('no host given')
+
+		key = (req.type, host)
+
+		# Same header munging as urllib.request.AbstractHTTPHandler.do_open(), except for
+		# asking for the connection to be kept open.
+		headers = dict(req.unredirected_hdrs)
+		headers.update({k: v for k, v in req.headers.items() if k not in headers})
+		headers["Connection"] = "keep-alive"
+		headers = {name.title(): val for name, val in headers.items()}
+
+		while True:
+			conn = self.connPool.get(key)
+			reused = conn is not None
+			if not reused:
+				conn = http_class(host, timeout=req.timeout, **http_conn_args)
+				conn.response_class = PooledHTTPResponse
+				self.connPool.connOpened()
+
+			try:
+				conn.request(req.get_method(), req.selector, req.data, headers, encode_chunked=req.has_header('Transfer-encoding'))
+				resp = conn.getresponse()
+
+			except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as err:
+				conn.close()
+				# The server timed out a pooled connection. Retry on a fresh one.
+				if reused:
+					continue
+				raise urllib.error.URLError(err)
+
+			except OSError as err:
+				conn.close()
+				raise urllib.error.URLError(err)
+
+			break
+
+		def release(clean):
+			if clean:
+				self.connPool.put(key, conn)
+			else:
+				conn.close()
+
+		resp.releaseCallback = release
+		if resp.fp is None:
+			# No body (HEAD, 304, etc...).
+			release(not resp.will_close)
+
+		resp.url = req.get_full_url()
+		resp.msg = resp.reason
+		return resp
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, urllib.request.HTTPHandler):
+	pass
+
+class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, urllib.request.HTTPSHandler):
+	pass
+
+
+# Defaults for the HTTP cache limits (overridable from settings).
+HTTP_CACHE_MAX_BYTES      = 512 * 1024 * 1024
+HTTP_CACHE_MAX_AGE        = 60 * 60 * 24 * 30
+HTTP_CACHE_PRUNE_INTERVAL = 60 * 60
+
+class HttpCache():
+	'''
+	On-disk store of the last response for each URL, along with its validators
+	(`ETag`/`Last-Modified`) and a hash of the body.
+
+	Each URL gets a JSON metadata file and a body file, named by the SHA1 of the URL,
+	and sharded into subdirectories by the first two hex digits.
+	'''
+
+	def __init__(self, cacheDir, maxBytes=None, maxAge=None):
+		self.cacheDir = cacheDir
+		self.maxBytes = maxBytes
+		self.maxAge   = maxAge
+		self.lastPrune = 0
+
+	def __paths(self, url):
+		key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+		base = os.path.join(self.cacheDir, key[:2], key)
+		return base + ".json", base + ".body"
+
+	def get(self, url):
+		'''
+		Return `(meta, content)` for `url`, or `(None, None)` if it isn't cached.
+		'''
+		metaPath, bodyPath = self.__paths(url)
+		try:
+			with open(metaPath, "r") as fp:
+				meta = json.load(fp)
+			with open(bodyPath, "rb") as fp:
+				content = fp.read()
+		except (OSError, ValueError):
+			return None, None
+
+		if meta.get('url') != url:
+			return None, None
+
+		if meta['isText']:
+			content = content.decode("utf-8")
+		return meta, content
+
+	def put(self, url, content, bodyHash, etag=None, lastModified=None):
+		metaPath, bodyPath = self.__paths(url)
+		os.makedirs(os.path.dirname(metaPath), exist_ok=True)
+
+		meta = {
+			'url'          : url,
+			'etag'         : etag,
+			'lastModified' : lastModified,
+			'bodyHash'     : bodyHash,
+			'isText'       : isinstance(content, str),
+			'stored'       : time.time(),
+		}
+
+		if isinstance(content, str):
+			content = content.encode("utf-8")
+
+		# Write-then-rename, so a concurrent reader never sees a partial file.
+		suffix = ".%s-%s.tmp" % (os.getpid(), uuid.uuid4().hex)
+		with open(bodyPath + suffix, "wb") as fp:
+			fp.write(content)
+		os.replace(bodyPath + suffix, bodyPath)
+		with open(metaPath + suffix, "w") as fp:
+			json.dump(meta, fp)
+		os.replace(metaPath + suffix, metaPath)
+
+	def touch(self, url):
+		'''
+		Mark the entry for `url` as still current (the server said it's unchanged), so it isn't aged out.
+		'''
+		metaPath, dummy_bodyPath = self.__paths(url)
+		try:
+			os.utime(metaPath)
+		except OSError:
+			pass
+
+	def prune(self):
+		'''
+		Delete entries not validated in `maxAge` seconds, then the least recently validated
+		ones, until the cache is under `maxBytes`.
+		'''
+		self.lastPrune = time.time()
+		entries = []
+		for root, dummy_dirs, files in os.walk(self.cacheDir):
+			for fileN in files:
+				if not fileN.endswith(".json"):
+					continue
+				metaPath = os.path.join(root, fileN)
+				bodyPath = metaPath[:-len(".json")] + ".body"
+				try:
+					mtime = os.stat(metaPath).st_mtime
+					size = os.stat(bodyPath).st_size
+				except OSError:
+					size = 0
+					mtime = 0
+				entries.append((mtime, size, metaPath, bodyPath))
+
+		entries.sort()
+		total = sum(size for dummy_mtime, size, dummy_metaPath, dummy_bodyPath in entries)
+		now = time.time()
+		for mtime, size, metaPath, bodyPath in entries:
+			expired = self.maxAge and mtime < now - self.maxAge
+			tooBig  = self.maxBytes and total > self.maxBytes
+			if not (expired or tooBig):
+				break
+			for path in (metaPath, bodyPath):
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+			total -= size
+
+	@staticmethod
+	def hashContent(content):
+		if isinstance(content, str):
+			content = content.encode("utf-8")
+		return hashlib.sha1(content).hexdigest()
+
+
 class WebGetRobust:
 	COOKIEFILE = 'cookies.lwp'				# the path and filename to save your cookies in
+	CACHEDIR = 'httpcache'					# where cached responses go, if httpCache is enabled (and settings.httpCachePath isn't set)
 	cj = None
 	cookielib = None
 	opener = None
+	connPool = None
 
 	errorOutCount = 2
 	retryDelay = 1.5
@@ -143,7 +422,12 @@ class WebGetRobust:
 	# if test=true, no resources are actually fetched (for testing)
 	# creds is a list of 3-tuples that gets inserted into the password manager.
 	# it is structured [(top_level_url1, username1, password1), (top_level_url2, username2, password2)]
-	def __init__(self, test=False, creds=None, logPath="Main.Web", uaOverride=None):
+	# if keepAlive=true, connections are pooled per-host and reused (see KeepAliveHTTPHandler)
+	# rather then opening a new connection for every request.
+	# if httpCache=true, pages fetched with getpageIfChanged()/getSoupIfChanged() are cached on
+	# disk, and re-requested conditionally. Fetched pages are only written to the cache by
+	# commitCache(), once the caller has finished with them.
+	def __init__(self, test=False, creds=None, logPath="Main.Web", uaOverride=None, keepAlive=False, httpCache=False):
 
 		# Override the global default socket timeout, so hung connections will actually time out properly.
 		socket.setdefaulttimeout(30)
@@ -177,6 +461,28 @@ class WebGetRobust:
 		else:
 			self.credHandler = None
 
+		if httpCache:
+			self.httpCache = HttpCache(getattr(settings, "httpCachePath", self.CACHEDIR),
+					maxBytes = getattr(settings, "HTTP_CACHE_MAX_BYTES", HTTP_CACHE_MAX_BYTES),
+					maxAge   = getattr(settings, "HTTP_CACHE_MAX_AGE",   HTTP_CACHE_MAX_AGE))
+		else:
+			self.httpCache = None
+		# url -> (content, bodyHash, etag, lastModified), for fetched pages that haven't been committed yet.
+		self.pendingCache = {}
+		self.cacheStats = {
+			'notModified' : 0,   # Server returned a 304
+			'unchanged'   : 0,   # Server returned the same content as last time
+			'changed'     : 0,   # Content was new, or differed from the cached copy
+		}
+		self.cacheStatsLock = Lock()
+
+		if keepAlive:
+			self.connPool = KeepAliveConnectionPool()
+			self.transportHandlers = [KeepAliveHTTPHandler(self.connPool), KeepAliveHTTPSHandler(self.connPool)]
+		else:
+			self.connPool = None
+			self.transportHandlers = []
+
 		self.loadCookies()
 
 	def loadCookies(self):
@@ -197,10 +503,10 @@ class WebGetRobust:
 				cookieHandler = urllib.request.HTTPCookieProcessor(self.cj)
 				if self.credHandler:
 					print("Have cred handler. Building opener using it")
-					self.opener = urllib.request.build_opener(cookieHandler, self.credHandler)
+					self.opener = urllib.request.build_opener(cookieHandler, self.credHandler, *self.transportHandlers)
 				else:
 					# print("No cred handler")
-					self.opener = urllib.request.build_opener(cookieHandler)
+					self.opener = urllib.request.build_opener(cookieHandler, *self.transportHandlers)
 				#self.opener.addheaders = [('User-Agent', 'Mozilla/4.0 (compatible; MSIE 5.5; Windows NT)')]
 				self.opener.addheaders = self.browserHeaders
 				#urllib2.install_opener(self.opener)
@@ -220,26 +526,26 @@ class WebGetRobust:
 
 
 	def chunkRead(self, response, chunkSize=2 ** 18, reportHook=None):
-		contentLengthHeader = response.info().getheader('Content-Length')
+		contentLengthHeader = response.headers.get('Content-Length')
 		if contentLengthHeader:
 			totalSize = contentLengthHeader.strip()
 			totalSize = int(totalSize)
 		else:
 			totalSize = None
 		bytesSoFar = 0
-		pgContent = ""
+		pgContent = []
 		while 1:
 			chunk = response.read(chunkSize)
-			pgContent += chunk
-			bytesSoFar += len(chunk)
-
 			if not chunk:
 				break
 
+			pgContent.append(chunk)
+			bytesSoFar += len(chunk)
+
 			if reportHook:
 				reportHook(bytesSoFar, chunkSize, totalSize)
 
-		return pgContent
+		return b"".join(pgContent)
 
 
 
@@ -310,6 +616,11 @@ class WebGetRobust:
 
 		pgctnt, pghandle = self.getpage(*args, **kwargs)
 
+		hName = self.getHandleFileName(pghandle)
+
+		return pgctnt, hName
+
+	def getHandleFileName(self, pghandle):
 		info = pghandle.info()
 		if not 'Content-Disposition' in info:
 			hName = ''
@@ -318,8 +629,168 @@ class WebGetRobust:
 		else:
 			hName = info['Content-Disposition'].split('filename=')[1]
 
+		return hName
 
-		return pgctnt, hName
+
+	def getFileToPath(self, requestedUrl, dirPath, hashAlgos=("md5", ), addlHeaders=None, retryQuantity=None, callBack=None, chunkSize=2 ** 18):
+		'''
+		Download the file at `requestedUrl` to a temporary file in `dirPath`, streaming
+		it to disk in `chunkSize` pieces rather then holding the whole thing in memory.
+
+		Each of the hashlib algorithms in `hashAlgos` is computed as the bytes arrive.
+		If the transfer fails partway through, the retry resumes from where it left
+		off with a `Range` request (if the server won't do ranges, it starts over).
+
+		`callBack`, if passed, is called as `callBack(bytesSoFar, totalSize)` after
+		each chunk.
+
+		Returns a dict:
+			'path'   - Path of the temporary file. The caller is responsible for renaming it
+			           to somewhere useful (it's in `dirPath`, so `os.replace()` is cheap),
+			           or deleting it.
+			'name'   - Filename from the content-disposition header, or '' (same as getFileAndName()).
+			'url'    - The final URL, after any redirects.
+			'size'   - File size in bytes.
+			'hashes' - {algorithm name : hex digest}
+
+		Raises urllib.error.URLError if the file could not be retreived.
+		'''
+
+		if addlHeaders:
+			addlHeaders = dict(addlHeaders)
+			if 'Referer' in addlHeaders:
+				addlHeaders['Referer'] = iri2uri(addlHeaders['Referer'])
+		else:
+			addlHeaders = {}
+
+		# Compressed transfer-encoding and byte-ranges don't mix well, and the
+		# things that get fetched this way are almost always archives anyways.
+		addlHeaders['Accept-Encoding'] = 'identity'
+
+		tmpPath = os.path.join(dirPath, ".download-%s-%s.part" % (os.getpid(), uuid.uuid4().hex))
+		fp = open(tmpPath, "xb")
+
+		def restart():
+			fp.seek(0)
+			fp.truncate()
+			return 0, {algo : hashlib.new(algo) for algo in hashAlgos}
+
+		def closeHandle():
+			# Don't leave the socket from a failed attempt open while we wait to retry.
+			if pghandle is not None:
+				try:
+					pghandle.close()
+				except Exception:
+					pass
+			return None
+
+		written, hashers = restart()
+		totalSize        = None
+		pghandle         = None
+		lastErr          = None
+		retryCount       = 0
+		maxRetries       = retryQuantity if retryQuantity else self.errorOutCount
+
+		try:
+			while 1:
+				retryCount += 1
+				if retryCount > maxRetries:
+					self.log.critical("Critical Failure to retrieve file! %s at %s, attempt %s", requestedUrl, time.ctime(time.time()), retryCount)
+					self.log.critical("Error: %s", lastErr)
+					raise urllib.error.URLError("Failed to retreive file '%s'!" % (requestedUrl, ))
+
+				attemptStart = written
+				headers = dict(addlHeaders)
+				if written:
+					self.log.info("Resuming download of '%s' from byte %s", requestedUrl, written)
+					headers['Range'] = 'bytes=%d-' % written
+				pgreq = self.buildRequest(requestedUrl, None, headers, False, None)
+
+				try:
+					pghandle = self.opener.open(pgreq, timeout=30)
+
+					if written:
+						contentRange = pghandle.headers.get("Content-Range", "")
+						if pghandle.getcode() != 206 or not contentRange.startswith("bytes %d-" % written):
+							self.log.warning("Server did not honour the range request. Restarting download from scratch.")
+							written, hashers = restart()
+
+					if pghandle.headers.get('Content-Encoding', 'identity') != 'identity':
+						# The server ignored the accept-encoding header, and is compressing anyways.
+						raise ValueError("Unexpected content encoding '%s'!" % pghandle.headers.get('Content-Encoding'))
+
+					length = pghandle.headers.get("Content-Length")
+					if length is not None:
+						totalSize = written + int(length)
+
+					while 1:
+						chunk = pghandle.read(chunkSize)
+						if not chunk:
+							break
+						fp.write(chunk)
+						for hasher in hashers.values():
+							hasher.update(chunk)
+						written += len(chunk)
+						if callBack:
+							callBack(written, totalSize)
+
+					if totalSize is not None and written < totalSize:
+						raise ValueError("Transfer truncated! Received %s of %s bytes" % (written, totalSize))
+
+					hName    = self.getHandleFileName(pghandle)
+					finalUrl = pghandle.geturl()
+					break
+
+				except urllib.error.HTTPError as e:
+					lastErr = e
+					e.close()
+					self.log.warning("Error opening file: %s at %s On Attempt %s.", requestedUrl, time.ctime(time.time()), retryCount)
+					self.log.warning("Error Code: %s", e)
+
+					if e.code == 404:
+						self.log.critical("Unrecoverable - Page not found. Breaking")
+						raise
+
+					if e.code == 416:
+						# Range not satisfiable. Whatever we have is wrong, so start over.
+						written, hashers = restart()
+
+					pghandle = closeHandle()
+					time.sleep(self.retryDelay)
+
+				except (urllib.error.URLError, OSError, ValueError, http.client.HTTPException) as e:
+					lastErr = e
+					self.log.warning("Retreival failed on attempt %s (%s bytes so far). Error: %s", retryCount, written, e)
+					for line in traceback.format_exc().split("\n"):
+						self.log.warning("%s", line.rstrip())
+
+					# Attempts that made progress don't count against the retry limit, since
+					# we'll be resuming rather then starting over.
+					if written > attemptStart:
+						retryCount -= 1
+					pghandle = closeHandle()
+					time.sleep(self.retryDelay)
+
+			fp.close()
+
+		except:
+			fp.close()
+			os.unlink(tmpPath)
+			raise
+
+		finally:
+			pghandle = closeHandle()
+
+		ret = {
+			'path'   : tmpPath,
+			'name'   : hName,
+			'url'    : finalUrl,
+			'size'   : written,
+			'hashes' : {algo : hasher.hexdigest() for algo, hasher in hashers.items()},
+		}
+
+		self.log.info("Retreived %0.3fK from '%s'. Hashes: %s", written / 1000.0, requestedUrl, ret['hashes'])
+		return ret
 
 
 	def buildRequest(self, pgreq, postData, addlHeaders, binaryForm, jsonPost):
@@ -588,6 +1059,13 @@ class WebGetRobust:
 					# print("Gotpage")
 
 				except urllib.error.HTTPError as e:								# Lotta logging
+					# Not modified. Only happens for conditional requests (see getpageCached()),
+					# which handle it themselves, so there's nothing to retry or complain about.
+					if e.code == 304:
+						lastErr = e
+						errored = True
+						break
+
 					self.log.warning("Error opening page: %s at %s On Attempt %s.", pgreq.get_full_url(), time.ctime(time.time()), retryCount)
 					self.log.warning("Error Code: %s", e)
 
@@ -655,6 +1133,144 @@ class WebGetRobust:
 		else:
 			return pgctnt
 
+	def isCacheable(self, kwargs):
+		if not self.httpCache or self.testMode:
+			return False
+		if not kwargs.get("useCache", True):
+			return False
+
+		# Only plain GETs that return just the content.
+		for key in ("returnMultiple", "callBack", "postData", "binaryForm", "jsonPost"):
+			if kwargs.get(key):
+				return False
+		return True
+
+	def getpageCached(self, requestedUrl, **kwargs):
+		'''
+		Fetch `requestedUrl` through the on-disk cache, using a conditional request if
+		there is a cached copy. Returns `(content, changed)`, where `changed` is false if
+		the server returned a 304, or returned exactly the same content as last time.
+		'''
+		meta, cached = self.httpCache.get(requestedUrl)
+
+		headers = dict(kwargs.pop("addlHeaders", None) or {})
+		if meta:
+			if meta['etag']:
+				headers['If-None-Match'] = meta['etag']
+			if meta['lastModified']:
+				headers['If-Modified-Since'] = meta['lastModified']
+
+		nativeError = kwargs.pop("nativeError", False)
+		kwargs.pop("returnMultiple", None)
+		kwargs.pop("useCache", None)
+
+		try:
+			pgctnt, pghandle = self.getpage(requestedUrl, addlHeaders=headers, returnMultiple=True, nativeError=True, **kwargs)
+
+		except urllib.error.HTTPError as e:
+			if e.code == 304 and meta:
+				self.log.info("Content for '%s' not modified. Using cached copy.", requestedUrl)
+				self.__countCache('notModified')
+				self.httpCache.touch(requestedUrl)
+				return cached, False
+			if nativeError:
+				raise
+			raise urllib.error.URLError("Failed to retreive page '%s'!" % (requestedUrl, ))
+
+		if pgctnt is None or pghandle is None:
+			return pgctnt, True
+
+		bodyHash = HttpCache.hashContent(pgctnt)
+		changed = not meta or meta['bodyHash'] != bodyHash
+
+		# Not written to the cache until the caller commitCache()s it, so a run that dies before
+		# it has stored what was on the page will fetch it again next time.
+		with self.cacheStatsLock:
+			self.pendingCache[requestedUrl] = (pgctnt, bodyHash, pghandle.headers.get("ETag"), pghandle.headers.get("Last-Modified"))
+
+		if changed:
+			self.__countCache('changed')
+		else:
+			self.log.info("Content for '%s' unchanged since last fetch.", requestedUrl)
+			self.__countCache('unchanged')
+
+		return pgctnt, changed
+
+	def getpageIfChanged(self, requestedUrl, **kwargs):
+		'''
+		Like getpage(), but returns None if the page hasn't changed since the last
+		time it was fetched, so callers can skip parsing it altogether.
+
+		Without httpCache enabled, this always returns the page.
+		'''
+		if not self.isCacheable(kwargs):
+			return self.getpage(requestedUrl, **kwargs)
+
+		pgctnt, changed = self.getpageCached(requestedUrl, **kwargs)
+		if not changed:
+			return None
+		return pgctnt
+
+	def getSoupIfChanged(self, requestedUrl, **kwargs):
+		'''
+		getSoup() equivalent of getpageIfChanged(). Returns None if the page is unchanged.
+		'''
+		page = self.getpageIfChanged(requestedUrl, **kwargs)
+		if page is None:
+			return None
+		if isinstance(page, bytes):
+			raise ValueError("Received content not decoded! Cannot parse!")
+
+		return as_soup(page)
+
+	def commitCache(self, urls=None):
+		'''
+		Write the pages fetched by getpageIfChanged()/getSoupIfChanged() (all of them, or just `urls`)
+		to the cache. Call this once whatever was on them has been stored, so they're only treated as
+		unchanged on later runs if they were actually processed.
+		'''
+		if not self.httpCache:
+			return
+		with self.cacheStatsLock:
+			if urls is None:
+				pending, self.pendingCache = self.pendingCache, {}
+			else:
+				pending = {url : self.pendingCache.pop(url) for url in urls if url in self.pendingCache}
+
+		for url, (content, bodyHash, etag, lastModified) in pending.items():
+			self.httpCache.put(url, content, bodyHash, etag=etag, lastModified=lastModified)
+
+		if time.time() - self.httpCache.lastPrune > HTTP_CACHE_PRUNE_INTERVAL:
+			self.httpCache.prune()
+
+	def discardCache(self, urls=None):
+		'''
+		Drop the uncommitted pages (all of them, or just `urls`), so they're treated as changed next time.
+		'''
+		with self.cacheStatsLock:
+			if urls is None:
+				self.pendingCache = {}
+			else:
+				for url in urls:
+					self.pendingCache.pop(url, None)
+
+	def __countCache(self, key):
+		with self.cacheStatsLock:
+			self.cacheStats[key] += 1
+
+	def getCacheStats(self):
+		with self.cacheStatsLock:
+			return dict(self.cacheStats)
+
+	def logCacheStats(self):
+		if not self.httpCache:
+			return
+		stats = self.getCacheStats()
+		total = sum(stats.values())
+		skipped = stats['notModified'] + stats['unchanged']
+		self.log.info("HTTP cache: %s requests, %s not modified (304), %s unchanged, %s changed. %0.1f%% of fetches could skip parsing.",
+			total, stats['notModified'], stats['unchanged'], stats['changed'], (100.0 * skipped / total) if total else 0)
+
 	def syncCookiesFromFile(self):
 		self.log.info("Synchronizing cookies with cookieFile.")
 		if os.path.isfile(self.COOKIEFILE):
@@ -760,6 +1376,8 @@ class WebGetRobust:
 	def __del__(self):
 		# print "WGH Destructor called!"
 		self.saveCookies(halting=True)
+		if self.connPool:
+			self.connPool.closeAll()
 
 
 	def _phantomJS_install_block(self, driver):
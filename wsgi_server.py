@@ -7,7 +7,7 @@ runStatus.preloadDicts = False
 
 
 from pyramid.config import Configurator
-from pyramid.response import Response, FileIter, FileResponse
+from pyramid.response import Response, FileResponse
 from pyramid.exceptions import NotFound
 from pyramid.httpexceptions import HTTPFound
 from pyramid.authentication import AuthTktAuthenticationPolicy
@@ -24,8 +24,12 @@ import urllib.parse
 import apiHandler
 
 import sessionManager
+import renditionCache
 
 import os.path
+import hashlib
+import threading
+import time
 users = {"herp" : "wattttttt"}
 
 # from profilehooks import profile
@@ -38,11 +42,56 @@ def userCheck(userid, dummy_request):
 
 import logging
 import psycopg2
+import dbPool
+import dbTiming
 import traceback
 import statusManager as sm
 
 import mimetypes
 
+# One handle per cherrypy worker thread, plus a few for background tasks.
+WEB_POOL_SIZE = 40
+
+# Files the template warmup compiles.
+TEMPLATE_EXTENSIONS = ('.mako', '.mako.css')
+
+# How long a request will wait for a free database connection (in seconds).
+WEB_CONN_TIMEOUT = 60
+
+# Routes that are keyed by their path (rather then just their route name) in the query stats.
+PATH_KEYED_ROUTES = ['leaf', 'root', 'static-file', 'mvc_rsc', 'mvc_style']
+
+def getRequestConn(request):
+	'''
+	Request method (`request.dbConn`): checks out a connection for the request on first use,
+	and returns it to the pool once the request is finished. The request's transaction
+	is committed if it finished cleanly, and rolled back if it raised.
+	'''
+	route = request.matched_route.name if request.matched_route else "none"
+	if route in PATH_KEYED_ROUTES:
+		page = request.path
+	else:
+		page = route
+
+	conn = dbTiming.TimedConnection(dbPool.pool.getconn(timeout=WEB_CONN_TIMEOUT), dbTiming.QueryLog(page))
+
+	def release(request):
+		try:
+			if not conn.closed:
+				if getattr(request, "exception", None) is None:
+					conn.commit()
+				else:
+					conn.rollback()
+		except psycopg2.Error:
+			logging.getLogger("Main.WebSrv").error("Error closing out request transaction!")
+			logging.getLogger("Main.WebSrv").error(traceback.format_exc())
+		finally:
+			dbPool.pool.putconn(conn.conn)
+			dbTiming.queryStats.add(conn.log)
+
+	request.add_finished_callback(release)
+	return conn
+
 reasons = '''
 
 <!--
@@ -105,6 +154,61 @@ def fix_matchdict(request):
 				request.matchdict[key] = tuple(value.encode("latin-1").decode("utf-8") for value in values)
 
 
+# Cache lifetimes (in seconds) for the various kinds of content.
+STATIC_MAX_AGE    = 60*60
+COVER_MAX_AGE     = 60*60*24
+IMMUTABLE_MAX_AGE = 60*60*24*365
+
+def makeEtag(*parts):
+	return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+def setCacheHeaders(response, etag=None, maxAge=0, immutable=False, private=False):
+	'''
+	Make `response` cacheable. The response handles If-None-Match/If-Modified-Since
+	(returning a 304), and Range requests, itself (conditional_response).
+	`maxAge` of 0 means the browser has to revalidate every time, which is
+	still just a 304 if nothing's changed.
+	Views are mostly registered with `http_cache=0`, so this also stops pyramid from
+	overriding the cache headers set here.
+	'''
+	response.conditional_response = True
+	response.accept_ranges = "bytes"
+	if etag:
+		response.etag = etag
+
+	cacheControl = ["private" if private else "public"]
+	if maxAge:
+		cacheControl.append("max-age=%s" % maxAge)
+	else:
+		cacheControl.append("no-cache")
+	if immutable:
+		cacheControl.append("immutable")
+	response.headers["Cache-Control"] = ", ".join(cacheControl)
+	response.cache_control.prevent_auto = True
+	return response
+
+def notModified(request, etag):
+	'''
+	Returns a 304 response if the client already has the content tagged `etag`,
+	so the content doesn't have to be read (or decompressed) at all. Otherwise None.
+	'''
+	if request.if_none_match and etag in request.if_none_match:
+		return Response(status_int=304)
+	return None
+
+def fileResponse(request, path, contentType=None, maxAge=0, immutable=False):
+	'''
+	FileResponse (which supports Range, and sets Last-Modified), with a ETag derived from
+	the file's path, size and mtime.
+	'''
+	stat = os.stat(path)
+	etag = makeEtag(path, stat.st_size, stat.st_mtime)
+	response = notModified(request, etag)
+	if not response:
+		response = FileResponse(path=path, request=request, content_type=contentType)
+	return setCacheHeaders(response, etag=etag, maxAge=maxAge, immutable=immutable)
+
+
 def errorPage(errorStr, moreInfo=False):
 
 	if moreInfo:
@@ -139,8 +243,6 @@ class PageResource(object):
 
 	log = logging.getLogger("Main.WebSrv")
 
-	conn = None  # Shaddup, pylint.
-
 	def __init__(self):
 		self.old_directory    = settings.webCtntPath
 		self.mvc_directory    = settings.webMvcPath
@@ -153,34 +255,52 @@ class PageResource(object):
 
 		self.openDB()
 
+		# Compile all the templates in the background, so the first hit on each page doesn't have to.
+		threading.Thread(target=self.warmTemplates, name="TemplateWarmup", daemon=True).start()
+
 		self.sessionManager = sessionManager.SessionPoolManager()
-		self.apiInterface = apiHandler.ApiInterface(self.conn)
+		self.apiInterface = apiHandler.ApiInterface()
 
 		mimetypes.init()
 
 		cherrypy.engine.subscribe("exit", self.closeDB)
 
 
+	def warmTemplates(self):
+		start = time.time()
+		compiled, failed = 0, 0
+		for directory, engine in ((self.old_directory, self.lookupEngine_base), (self.mvc_directory, self.lookupEngine_mvc)):
+			for root, dummy_dirs, files in os.walk(directory):
+				for fileN in files:
+					if not fileN.endswith(TEMPLATE_EXTENSIONS):
+						continue
+
+					# Same URI form the request handlers look templates up with, so they hit the lookup's cache.
+					relPath = os.path.join(root, fileN).replace(directory, "")
+					try:
+						engine.get_template(relPath)
+						compiled += 1
+					except Exception:
+						failed += 1
+						self.log.error("Failed to compile template '%s'", relPath)
+						for line in mako.exceptions.text_error_template().render().split("\n"):
+							self.log.error(line)
+
+		self.log.info("Template warmup compiled %s templates in %0.2f seconds (%s failed).", compiled, time.time() - start, failed)
+
 	def openDB(self):
 		self.log.info("WSGI Server Opening DB...")
 		self.log.info("DB Path = %s", self.dbPath)
 
-		# Local sockets are MUCH faster if the DB is on the same machine as the server
-		# Try a local connection. fall back to IP socket only if local connection fails.
-		try:
-			self.conn = psycopg2.connect(dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
-		except psycopg2.OperationalError:
-			self.conn = psycopg2.connect(host=settings.DATABASE_IP, dbname=settings.DATABASE_DB_NAME, user=settings.DATABASE_USER,password=settings.DATABASE_PASS)
+		# The server handles many concurrent requests, so it gets a larger pool then
+		# a single scraper process. Each request checks out it's own connection (`request.dbConn`).
+		dbPool.pool.configure(WEB_POOL_SIZE)
 
 		sm.checkStatusTableExists()
 
 	def closeDB(self):
 		self.log.info("Closing DB...",)
-		try:
-			self.conn.close()
-		except:
-			self.log.error("wat")
-			self.log.error(traceback.format_exc())
+		dbPool.pool.checkLeaks()
 		self.log.info("done")
 
 
@@ -194,16 +314,12 @@ class PageResource(object):
 			return "application/unknown"
 
 
-	def getRawContent(self, reqPath, context):
+	def getRawContent(self, request, reqPath, context):
 		print("Raw content request!", reqPath, context)
 
 		self.log.info("Request for raw content at URL %s", reqPath)
 
-		with open(reqPath, "rb") as fp:
-			ret = Response(body=fp.read())
-			ret.content_type = self.guessItemMimeType(reqPath)
-
-			return ret
+		return fileResponse(request, reqPath, contentType=self.guessItemMimeType(reqPath), maxAge=STATIC_MAX_AGE)
 
 	def getPage(self, request):
 
@@ -235,7 +351,7 @@ class PageResource(object):
 
 
 		self.log.info("Request for MVC-based mako page %s", reqPath)
-		pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn)
+		pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn)
 		self.log.info("Mako page Rendered %s", reqPath)
 
 		return Response(body=pageContent)
@@ -319,7 +435,7 @@ class PageResource(object):
 				pgTemplate = engine.get_template(relPath)
 
 				self.log.info("Request for mako page %s", reqPath)
-				pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn)
+				pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn)
 				self.log.info("Mako page Rendered %s", reqPath)
 
 				if reqPath.endswith(".css"):
@@ -328,18 +444,18 @@ class PageResource(object):
 					return Response(body=pageContent)
 
 			else:
-				return self.getRawContent(reqPath, self.static_directory)
+				return self.getRawContent(request, reqPath, self.static_directory)
 
 		except mako.exceptions.TopLevelLookupException:
 			self.log.error("404 Request for page at url: %s", reqPath)
 			pgTemplate = engine.get_template("error.mako")
-			pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn, tracebackStr=traceback.format_exc(), error_str="NO PAGE! 404")
+			pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn, tracebackStr=traceback.format_exc(), error_str="NO PAGE! 404")
 			return Response(body=pageContent)
 		except:
 			self.log.error("Page rendering error! url: %s", reqPath)
 			self.log.error(traceback.format_exc())
 			pgTemplate = engine.get_template("error.mako")
-			pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn, tracebackStr=traceback.format_exc(), error_str="EXCEPTION! WAT?")
+			pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn, tracebackStr=traceback.format_exc(), error_str="EXCEPTION! WAT?")
 			return Response(body=pageContent)
 
 
@@ -392,7 +508,7 @@ class PageResource(object):
 			return errorPage("That's not a integer ID!", moreInfo='Are you trying something bad?')
 
 
-		cur = self.conn.cursor()
+		cur = request.dbConn.cursor()
 		cur.execute("BEGIN")
 		cur.execute("""SELECT
 					filename, relPath
@@ -411,12 +527,27 @@ class PageResource(object):
 			self.log.error("Request for cover with ID '%s' failed because the file is missing!", seqId)
 			return errorPage("Cover found, but the file is missing!")
 
-		print(coverPath, os.path.exists(coverPath))
-		ftype, dummy_coding = mimetypes.guess_type(fileName)
+		if renditionCache.parseSize(request.params.get("size")):
+			stat = os.stat(coverPath)
+			etag = makeEtag(coverPath, stat.st_size, stat.st_mtime, request.params.get("size"), renditionCache.acceptsWebp(request))
+			response = notModified(request, etag)
+			if response:
+				response.vary = ("Accept", )
+				return setCacheHeaders(response, etag=etag, maxAge=COVER_MAX_AGE)
+
+			def readCover():
+				with open(coverPath, "rb") as fp:
+					return fp.read()
+
+			rendition = self.getRendition(request, readCover)
+			if rendition:
+				body, ctype = rendition
+				response = Response(body=body, content_type=ctype)
+				response.vary = ("Accept", )
+				return setCacheHeaders(response, etag=etag, maxAge=COVER_MAX_AGE)
 
-		if ftype:
-			return FileResponse(path=coverPath, content_type=ftype)
-		return FileResponse(path=coverPath)
+		ftype, dummy_coding = mimetypes.guess_type(fileName)
+		return fileResponse(request, coverPath, contentType=ftype, maxAge=COVER_MAX_AGE)
 
 	# New reader!
 
@@ -439,7 +570,7 @@ class PageResource(object):
 		pgTemplate = self.lookupEngine_base.get_template('reader2/render.mako')
 
 		self.log.info("Request for mako page %s", 'reader2/render.mako')
-		pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn, sessionArchTool=session)
+		pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn, sessionArchTool=session)
 		self.log.info("Mako page Rendered %s", 'reader2/render.mako')
 		return Response(body=pageContent)
 
@@ -460,7 +591,7 @@ class PageResource(object):
 		pgTemplate = self.lookupEngine_base.get_template('reader2/renderPron.mako')
 
 		self.log.info("Request for mako page %s", 'reader2/renderPron.mako')
-		pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn, sessionArchTool=session)
+		pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn, sessionArchTool=session)
 		self.log.info("Mako page Rendered %s", 'reader2/renderPron.mako')
 		return Response(body=pageContent)
 
@@ -479,12 +610,38 @@ class PageResource(object):
 			return redir
 
 		seqId = int(request.matchdict["sequenceid"])
-		itemFileHandle, itemPath = session.getItemByKey(seqId)
+
+		# The same URL serves whichever archive the session has open, so the browser has to revalidate.
+		# The ETag is derived from the archive (path, size, mtime) and the page within it, so
+		# unchanged pages are a 304 without touching the archive.
+		archKey, itemPath = session.getItemInfo(seqId)
+		etag = makeEtag(archKey, itemPath, request.params.get("size"), renditionCache.acceptsWebp(request))
+		response = notModified(request, etag)
+		if response:
+			response.vary = ("Accept", "Cookie")
+			return setCacheHeaders(response, etag=etag, private=True)
+
+		itemFileHandle, itemPath = session.getItemByKey(seqId, archKey=archKey)
 		response = request.response
-		response.app_iter = FileIter(itemFileHandle)
-		response.content_type = self.guessItemMimeType(itemPath)
+		response.vary = ("Accept", "Cookie")
+
+		rendition = self.getRendition(request, itemFileHandle.read)
+		if rendition:
+			response.body, response.content_type = rendition
+		else:
+			response.body = itemFileHandle.getvalue()
+			response.content_type = self.guessItemMimeType(itemPath)
 
-		return response
+		return setCacheHeaders(response, etag=etag, private=True)
+
+	# If the request asks for a downscaled version (`?size=small`, etc...), return
+	# (body, content_type) for it. `readContent` is a callable returning the original image.
+	# Returns None if the original should be served.
+	def getRendition(self, request, readContent):
+		width = renditionCache.parseSize(request.params.get("size"))
+		if not width:
+			return None
+		return renditionCache.renditions.getRendition(readContent(), width, webp=renditionCache.acceptsWebp(request))
 
 
 
@@ -503,8 +660,7 @@ class PageResource(object):
 			if 'url' in request.params:
 				itemUrl = urllib.parse.unquote(request.params["url"])
 				print("ItemURL: ", itemUrl)
-				# self.conn
-				cur = self.conn.cursor()
+				cur = request.dbConn.cursor()
 				cur.execute('BEGIN')
 				cur.execute("SELECT mimetype, fsPath, url, distance, dbid FROM {tableName} WHERE url=%s;".format(tableName=table), (itemUrl, ))
 
@@ -534,10 +690,9 @@ class PageResource(object):
 			elif 'mdsum' in request.params:
 				itemHash = urllib.parse.unquote(request.params["mdsum"])
 				print("ItemHash: ", itemHash)
-				# self.conn
-				cur = self.conn.cursor()
+				cur = request.dbConn.cursor()
 				cur.execute('BEGIN')
-				cur.execute("SELECT mimetype, fsPath, url FROM {tableName} WHERE fhash=%s;".format(tableName=table), (itemHash, ))
+				cur.execute("SELECT mimetype, fsPath, url, distance, dbid FROM {tableName} WHERE fhash=%s;".format(tableName=table), (itemHash, ))
 
 				ret = cur.fetchall()
 				print(ret)
@@ -569,7 +724,7 @@ class PageResource(object):
 
 
 				pgTemplate = self.lookupEngine_base.get_template('books/access_error.mako')
-				pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn, extradat=requestData)
+				pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn, extradat=requestData)
 				pageContent += reasons
 				return Response(status_int=404, body=pageContent)
 
@@ -580,13 +735,17 @@ class PageResource(object):
 
 					return Response(status_int=404, body='File is missing! Has it not been fetched yet?')
 				self.log.info("Request for book resource content '%s'", request.params)
-				return FileResponse(path=fsPath, content_type=mimetype)
+
+				# Resources requested by hash can never change.
+				if 'mdsum' in request.params:
+					return fileResponse(request, fsPath, contentType=mimetype, maxAge=IMMUTABLE_MAX_AGE, immutable=True)
+				return fileResponse(request, fsPath, contentType=mimetype)
 
 
 
 		pgTemplate = self.lookupEngine_base.get_template('books/render.mako')
 		self.log.info("Rendering mako page %s", 'books/render.mako')
-		pageContent = pgTemplate.render_unicode(request=request, sqlCon=self.conn)
+		pageContent = pgTemplate.render_unicode(request=request, sqlCon=request.dbConn)
 		self.log.info("Mako page Rendered %s", 'books/render.mako')
 		return Response(body=pageContent)
 
@@ -607,6 +766,8 @@ def buildApp():
 	# config.include('pyramid_debugtoolbar')
 
 
+	config.add_request_method(getRequestConn, 'dbConn', reify=True)
+
 	config.set_authentication_policy(authn_policy)
 	config.set_authorization_policy(authz_policy)
 